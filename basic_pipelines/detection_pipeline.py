@@ -15,12 +15,16 @@ from hailo_rpi_common import (
     SOURCE_PIPELINE,
     INFERENCE_PIPELINE,
     INFERENCE_PIPELINE_WRAPPER,
+    NULL_INFERENCE_PIPELINE,
+    ROUND_ROBIN_PIPELINE,
+    STREAM_ROUTER_PIPELINE,
     USER_CALLBACK_PIPELINE,
     DISPLAY_PIPELINE,
     GStreamerApp,
     app_callback_class,
     dummy_callback,
     detect_hailo_arch,
+    get_queue_profile,
 )
 
 
@@ -31,7 +35,7 @@ from hailo_rpi_common import (
 
 # This class inherits from the hailo_rpi_common.GStreamerApp class
 class GStreamerDetectionApp(GStreamerApp):
-    def __init__(self, app_callback, user_data):
+    def __init__(self, app_callback, user_data, user_data_factory=None):
         parser = get_default_parser()
         parser.add_argument(
             "--labels-json",
@@ -40,7 +44,7 @@ class GStreamerDetectionApp(GStreamerApp):
         )
         args = parser.parse_known_args()[0]
         # Call the parent class constructor
-        super().__init__(args, user_data)
+        super().__init__(args, user_data, user_data_factory)
         # Additional initialization code can be added here
         # Set Hailo parameters these parameters should be set based on the model used
         self.batch_size = 2
@@ -52,7 +56,9 @@ class GStreamerDetectionApp(GStreamerApp):
 
 
         # Determine the architecture if not specified
-        if args.arch is None:
+        if args.null_inference:
+            self.arch = args.arch
+        elif args.arch is None:
             detected_arch = detect_hailo_arch()
             if detected_arch is None:
                 raise ValueError("Could not auto-detect Hailo architecture. Please specify --arch manually.")
@@ -90,21 +96,43 @@ class GStreamerDetectionApp(GStreamerApp):
         self.create_pipeline()
 
     def get_pipeline_string(self):
-        source_pipeline = SOURCE_PIPELINE(self.video_source)
-        detection_pipeline = INFERENCE_PIPELINE(
-            hef_path=self.hef_path,
-            post_process_so=self.post_process_so,
-            batch_size=self.batch_size,
-            config_json=self.labels_json,
-            additional_params=self.thresholds_str)
-        user_callback_pipeline = USER_CALLBACK_PIPELINE()
-        display_pipeline = DISPLAY_PIPELINE(video_sink=self.video_sink, sync=self.sync, show_fps=self.show_fps)
-        pipeline_string = (
-            f'{source_pipeline} '
-            f'{detection_pipeline} ! '
-            f'{user_callback_pipeline} ! '
-            f'{display_pipeline}'
-        )
+        # The source scales and converts straight to the network input, so inference needs no second pass
+        self.source_format = self.network_format
+        source_pipelines = [
+            SOURCE_PIPELINE(
+                video_source, video_format=self.source_format, video_width=self.network_width,
+                video_height=self.network_height, inference_fps=self.inference_fps, scale=True,
+                name=self.stream_element_name(self.source_name, stream_id),
+                file_decoder=self.get_file_decoder(video_source))
+            for stream_id, video_source in enumerate(self.video_sources)]
+        if self.options_menu.null_inference:
+            detection_pipeline = NULL_INFERENCE_PIPELINE(max_size_buffers=get_queue_profile()['max_size_buffers'])
+        else:
+            detection_pipeline = INFERENCE_PIPELINE(
+                hef_path=self.hef_path,
+                post_process_so=self.post_process_so,
+                batch_size=self.batch_size,
+                config_json=self.labels_json,
+                additional_params=self.thresholds_str,
+                convert=False)
+        stream_pipelines = [
+            f'{USER_CALLBACK_PIPELINE(name=self.stream_element_name("identity_callback", stream_id))} ! '
+            f'{DISPLAY_PIPELINE(video_sink=self.video_sink, sync=self.sync, show_fps=self.show_fps, name=self.stream_element_name("hailo_display", stream_id), headless=self.headless)}'
+            for stream_id in range(len(self.video_sources))]
+
+        if len(self.video_sources) == 1:
+            pipeline_string = (
+                f'{source_pipelines[0]} '
+                f'{detection_pipeline} ! '
+                f'{stream_pipelines[0]}'
+            )
+        else:
+            # All inputs share one inference; the detections are routed back to each input's callback and display
+            pipeline_string = (
+                f'{ROUND_ROBIN_PIPELINE(source_pipelines)} ! '
+                f'{detection_pipeline} ! '
+                f'{STREAM_ROUTER_PIPELINE(stream_pipelines)}'
+            )
         print(pipeline_string)
         return pipeline_string
 
@@ -0,0 +1,310 @@
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+import contextlib
+import threading
+import cv2
+import numpy as np
+
+# ---------------------------------------------------------
+# Functions used to get numpy arrays from GStreamer buffers
+# ---------------------------------------------------------
+
+def handle_rgb(map_info, width, height, copy=True, out=None):
+    frame = np.ndarray(shape=(height, width, 3), dtype=np.uint8, buffer=map_info.data)
+    if out is not None:
+        np.copyto(out, frame)
+        return out
+    if copy:
+        # The copy() method is used to create a copy of the numpy array. This is necessary because the original numpy array is created from buffer data, and it does not own the data it represents. Instead, it's just a view of the buffer's data.
+        return frame.copy()
+    frame.flags.writeable = False
+    return frame
+
+def handle_nv12(map_info, width, height, copy=True, out=None):
+    y_plane_size = width * height
+    y_plane = np.ndarray(shape=(height, width), dtype=np.uint8, buffer=map_info.data[:y_plane_size])
+    uv_plane = np.ndarray(shape=(height//2, width//2, 2), dtype=np.uint8, buffer=map_info.data[y_plane_size:])
+    if out is not None:
+        np.copyto(out[0], y_plane)
+        np.copyto(out[1], uv_plane)
+        return out
+    if copy:
+        return y_plane.copy(), uv_plane.copy()
+    y_plane.flags.writeable = False
+    uv_plane.flags.writeable = False
+    return y_plane, uv_plane
+
+def handle_yuyv(map_info, width, height, copy=True, out=None):
+    frame = np.ndarray(shape=(height, width, 2), dtype=np.uint8, buffer=map_info.data)
+    if out is not None:
+        np.copyto(out, frame)
+        return out
+    if copy:
+        return frame.copy()
+    frame.flags.writeable = False
+    return frame
+
+def handle_i420(map_info, width, height, copy=True, out=None):
+    y_plane_size = width * height
+    chroma_plane_size = y_plane_size // 4
+    y_plane = np.ndarray(shape=(height, width), dtype=np.uint8, buffer=map_info.data[:y_plane_size])
+    u_plane = np.ndarray(shape=(height//2, width//2), dtype=np.uint8,
+                         buffer=map_info.data[y_plane_size:y_plane_size + chroma_plane_size])
+    v_plane = np.ndarray(shape=(height//2, width//2), dtype=np.uint8,
+                         buffer=map_info.data[y_plane_size + chroma_plane_size:y_plane_size + 2 * chroma_plane_size])
+    planes = (y_plane, u_plane, v_plane)
+    if out is not None:
+        for dst, plane in zip(out, planes):
+            np.copyto(dst, plane)
+        return out
+    if copy:
+        return tuple(plane.copy() for plane in planes)
+    for plane in planes:
+        plane.flags.writeable = False
+    return planes
+
+FORMAT_HANDLERS = {
+    'RGB': handle_rgb,
+    'BGR': handle_rgb,
+    'NV12': handle_nv12,
+    'YUYV': handle_yuyv,
+    'YUY2': handle_yuyv,
+    'I420': handle_i420,
+}
+
+# Destination array shapes for each format, used to preallocate frames for the handlers above
+FORMAT_SHAPES = {
+    'RGB': lambda width, height: (height, width, 3),
+    'BGR': lambda width, height: (height, width, 3),
+    'NV12': lambda width, height: ((height, width), (height//2, width//2, 2)),
+    'YUYV': lambda width, height: (height, width, 2),
+    'YUY2': lambda width, height: (height, width, 2),
+    'I420': lambda width, height: ((height, width), (height//2, width//2), (height//2, width//2)),
+}
+
+def allocate_frame(format, width, height):
+    """
+    Allocates an uninitialized destination frame matching what the format handler returns.
+
+    Returns:
+        np.ndarray: A numpy array, or a tuple of arrays for planar formats.
+    """
+    shape = FORMAT_SHAPES.get(format)
+    if shape is None:
+        raise ValueError(f"Unsupported format: {format}")
+    shape = shape(width, height)
+    if isinstance(shape[0], tuple):
+        return tuple(np.empty(plane_shape, dtype=np.uint8) for plane_shape in shape)
+    return np.empty(shape, dtype=np.uint8)
+
+class FrameBufferPool:
+    """
+    A pool of preallocated frame arrays keyed by (format, width, height).
+
+    Frames extracted with get_numpy_from_buffer(..., pool=pool) are filled in place into recycled arrays
+    instead of allocating a new array per buffer. Two reuse styles are supported:
+    - Explicit release (default): acquire() hands out a free array and release() returns it to the pool.
+      At most max_free arrays per key are kept for reuse; further releases are left to the garbage collector.
+    - Ring reuse (ring_size=N): acquire() cycles through N arrays per key and release() is not needed.
+      A frame is overwritten N acquisitions later, so it must not be held longer than that.
+
+    The hits, misses and peak_size counters show how well the pool is sized; see stats().
+    """
+    def __init__(self, max_free=4, ring_size=None):
+        self.max_free = max_free
+        self.ring_size = ring_size
+        self._free = {}
+        self._rings = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self.peak_size = 0
+
+    def acquire(self, format, width, height):
+        """
+        Returns a destination frame for the given format and size, reusing a pooled array when available.
+        """
+        key = (format, width, height)
+        with self._lock:
+            if self.ring_size is not None:
+                return self._acquire_ring(key)
+            free = self._free.get(key)
+            if free:
+                self.hits += 1
+                frame = free.pop()
+            else:
+                self.misses += 1
+                frame = self._allocate(key)
+            self._keys[id(frame)] = key
+            return frame
+
+    def _acquire_ring(self, key):
+        ring = self._rings.setdefault(key, [[], 0])
+        frames, index = ring
+        if len(frames) < self.ring_size:
+            self.misses += 1
+            frame = self._allocate(key)
+            frames.append(frame)
+        else:
+            self.hits += 1
+            frame = frames[index]
+        ring[1] = (index + 1) % self.ring_size
+        return frame
+
+    def _allocate(self, key):
+        self.size += 1
+        self.peak_size = max(self.peak_size, self.size)
+        return allocate_frame(*key)
+
+    def release(self, frame):
+        """
+        Returns a frame obtained from acquire() to the pool. Does nothing in ring mode.
+        """
+        if self.ring_size is not None:
+            return
+        with self._lock:
+            key = self._keys.pop(id(frame), None)
+            if key is None:
+                raise ValueError("Frame was not acquired from this pool")
+            free = self._free.setdefault(key, [])
+            if len(free) < self.max_free:
+                free.append(frame)
+            else:
+                self.size -= 1
+
+    def stats(self):
+        """
+        Returns the pool counters as a dictionary.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': self.size,
+                'peak_size': self.peak_size,
+            }
+
+@contextlib.contextmanager
+def mapped_frame(buffer, format, width, height, copy=False, out=None):
+    """
+    Maps a GstBuffer and yields its frame data as numpy array(s) for the duration of the with block.
+
+    By default the yielded arrays are read-only views of the mapped memory, so no per-frame allocation
+    or memcpy is done. The views are only valid inside the with block; the buffer is unmapped on exit.
+    Pass copy=True (or call .copy() on the view) to keep the frame after the block ends.
+
+    Example:
+        with mapped_frame(buffer, format, width, height) as frame:
+            mean_brightness = frame.mean()
+
+    Args:
+        buffer (GstBuffer): The GStreamer Buffer to map.
+        format (str): The video format ('RGB', 'NV12', 'YUYV', etc.).
+        width (int): The width of the video frame.
+        height (int): The height of the video frame.
+        copy (bool, optional): Whether to yield owned copies instead of views. Defaults to False.
+        out (np.ndarray, optional): A preallocated destination (see allocate_frame) to copy the frame into. Defaults to None.
+
+    Yields:
+        np.ndarray: A numpy array representing the buffer's data, or a tuple of arrays for certain formats.
+    """
+    handler = FORMAT_HANDLERS.get(format)
+    if handler is None:
+        raise ValueError(f"Unsupported format: {format}")
+
+    # Map the buffer to access data
+    success, map_info = buffer.map(Gst.MapFlags.READ)
+    if not success:
+        raise ValueError("Buffer mapping failed")
+
+    try:
+        yield handler(map_info, width, height, copy=copy, out=out)
+    finally:
+        buffer.unmap(map_info)
+
+def get_numpy_from_buffer(buffer, format, width, height, pool=None):
+    """
+    Converts a GstBuffer to a numpy array based on provided format, width, and height.
+    The returned array is a copy that owns its data; use mapped_frame() to read the frame without copying.
+
+    Args:
+        buffer (GstBuffer): The GStreamer Buffer to convert.
+        format (str): The video format ('RGB', 'NV12', 'YUYV', etc.).
+        width (int): The width of the video frame.
+        height (int): The height of the video frame.
+        pool (FrameBufferPool, optional): If given, the frame is copied into a recycled array from the pool
+            instead of a newly allocated one. Defaults to None.
+
+    Returns:
+        np.ndarray: A numpy array representing the buffer's data, or a tuple of arrays for certain formats.
+    """
+    out = pool.acquire(format, width, height) if pool is not None else None
+    with mapped_frame(buffer, format, width, height, copy=True, out=out) as frame:
+        return frame
+
+# OpenCV color conversion codes from a buffer format to an output format
+COLOR_CONVERSIONS = {
+    ('RGB', 'BGR'): cv2.COLOR_RGB2BGR,
+    ('BGR', 'RGB'): cv2.COLOR_BGR2RGB,
+    ('NV12', 'BGR'): cv2.COLOR_YUV2BGR_NV12,
+    ('NV12', 'RGB'): cv2.COLOR_YUV2RGB_NV12,
+    ('I420', 'BGR'): cv2.COLOR_YUV2BGR_I420,
+    ('I420', 'RGB'): cv2.COLOR_YUV2RGB_I420,
+    ('YUYV', 'BGR'): cv2.COLOR_YUV2BGR_YUYV,
+    ('YUYV', 'RGB'): cv2.COLOR_YUV2RGB_YUYV,
+    ('YUY2', 'BGR'): cv2.COLOR_YUV2BGR_YUYV,
+    ('YUY2', 'RGB'): cv2.COLOR_YUV2RGB_YUYV,
+}
+
+# Shape of the whole mapped buffer as a single array, as cv2.cvtColor expects it for each format.
+# The planar YUV formats are viewed as one (height * 3/2, width) array holding all the planes.
+CONVERSION_INPUT_SHAPES = {
+    'RGB': lambda width, height: (height, width, 3),
+    'BGR': lambda width, height: (height, width, 3),
+    'NV12': lambda width, height: (height * 3 // 2, width),
+    'I420': lambda width, height: (height * 3 // 2, width),
+    'YUYV': lambda width, height: (height, width, 2),
+    'YUY2': lambda width, height: (height, width, 2),
+}
+
+def get_converted_frame_from_buffer(buffer, format, width, height, output_format='BGR', pool=None):
+    """
+    Converts a GstBuffer to a numpy array in a different color format in a single pass.
+
+    The color conversion reads directly from the mapped buffer and writes into the returned array,
+    so there is no intermediate copy as with get_numpy_from_buffer() followed by cv2.cvtColor().
+    This is the cheapest way to get a BGR frame for cv2.VideoWriter or cv2.imwrite.
+    YUV buffers (NV12, I420, YUYV/YUY2) are converted from all their planes at once, without copying the planes out first.
+
+    Args:
+        buffer (GstBuffer): The GStreamer Buffer to convert.
+        format (str): The video format of the buffer ('RGB', 'BGR', 'NV12', 'I420', 'YUYV', 'YUY2').
+        width (int): The width of the video frame.
+        height (int): The height of the video frame.
+        output_format (str, optional): The format of the returned frame. Defaults to 'BGR'.
+        pool (FrameBufferPool, optional): If given, the frame is written into a recycled array from the pool. Defaults to None.
+
+    Returns:
+        np.ndarray: A numpy array holding the frame in output_format.
+    """
+    if format == output_format:
+        return get_numpy_from_buffer(buffer, format, width, height, pool=pool)
+
+    code = COLOR_CONVERSIONS.get((format, output_format))
+    if code is None:
+        raise ValueError(f"Unsupported conversion: {format} to {output_format}")
+
+    # Map the buffer to access data
+    success, map_info = buffer.map(Gst.MapFlags.READ)
+    if not success:
+        raise ValueError("Buffer mapping failed")
+
+    try:
+        frame = np.ndarray(shape=CONVERSION_INPUT_SHAPES[format](width, height), dtype=np.uint8, buffer=map_info.data)
+        out = pool.acquire(output_format, width, height) if pool is not None else None
+        return cv2.cvtColor(frame, code, dst=out)
+    finally:
+        buffer.unmap(map_info)
@@ -1,9 +1,12 @@
 import sys
 import gi
 gi.require_version('Gst', '1.0')
-from gi.repository import Gst, GLib, GObject
+gi.require_version('GstBase', '1.0')
+gi.require_version('GstPbutils', '1.0')
+from gi.repository import Gst, GLib, GObject, GstBase, GstPbutils
 import os
 import argparse
+import copy
 import multiprocessing
 import numpy as np
 import setproctitle
@@ -11,6 +14,23 @@ import cv2
 import time
 import signal
 import subprocess
+from pipeline_profiling import CallbackProfiler, PipelineBenchmark, PipelineLatencyTracer, QueueMonitor
+from frame_buffers import (
+    COLOR_CONVERSIONS,
+    CONVERSION_INPUT_SHAPES,
+    FORMAT_HANDLERS,
+    FORMAT_SHAPES,
+    FrameBufferPool,
+    allocate_frame,
+    get_converted_frame_from_buffer,
+    get_numpy_from_buffer,
+    handle_i420,
+    handle_nv12,
+    handle_rgb,
+    handle_yuyv,
+    mapped_frame,
+)
+from null_inference import NULL_INFERENCE_PIPELINE, NullDetectionInjector
 
 # Try to import hailo python module
 try:
@@ -18,21 +38,141 @@ try:
 except ImportError:
     sys.exit("Failed to import hailo python module. Make sure you are in hailo virtual environment.")
 
+# -----------------------------------------------------------------------------------------------
+# Shared-memory frame transport
+# -----------------------------------------------------------------------------------------------
+# Default slot size fits a 1080p RGB frame
+DEFAULT_FRAME_SLOT_BYTES = 1920 * 1080 * 3
+
+class SharedFrameRing:
+    """
+    A ring of fixed-size frame slots in shared memory, used to pass frames to another process without pickling.
+
+    The slots, their headers (sequence number and shape) and the counters live in multiprocessing shared
+    memory, so the ring is inherited by processes started after it is created. put() copies the frame
+    straight into the next free slot and get() copies the oldest pending frame out of its slot.
+
+    When all slots are pending, put() drops the new frame by default. With latest_only=True the oldest
+    pending frame is overwritten instead, so the reader always sees the newest frames.
+    get() can block until a frame arrives, and can coalesce to the newest pending frame.
+    Only uint8 frames of up to slot_bytes bytes and 3 dimensions are supported.
+    """
+    HEADER_FIELDS = 5  # sequence number, ndim, shape[0], shape[1], shape[2]
+    WRITE_SEQ, READ_SEQ, DROPPED, COALESCED = range(4)
+
+    def __init__(self, num_slots=3, slot_bytes=DEFAULT_FRAME_SLOT_BYTES, latest_only=False):
+        self.num_slots = num_slots
+        self.slot_bytes = slot_bytes
+        self.latest_only = latest_only
+        self._data = multiprocessing.RawArray('B', num_slots * slot_bytes)
+        self._headers = multiprocessing.RawArray('q', num_slots * self.HEADER_FIELDS)
+        self._counters = multiprocessing.RawArray('q', 4)
+        self._lock = multiprocessing.Lock()
+        self._available = multiprocessing.Condition(self._lock)
+
+    def _slot(self, seq, shape=None):
+        index = seq % self.num_slots
+        header = index * self.HEADER_FIELDS
+        if shape is not None:
+            self._headers[header] = seq
+            self._headers[header + 1] = len(shape)
+            self._headers[header + 2:header + 2 + len(shape)] = list(shape)
+        else:
+            ndim = self._headers[header + 1]
+            shape = tuple(self._headers[header + 2:header + 2 + ndim])
+        size = int(np.prod(shape))
+        view = np.frombuffer(self._data, dtype=np.uint8, count=size, offset=index * self.slot_bytes)
+        return view.reshape(shape)
+
+    def put(self, frame):
+        """
+        Copies a frame into the next slot.
+
+        Returns:
+            bool: True if the frame was written, False if it was dropped because the ring was full.
+        """
+        if frame.dtype != np.uint8 or frame.ndim > 3:
+            raise ValueError(f"Unsupported frame: dtype {frame.dtype}, {frame.ndim} dimensions")
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of {frame.nbytes} bytes does not fit in a {self.slot_bytes} byte slot")
+
+        with self._lock:
+            counters = self._counters
+            if counters[self.WRITE_SEQ] - counters[self.READ_SEQ] >= self.num_slots:
+                counters[self.DROPPED] += 1
+                if not self.latest_only:
+                    return False
+                counters[self.READ_SEQ] += 1
+            seq = counters[self.WRITE_SEQ]
+            np.copyto(self._slot(seq, frame.shape), frame)
+            counters[self.WRITE_SEQ] = seq + 1
+            self._available.notify_all()
+        return True
+
+    def get(self, timeout=0, latest=False):
+        """
+        Returns a copy of the oldest pending frame, or None if no frame arrives in time.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a frame. 0 returns immediately, None waits forever. Defaults to 0.
+            latest (bool, optional): Return the newest pending frame and skip the older ones.
+                Skipped frames are counted as coalesced. Defaults to False.
+        """
+        counters = self._counters
+        with self._available:
+            if not self._available.wait_for(lambda: counters[self.READ_SEQ] < counters[self.WRITE_SEQ], timeout):
+                return None
+            seq = counters[self.READ_SEQ]
+            if latest:
+                newest = counters[self.WRITE_SEQ] - 1
+                counters[self.COALESCED] += newest - seq
+                seq = newest
+            frame = self._slot(seq).copy()
+            counters[self.READ_SEQ] = seq + 1
+        return frame
+
+    @property
+    def dropped(self):
+        return self._counters[self.DROPPED]
+
+    def stats(self):
+        """
+        Returns the ring counters as a dictionary.
+        """
+        with self._lock:
+            counters = self._counters
+            return {
+                'written': counters[self.WRITE_SEQ],
+                'read': counters[self.READ_SEQ],
+                'pending': counters[self.WRITE_SEQ] - counters[self.READ_SEQ],
+                'dropped': counters[self.DROPPED],
+                'coalesced': counters[self.COALESCED],
+            }
+
 # -----------------------------------------------------------------------------------------------
 # User-defined class to be used in the callback function
 # -----------------------------------------------------------------------------------------------
 # A sample class to be used in the callback function
 # This example allows to:
 # 1. Count the number of frames
-# 2. Setup a multiprocessing queue to pass the frame to the main thread
+# 2. Setup a shared-memory frame ring to pass the frame to the display process
 # Additional variables and functions can be added to this class as needed
 
 class app_callback_class:
     def __init__(self):
         self.frame_count = 0
         self.use_frame = False
-        self.frame_queue = multiprocessing.Queue(maxsize=3)
+        # Frame ring settings, used when the app enables frame display (--use-frame)
+        self.frame_slots = 3
+        self.frame_slot_bytes = DEFAULT_FRAME_SLOT_BYTES
+        self.latest_frame_only = False
+        self.frame_ring = None
+        self.display_stop_event = None
         self.running = True
+        # Frame rate the pipeline delivers to the callback, None when it runs at the source rate (--inference-fps)
+        self.inference_fps = None
+        # Index of the input this instance gets the frames of, when the app runs several inputs
+        self.stream_id = 0
 
     def increment(self):
         self.frame_count += 1
@@ -40,15 +180,20 @@ class app_callback_class:
     def get_count(self):
         return self.frame_count
 
+    def create_frame_ring(self):
+        # Must be called before the display process is started so the ring is shared with it
+        if self.frame_ring is None:
+            self.frame_ring = SharedFrameRing(self.frame_slots, self.frame_slot_bytes, self.latest_frame_only)
+            self.display_stop_event = multiprocessing.Event()
+
     def set_frame(self, frame):
-        if not self.frame_queue.full():
-            self.frame_queue.put(frame)
+        if self.frame_ring is not None:
+            self.frame_ring.put(frame)
 
     def get_frame(self):
-        if not self.frame_queue.empty():
-            return self.frame_queue.get()
-        else:
-            return None
+        if self.frame_ring is not None:
+            return self.frame_ring.get()
+        return None
 
 def dummy_callback(pad, info, user_data):
     """
@@ -106,26 +251,93 @@ def get_caps_from_pad(pad: Gst.Pad):
         return None, None, None
 
 # This function is used to display the user data frame
-def display_user_data_frame(user_data: app_callback_class):
-    while user_data.running:
-        frame = user_data.get_frame()
+def display_user_data_frame(user_data: app_callback_class, max_fps=None, timeout=0.1):
+    """
+    Shows the frames passed with user_data.set_frame() until user_data.display_stop_event is set.
+    Runs in its own process.
+
+    The loop blocks on the frame ring instead of polling, always shows the newest pending frame and
+    skips the older ones. With max_fps set, frames arriving faster than that are coalesced as well.
+    A summary with frames shown/dropped and the CPU used by the display process is printed on exit.
+
+    Args:
+        user_data (app_callback_class): The user data holding the frame ring.
+        max_fps (float, optional): Maximum display frame rate. Defaults to None (uncapped).
+        timeout (float, optional): Seconds to wait for a frame before pumping the window events again. Defaults to 0.1.
+    """
+    # Ctrl-C reaches the whole process group; the main process stops us through display_stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ring = user_data.frame_ring
+    min_interval = 1.0 / max_fps if max_fps else 0
+    frames_shown = 0
+    next_frame_time = time.monotonic()
+    start_wall = time.monotonic()
+    start_cpu = time.process_time()
+    while not user_data.display_stop_event.is_set():
+        if min_interval:
+            delay = next_frame_time - time.monotonic()
+            if delay > 0:
+                cv2.waitKey(max(1, int(delay * 1000)))
+                continue
+        frame = ring.get(timeout=timeout, latest=True)
         if frame is not None:
             cv2.imshow("User Frame", frame)
+            frames_shown += 1
+            next_frame_time = time.monotonic() + min_interval
         cv2.waitKey(1)
     cv2.destroyAllWindows()
 
+    wall_time = time.monotonic() - start_wall
+    cpu_time = time.process_time() - start_cpu
+    stats = ring.stats()
+    cpu_percent = 100 * cpu_time / wall_time if wall_time > 0 else 0
+    print(f"Display: {frames_shown} frames shown, {stats['coalesced']} skipped by the display, "
+          f"{stats['dropped']} dropped by the ring, CPU {cpu_percent:.1f}% ({cpu_time:.2f}s over {wall_time:.1f}s)")
+
+class InputAction(argparse.Action):
+    """
+    Collects repeated --input options. args.input keeps the first source, args.inputs lists all of them.
+    """
+    def __call__(self, parser, namespace, values, option_string=None):
+        inputs = list(getattr(namespace, 'inputs', None) or [])
+        inputs.append(values)
+        namespace.inputs = inputs
+        if len(inputs) == 1:
+            setattr(namespace, self.dest, values)
+
 def get_default_parser():
     parser = argparse.ArgumentParser(description="Hailo App Help")
     current_path = os.path.dirname(os.path.abspath(__file__))
     default_video_source = os.path.join(current_path, '../resources/detection0.mp4')
     parser.add_argument(
-        "--input", "-i", type=str, default=default_video_source,
+        "--input", "-i", type=str, default=default_video_source, action=InputAction,
         help="Input source. Can be a file, USB or RPi camera (CSI camera module). \
         For RPi camera use '-i rpi' (Still in Beta). \
+        Repeat the option to run several inputs through one shared inference. \
         Defaults to example video resources/detection0.mp4"
     )
+    parser.set_defaults(inputs=None)
     parser.add_argument("--use-frame", "-u", action="store_true", help="Use frame from the callback function")
+    parser.add_argument(
+        "--display-fps", type=float, default=None,
+        help="Maximum frame rate of the --use-frame display window. Defaults to uncapped."
+    )
+    parser.add_argument(
+        "--playlist", nargs="+", default=None,
+        help="Play these video files one after the other without rebuilding the pipeline. Overrides --input; "
+        "the app exits after the last file."
+    )
     parser.add_argument("--show-fps", "-f", action="store_true", help="Print FPS on sink")
+    parser.add_argument(
+        "--inference-fps", type=int, default=None,
+        help="Maximum frame rate sent to inference and the callback. Extra frames are dropped right after decoding. "
+        "Only applies to pipelines whose source is built with SOURCE_PIPELINE(inference_fps=...), other pipelines "
+        "warn and ignore it. Defaults to the source frame rate."
+    )
+    parser.add_argument(
+        "--headless", action="store_true",
+        help="Run without a display: skip the overlay drawing and color conversion and discard the frames."
+    )
     parser.add_argument(
             "--arch",
             default=None,
@@ -141,7 +353,56 @@ def get_default_parser():
         "--disable-sync", action="store_true",
         help="Disables display sink sync, will run as fast as possible. Relevant when using file source."
     )
+    parser.add_argument(
+        "--queue-profile", default="default", choices=list(QUEUE_PROFILES),
+        help="Queue settings for all pipeline stages: 'live-low-latency' uses one-buffer queues and drops stale frames, "
+        "'throughput' uses deep queues for file replay. Defaults to 'default'."
+    )
     parser.add_argument("--dump-dot", action="store_true", help="Dump the pipeline graph to a dot file pipeline.dot")
+    parser.add_argument(
+        "--trace-latency", action="store_true",
+        help="Trace buffer latency at every queue and named stage and print p50/p95/p99 periodically."
+    )
+    parser.add_argument(
+        "--monitor-queues", action="store_true",
+        help="Sample the fill level of every queue, report the bottleneck stage periodically and print a summary on exit."
+    )
+    parser.add_argument(
+        "--profile-callback", action="store_true",
+        help="Measure the wall time of the app callback and count calls that exceed the frame budget (1/--profile-fps)."
+    )
+    parser.add_argument(
+        "--profile-fps", type=float, default=30,
+        help="Frame rate used for the callback frame budget. Defaults to 30."
+    )
+    parser.add_argument(
+        "--profile-every", type=int, default=0,
+        help="With --profile-callback, run every Nth callback under cProfile and write the aggregated profile on exit. Defaults to 0 (off)."
+    )
+    parser.add_argument(
+        "--profile-output", default="callback_profile.prof",
+        help="Output file for the aggregated callback profile. Defaults to callback_profile.prof."
+    )
+    parser.add_argument(
+        "--null-inference", action="store_true",
+        help="Replace hailonet/hailofilter with a stage that injects synthetic detections, so the app runs without a Hailo device."
+    )
+    parser.add_argument(
+        "--null-detections", type=int, default=3,
+        help="Number of synthetic detections per frame with --null-inference. Defaults to 3."
+    )
+    parser.add_argument(
+        "--null-detection-every", type=int, default=1,
+        help="Inject the synthetic detections on every Nth frame with --null-inference. Defaults to 1 (every frame)."
+    )
+    parser.add_argument(
+        "--benchmark", type=float, default=None, metavar="SECONDS",
+        help="Run for SECONDS, print a benchmark report (fps, CPU, callback time) and exit."
+    )
+    parser.add_argument(
+        "--stats-interval", type=int, default=5,
+        help="Interval in seconds between periodic statistics lines. Defaults to 5."
+    )
     return parser
 
 #---------------------------------------------------------
@@ -159,13 +420,46 @@ def get_source_type(input_source):
         else:
             return 'file'
 
-def QUEUE(name, max_size_buffers=3, max_size_bytes=0, max_size_time=0, leaky='no'):
+# Queue profiles used by all the pipeline builders, selected with set_queue_profile() (--queue-profile).
+#   max_size_buffers: depth of every queue that does not set its own depth.
+#   leaky: leaky mode of the raw-frame queues at the source and in the display branch. The inference queues
+#          never leak, so the hailocropper/hailoaggregator branches always stay in step.
+#   bypass_max_size_buffers: depth of the INFERENCE_PIPELINE_WRAPPER bypass queue, which holds the full
+#          frames while their crops are in inference.
+QUEUE_PROFILES = {
+    'default': {'max_size_buffers': 3, 'leaky': 'no', 'bypass_max_size_buffers': 20},
+    # Live cameras: one frame per stage and stale frames are dropped instead of queued
+    'live-low-latency': {'max_size_buffers': 1, 'leaky': 'downstream', 'bypass_max_size_buffers': 20},
+    # File replay: deep lossless queues that keep every stage busy
+    'throughput': {'max_size_buffers': 10, 'leaky': 'no', 'bypass_max_size_buffers': 40},
+}
+
+queue_profile = QUEUE_PROFILES['default']
+
+def set_queue_profile(profile_name):
+    """
+    Selects the queue profile used by QUEUE() and the pipeline builders. Must be called before the
+    pipeline string is built.
+
+    Args:
+        profile_name (str): A key of QUEUE_PROFILES.
+    """
+    global queue_profile
+    if profile_name not in QUEUE_PROFILES:
+        raise ValueError(f"Unknown queue profile: {profile_name}. Available: {', '.join(QUEUE_PROFILES)}")
+    queue_profile = QUEUE_PROFILES[profile_name]
+
+def get_queue_profile():
+    return queue_profile
+
+def QUEUE(name, max_size_buffers=None, max_size_bytes=0, max_size_time=0, leaky='no'):
     """
     Creates a GStreamer queue element string with the specified parameters.
 
     Args:
         name (str): The name of the queue element.
-        max_size_buffers (int, optional): The maximum number of buffers that the queue can hold. Defaults to 3.
+        max_size_buffers (int, optional): The maximum number of buffers that the queue can hold.
+            Defaults to None, which uses the depth of the current queue profile (3 in the default profile).
         max_size_bytes (int, optional): The maximum size in bytes that the queue can hold. Defaults to 0 (unlimited).
         max_size_time (int, optional): The maximum size in time that the queue can hold. Defaults to 0 (unlimited).
         leaky (str, optional): The leaky type of the queue. Can be 'no', 'upstream', or 'downstream'. Defaults to 'no'.
@@ -173,57 +467,223 @@ def QUEUE(name, max_size_buffers=3, max_size_bytes=0, max_size_time=0, leaky='no
     Returns:
         str: A string representing the GStreamer queue element with the specified parameters.
     """
+    if max_size_buffers is None:
+        max_size_buffers = queue_profile['max_size_buffers']
     q_string = f'queue name={name} leaky={leaky} max-size-buffers={max_size_buffers} max-size-bytes={max_size_bytes} max-size-time={max_size_time} '
     return q_string
 
-def SOURCE_PIPELINE(video_source, video_format='RGB', video_width=640, video_height=640, name='source'):
+# Demuxer for each container, the codec parser and the decoder caps for each video codec
+CONTAINER_DEMUXERS = {
+    'video/quicktime': 'qtdemux',
+    'video/x-matroska': 'matroskademux',
+    'video/webm': 'matroskademux',
+    'video/x-msvideo': 'avidemux',
+}
+CODEC_PARSERS = {
+    'video/x-h264': 'h264parse',
+    'video/x-h265': 'h265parse',
+    'image/jpeg': 'jpegparse',
+}
+
+def get_thread_count():
     """
-    Creates a GStreamer pipeline string for the video source.
+    Returns the number of threads for the decoder and the full-frame videoscale/videoconvert stages.
+    """
+    return os.cpu_count() or 1
+
+def discover_video_codec(video_source, timeout_seconds=5):
+    """
+    Returns the container and video codec caps names of a file, e.g. ('video/quicktime', 'video/x-h264').
+    The container is None for elementary streams. Returns (None, None) if the file cannot be discovered.
+    """
+    try:
+        discoverer = GstPbutils.Discoverer.new(timeout_seconds * Gst.SECOND)
+        info = discoverer.discover_uri(Gst.filename_to_uri(os.path.abspath(video_source)))
+    except Exception as e:
+        print(f"Could not discover {video_source}: {e}")
+        return None, None
+    video_streams = info.get_video_streams()
+    if not video_streams:
+        return None, None
+    codec = video_streams[0].get_caps().get_structure(0).get_name()
+    container = info.get_stream_info().get_caps().get_structure(0).get_name()
+    return (container if container != codec else None), codec
+
+def get_best_decoder(codec):
+    """
+    Returns the name of the highest-ranked installed decoder for the codec caps name (e.g. a hardware
+    v4l2 decoder over avdec), or None if there is none.
+    """
+    factories = Gst.ElementFactory.list_get_elements(
+        Gst.ELEMENT_FACTORY_TYPE_DECODER | Gst.ELEMENT_FACTORY_TYPE_MEDIA_VIDEO, Gst.Rank.MARGINAL)
+    factories = Gst.ElementFactory.list_filter(factories, Gst.Caps.from_string(codec), Gst.PadDirection.SINK, False)
+    if not factories:
+        return None
+    return max(factories, key=lambda factory: factory.get_rank()).get_name()
+
+def select_file_decoder(video_source):
+    """
+    Selects the demuxer, parser and decoder for a video file from its container and codec (H.264, H.265 or MJPEG).
+    This runs a Discoverer on the file and instantiates the decoder, so call it once when the app starts
+    (GStreamerApp.get_file_decoder() caches it) and pass the result to SOURCE_PIPELINE().
+
+    Returns:
+        tuple: (demuxer, parser, decoder, max_threads) element names, with demuxer None for elementary streams
+            and max_threads None when the decoder has no max-threads property; or None when the file cannot be
+            discovered or no matching elements are installed.
+    """
+    container, codec = discover_video_codec(video_source)
+    demuxer = CONTAINER_DEMUXERS.get(container)
+    parser = CODEC_PARSERS.get(codec)
+    decoder = get_best_decoder(codec) if codec is not None else None
+    if parser is None or decoder is None or (container is not None and demuxer is None):
+        return None
+
+    decoder_element = Gst.ElementFactory.make(decoder)
+    max_threads = None
+    if decoder_element is not None and decoder_element.find_property('max-threads') is not None:
+        max_threads = get_thread_count()
+    return demuxer, parser, decoder, max_threads
+
+def FILE_DECODER(file_decoder=None, name='source'):
+    """
+    Creates a GStreamer pipeline string that demuxes and decodes a video file with the elements selected by
+    select_file_decoder(). Software decoders use one thread per core. Falls back to decodebin when no
+    selection is given.
 
     Args:
-        video_source (str): The path or device name of the video source.
-        video_format (str, optional): The video format. Defaults to 'RGB'.
-        video_width (int, optional): The width of the video. Defaults to 640.
-        video_height (int, optional): The height of the video. Defaults to 640.
+        file_decoder (tuple, optional): The result of select_file_decoder(). Defaults to None (decodebin).
         name (str, optional): The prefix name for the pipeline elements. Defaults to 'source'.
 
     Returns:
-        str: A string representing the GStreamer pipeline for the video source.
+        str: A string representing the demux and decode part of the file source (without a trailing link).
+    """
+    if file_decoder is None:
+        # decodebin only has a sometimes src pad, the identity gives the chain a static end to link and ghost
+        return f'decodebin name={name}_decodebin ! identity name={name}_decoded '
+
+    demuxer, parser, decoder, max_threads = file_decoder
+    threads = f'max-threads={max_threads} ' if max_threads is not None else ''
+    demux = f'{demuxer} name={name}_demux ! ' if demuxer is not None else ''
+    return f'{demux}{parser} ! {decoder} name={name}_decoder {threads}'
+
+def SCALE_CONVERT(name, n_threads=2):
+    """
+    Creates a GStreamer pipeline string that scales and converts the video in one pass with videoconvertscale
+    (GStreamer 1.22+), or with videoscale followed by videoconvert on older versions.
+
+    Args:
+        name (str): The prefix name for the elements.
+        n_threads (int, optional): Number of threads of each element. Defaults to 2.
+
+    Returns:
+        str: A string representing the scale and convert stage (without a trailing link).
+    """
+    if Gst.ElementFactory.find('videoconvertscale') is not None:
+        return f'videoconvertscale name={name}_videoconvertscale n-threads={n_threads} qos=false '
+    return (
+        f'videoscale name={name}_videoscale n-threads={n_threads} qos=false ! '
+        f'{QUEUE(name=f"{name}_convert_q")} ! '
+        f'videoconvert name={name}_videoconvert n-threads={n_threads} qos=false '
+    )
+
+def SOURCE_ELEMENT(video_source, video_format='RGB', name='source', file_decoder=None):
+    """
+    Creates a GStreamer pipeline string for the source element and its decoder or caps, up to (not including)
+    the scaling stage. This is the part of the source that GStreamerApp.replace_source() swaps at runtime.
+
+    Args:
+        video_source (str): The path or device name of the video source.
+        video_format (str, optional): The video format requested from the RPi camera. Defaults to 'RGB'.
+        name (str, optional): The name of the source element. Defaults to 'source'.
+        file_decoder (tuple, optional): The select_file_decoder() result for a file source. Defaults to None (decodebin).
+
+    Returns:
+        str: A string representing the GStreamer source element chain (without a trailing link).
     """
     source_type = get_source_type(video_source)
 
     if source_type == 'rpi':
         source_element = (
             f'libcamerasrc name={name} ! '
-            f'video/x-raw, format={video_format}, width=1536, height=864 ! '
+            f'video/x-raw, format={video_format}, width=1536, height=864 '
         )
     elif source_type == 'usb':
         source_element = (
             f'v4l2src device={video_source} name={name} ! '
-            'video/x-raw, width=640, height=480 ! '
+            'video/x-raw, width=640, height=480 '
         )
     else:
         source_element = (
             f'filesrc location="{video_source}" name={name} ! '
-            f'{QUEUE(name=f"{name}_queue_dec264")} ! '
-            'qtdemux ! h264parse ! avdec_h264 max-threads=2 ! '
+            f'{QUEUE(name=f"{name}_queue_dec")} ! '
+            f'{FILE_DECODER(file_decoder, name=name)}'
         )
+
+    return source_element
+
+def SOURCE_PIPELINE(video_source, video_format='RGB', video_width=640, video_height=640, name='source', inference_fps=None, scale=False, file_decoder=None):
+    """
+    Creates a GStreamer pipeline string for the video source.
+
+    Args:
+        video_source (str): The path or device name of the video source.
+        video_format (str, optional): The video format. Defaults to 'RGB'.
+        video_width (int, optional): The width of the video when scale is True. Defaults to 640.
+        video_height (int, optional): The height of the video when scale is True. Defaults to 640.
+        name (str, optional): The prefix name for the pipeline elements. Defaults to 'source'.
+        inference_fps (int, optional): Maximum frame rate passed downstream. Frames above this rate are dropped
+            right after decoding, before the scaling, conversion and inference. Defaults to None (source rate).
+        scale (bool, optional): Scale to video_width x video_height in the same pass as the format conversion.
+            Use with the network input size and INFERENCE_PIPELINE(convert=False) to convert each frame only once.
+            Defaults to False (the source resolution is kept).
+        file_decoder (tuple, optional): The select_file_decoder() result for a file source. Defaults to None (decodebin).
+
+    Returns:
+        str: A string representing the GStreamer pipeline for the video source.
+    """
+    # The raw frames can be dropped here, the compressed stream in SOURCE_ELEMENT never leaks
+    leaky = queue_profile['leaky']
+    threads = get_thread_count()
+
+    size_caps = f'width={video_width}, height={video_height}, ' if scale else ''
+
+    # The rate limiter sits after source_scale_q so that replace_source() keeps it
+    if inference_fps is not None:
+        rate_pipeline = f'videorate name={name}_videorate drop-only=true max-rate={inference_fps} ! '
+    else:
+        rate_pipeline = ''
     source_pipeline = (
-        f'{source_element} '
-        f'{QUEUE(name=f"{name}_scale_q")} ! '
-        f'videoscale name={name}_videoscale n-threads=2 ! '
-        f'{QUEUE(name=f"{name}_convert_q")} ! '
-        f'videoconvert n-threads=3 name={name}_convert qos=false ! '
-        f'video/x-raw, format={video_format}, pixel-aspect-ratio=1/1 ! '
-        # f'video/x-raw, format={video_format}, width={video_width}, height={video_height} ! '
+        f'{SOURCE_ELEMENT(video_source, video_format, name=name, file_decoder=file_decoder)} ! '
+        f'{QUEUE(name=f"{name}_scale_q", leaky=leaky)} ! '
+        f'{rate_pipeline}'
+        f'{SCALE_CONVERT(name, threads)} ! '
+        f'video/x-raw, format={video_format}, {size_caps}pixel-aspect-ratio=1/1 ! '
     )
 
     return source_pipeline
 
-def INFERENCE_PIPELINE(hef_path, post_process_so, batch_size=1, config_json=None, post_function_name=None, additional_params='', name='inference'):
+def get_source_elements(pipeline, name='source'):
+    """
+    Returns the elements of the source chain created by SOURCE_ELEMENT(), walking upstream from the
+    {name}_scale_q queue, ordered from the queue's upstream peer to the source element.
+    After a replace_source() the chain is a single bin named {name}_bin.
+    """
+    scale_q = pipeline.get_by_name(f'{name}_scale_q')
+    if scale_q is None:
+        return []
+    elements = []
+    pad = scale_q.get_static_pad('sink').get_peer()
+    while pad is not None:
+        element = pad.get_parent_element()
+        elements.append(element)
+        pad = element.sinkpads[0].get_peer() if element.sinkpads else None
+    return elements
+
+def INFERENCE_PIPELINE(hef_path, post_process_so, batch_size=1, config_json=None, post_function_name=None, additional_params='', name='inference', convert=True):
     """
     Creates a GStreamer pipeline string for inference and post-processing using a user-provided shared object file.
-    This pipeline includes videoscale and videoconvert elements to convert the video frame to the required format.
+    This pipeline includes a scale and convert stage to convert the video frame to the required format.
     The format and resolution are automatically negotiated based on the HEF file requirements.
 
     Args:
@@ -234,6 +694,8 @@ def INFERENCE_PIPELINE(hef_path, post_process_so, batch_size=1, config_json=None
         post_function_name (str, optional): The name of the post-processing function. If None, no function name is added. Defaults to None.
         additional_params (str, optional): Additional parameters for the hailonet element. Defaults to ''.
         name (str, optional): The prefix name for the pipeline elements. Defaults to 'inference'.
+        convert (bool, optional): Include the scale and convert stage. Set to False when the input already has the
+            HEF input format and size, e.g. from SOURCE_PIPELINE(scale=True). Defaults to True.
 
     Returns:
         str: A string representing the GStreamer pipeline for inference.
@@ -251,12 +713,17 @@ def INFERENCE_PIPELINE(hef_path, post_process_so, batch_size=1, config_json=None
         function_name_str = ''
 
     # Construct the inference pipeline string
+    if convert:
+        convert_pipeline = (
+            f'{QUEUE(name=f"{name}_scale_q")} ! '
+            f'{SCALE_CONVERT(name)} ! '
+            f'video/x-raw, pixel-aspect-ratio=1/1 ! '
+        )
+    else:
+        convert_pipeline = ''
+
     inference_pipeline = (
-        f'{QUEUE(name=f"{name}_scale_q")} ! '
-        f'videoscale name={name}_videoscale n-threads=2 qos=false ! '
-        f'{QUEUE(name=f"{name}_convert_q")} ! '
-        f'video/x-raw, pixel-aspect-ratio=1/1 ! '
-        f'videoconvert name={name}_videoconvert n-threads=2 ! '
+        f'{convert_pipeline}'
         f'{QUEUE(name=f"{name}_hailonet_q")} ! '
         f'hailonet name={name}_hailonet hef-path={hef_path} batch-size={batch_size} {additional_params} force-writable=true ! '
         f'{QUEUE(name=f"{name}_hailofilter_q")} ! '
@@ -265,7 +732,7 @@ def INFERENCE_PIPELINE(hef_path, post_process_so, batch_size=1, config_json=None
 
     return inference_pipeline
 
-def INFERENCE_PIPELINE_WRAPPER(inner_pipeline, bypass_max_size_buffers=20, name='inference_wrapper'):
+def INFERENCE_PIPELINE_WRAPPER(inner_pipeline, bypass_max_size_buffers=None, name='inference_wrapper'):
     """
     Creates a GStreamer pipeline string that wraps an inner pipeline with a hailocropper and hailoaggregator.
     This allows to keep the original video resolution and color-space (format) of the input frame.
@@ -273,7 +740,8 @@ def INFERENCE_PIPELINE_WRAPPER(inner_pipeline, bypass_max_size_buffers=20, name=
 
     Args:
         inner_pipeline (str): The inner pipeline string to be wrapped.
-        bypass_max_size_buffers (int, optional): The maximum number of buffers for the bypass queue. Defaults to 20.
+        bypass_max_size_buffers (int, optional): The maximum number of buffers for the bypass queue.
+            Defaults to None, which uses the current queue profile (20 in the default profile).
         name (str, optional): The prefix name for the pipeline elements. Defaults to 'inference_wrapper'.
 
     Returns:
@@ -282,6 +750,8 @@ def INFERENCE_PIPELINE_WRAPPER(inner_pipeline, bypass_max_size_buffers=20, name=
     # Get the directory for post-processing shared objects
     tappas_post_process_dir = os.environ.get('TAPPAS_POST_PROC_DIR', '')
     whole_buffer_crop_so = os.path.join(tappas_post_process_dir, 'cropping_algorithms/libwhole_buffer.so')
+    if bypass_max_size_buffers is None:
+        bypass_max_size_buffers = queue_profile['bypass_max_size_buffers']
 
     # Construct the inference wrapper pipeline string
     inference_wrapper_pipeline = (
@@ -295,27 +765,73 @@ def INFERENCE_PIPELINE_WRAPPER(inner_pipeline, bypass_max_size_buffers=20, name=
 
     return inference_wrapper_pipeline
 
-def DISPLAY_PIPELINE(video_sink='xvimagesink', sync='true', show_fps='false', name='hailo_display'):
+def ROUND_ROBIN_PIPELINE(source_pipelines, name='robin'):
+    """
+    Creates a GStreamer pipeline string that merges several sources into one stream with hailoroundrobin,
+    so a single inference pipeline serves all of them and fills the hailonet batch.
+    Each buffer is tagged with the stream id of its input (sink_0, sink_1, ...) for STREAM_ROUTER_PIPELINE.
+    The sources must produce the same caps, e.g. SOURCE_PIPELINE(scale=True) at the network input size.
+
+    Args:
+        source_pipelines (list): The source pipeline strings, each ending with a link (' ! ').
+        name (str, optional): The name of the hailoroundrobin element. Defaults to 'robin'.
+
+    Returns:
+        str: A string representing the merged sources, to be linked to the inference pipeline.
+    """
+    sources = ''.join(
+        f'{source_pipeline} {name}.sink_{index} ' for index, source_pipeline in enumerate(source_pipelines))
+    return f'{sources}hailoroundrobin name={name} mode=0 '
+
+def STREAM_ROUTER_PIPELINE(stream_pipelines, name='router'):
+    """
+    Creates a GStreamer pipeline string that splits the merged stream of ROUND_ROBIN_PIPELINE back into
+    one branch per input with hailostreamrouter. The buffers keep their detections.
+
+    Args:
+        stream_pipelines (list): The pipeline string of each stream's branch, in input order.
+        name (str, optional): The name of the hailostreamrouter element. Defaults to 'router'.
+
+    Returns:
+        str: A string representing the stream router and the per-stream branches.
+    """
+    routes = ' '.join(f'src_{index}::input-streams="<sink_{index}>"' for index in range(len(stream_pipelines)))
+    branches = ' '.join(
+        f'{name}.src_{index} ! {stream_pipeline}' for index, stream_pipeline in enumerate(stream_pipelines))
+    return f'hailostreamrouter name={name} {routes} {branches} '
+
+def DISPLAY_PIPELINE(video_sink='xvimagesink', sync='true', show_fps='false', name='hailo_display', headless=False):
     """
     Creates a GStreamer pipeline string for displaying the video.
     It includes the hailooverlay plugin to draw bounding boxes and labels on the video.
+    In headless mode the overlay and the full-frame videoconvert are left out and the frames go to a fakesink.
+    The fpsdisplaysink is kept, so the fps-measurements signal still works.
 
     Args:
         video_sink (str, optional): The video sink element to use. Defaults to 'xvimagesink'.
         sync (str, optional): The sync property for the video sink. Defaults to 'true'.
         show_fps (str, optional): Whether to show the FPS on the video sink. Should be 'true' or 'false'. Defaults to 'false'.
         name (str, optional): The prefix name for the pipeline elements. Defaults to 'hailo_display'.
+        headless (bool, optional): Discard the frames instead of drawing and displaying them. Defaults to False.
 
     Returns:
         str: A string representing the GStreamer pipeline for displaying the video.
     """
+    leaky = queue_profile['leaky']
+
+    if headless:
+        return (
+            f'{QUEUE(name=f"{name}_q", leaky=leaky)} ! '
+            f'fpsdisplaysink name={name} video-sink=fakesink sync={sync} text-overlay=false signal-fps-measurements=true '
+        )
+
     # Construct the display pipeline string
     display_pipeline = (
-        f'{QUEUE(name=f"{name}_hailooverlay_q")} ! '
+        f'{QUEUE(name=f"{name}_hailooverlay_q", leaky=leaky)} ! '
         f'hailooverlay name={name}_hailooverlay ! '
-        f'{QUEUE(name=f"{name}_videoconvert_q")} ! '
+        f'{QUEUE(name=f"{name}_videoconvert_q", leaky=leaky)} ! '
         f'videoconvert name={name}_videoconvert n-threads=2 qos=false ! '
-        f'{QUEUE(name=f"{name}_q")} ! '
+        f'{QUEUE(name=f"{name}_q", leaky=leaky)} ! '
         f'fpsdisplaysink name={name} video-sink={video_sink} sync={sync} text-overlay={show_fps} signal-fps-measurements=true '
     )
 
@@ -338,11 +854,39 @@ def USER_CALLBACK_PIPELINE(name='identity_callback'):
     )
 
     return user_callback_pipeline
+def create_stream_user_data(user_data, stream_id, user_data_factory=None):
+    """
+    Creates the callback state of an extra input from the one of the first input.
+
+    Without a factory, user_data is copied with copy.copy(), so subclasses whose __init__ takes arguments work
+    as well. The copy starts with its own frame count and no frame display, but shares the mutable attributes
+    (lists, dicts) of user_data; pass a factory when each input needs its own.
+
+    Args:
+        user_data (app_callback_class): The callback state of the first input.
+        stream_id (int): The index of the input.
+        user_data_factory (callable, optional): Returns a new callback state, called without arguments. Defaults to None.
+
+    Returns:
+        app_callback_class: The callback state of the input.
+    """
+    if user_data_factory is not None:
+        stream_data = user_data_factory()
+    else:
+        stream_data = copy.copy(user_data)
+        stream_data.frame_count = 0
+        # --use-frame shows the first input only
+        stream_data.use_frame = False
+        stream_data.frame_ring = None
+    stream_data.stream_id = stream_id
+    stream_data.inference_fps = user_data.inference_fps
+    return stream_data
+
 # -----------------------------------------------------------------------------------------------
 # GStreamerApp class
 # -----------------------------------------------------------------------------------------------
 class GStreamerApp:
-    def __init__(self, args, user_data: app_callback_class):
+    def __init__(self, args, user_data: app_callback_class, user_data_factory=None):
         # Set the process title
         setproctitle.setproctitle("Hailo Python App")
 
@@ -359,12 +903,29 @@ class GStreamerApp:
             exit(1)
         self.current_path = os.path.dirname(os.path.abspath(__file__))
         self.postprocess_dir = tappas_post_process_dir
-        self.video_source = self.options_menu.input
+        self.playlist = list(self.options_menu.playlist or [])
+        self.video_source = self.playlist.pop(0) if self.playlist else self.options_menu.input
         self.source_type = get_source_type(self.video_source)
+        self.video_sources = [self.video_source] if self.playlist else (self.options_menu.inputs or [self.video_source])
         self.user_data = user_data
         self.video_sink = "xvimagesink"
         self.pipeline = None
         self.loop = None
+        self.latency_tracer = None
+        self.queue_monitor = None
+        self.callback_profiler = None
+        self.source_reconnect_pending = False
+        self.null_injector = None
+        self.benchmark = None
+        self.conversions_reported = False
+        # Format and name prefix the SOURCE_PIPELINE is built with; source swaps rebuild the source with the same ones
+        self.source_format = 'RGB'
+        self.source_name = 'source'
+        # Discover the files once here rather than in the pipeline string builders
+        Gst.init(None)
+        self.file_decoders = {}
+        for video_source in self.video_sources + self.playlist:
+            self.get_file_decoder(video_source)
 
         # Set Hailo parameters; these parameters should be set based on the model used
         self.batch_size = 1
@@ -374,11 +935,26 @@ class GStreamerApp:
         self.hef_path = None
         self.app_callback = None
 
+        # Select the queue settings before the subclass builds the pipeline string
+        set_queue_profile(self.options_menu.queue_profile)
+
         # Set user data parameters
         user_data.use_frame = self.options_menu.use_frame
+        self.inference_fps = self.options_menu.inference_fps
+        user_data.inference_fps = self.inference_fps
+        if user_data.use_frame:
+            user_data.create_frame_ring()
+
+        # Each extra input gets its own callback state; --use-frame shows the first input
+        self.stream_user_data = [user_data] + [
+            create_stream_user_data(user_data, stream_id, user_data_factory)
+            for stream_id in range(1, len(self.video_sources))]
 
         self.sync = "false" if (self.options_menu.disable_sync or self.source_type != "file") else "true"
         self.show_fps = True if self.options_menu.show_fps else False
+        self.headless = self.options_menu.headless
+        if self.headless:
+            self.video_sink = "fakesink"
 
         if self.options_menu.dump_dot:
             os.environ["GST_DEBUG_DUMP_DOT_DIR"] = self.current_path
@@ -399,10 +975,23 @@ class GStreamerApp:
             print(pipeline_string)
             sys.exit(1)
 
+        # Only a source built with SOURCE_PIPELINE(inference_fps=...) drops the extra frames
+        if self.inference_fps is not None:
+            videorate_name = f'{self.stream_element_name(self.source_name, 0)}_videorate'
+            if self.pipeline.get_by_name(videorate_name) is None:
+                print(f"Warning: {videorate_name} element not found, --inference-fps is ignored by this pipeline. "
+                      "Build the source with SOURCE_PIPELINE(inference_fps=...) to use it.")
+                self.inference_fps = None
+                for stream_data in self.stream_user_data:
+                    stream_data.inference_fps = None
+
         # Connect to hailo_display fps-measurements
         if self.show_fps:
             print("Showing FPS")
-            self.pipeline.get_by_name("hailo_display").connect("fps-measurements", self.on_fps_measurement)
+            for stream_id in range(len(self.video_sources)):
+                display = self.pipeline.get_by_name(self.stream_element_name("hailo_display", stream_id))
+                if display is not None:
+                    display.connect("fps-measurements", self.on_fps_measurement)
 
         # Create a GLib Main Loop
         self.loop = GLib.MainLoop()
@@ -415,7 +1004,18 @@ class GStreamerApp:
         elif t == Gst.MessageType.ERROR:
             err, debug = message.parse_error()
             print(f"Error: {err}, {debug}")
-            self.shutdown()
+            if self.source_type == "usb" and self.is_source_message(message):
+                # The camera was unplugged or stalled, keep the rest of the pipeline up and reconnect
+                if not self.source_reconnect_pending:
+                    self.source_reconnect_pending = True
+                    GLib.timeout_add_seconds(1, self.reconnect_source)
+            else:
+                self.shutdown()
+        elif t == Gst.MessageType.STATE_CHANGED and message.src == self.pipeline:
+            _, new_state, _ = message.parse_state_changed()
+            if new_state == Gst.State.PLAYING and not self.conversions_reported:
+                self.conversions_reported = True
+                self.report_conversions()
         # QOS
         elif t == Gst.MessageType.QOS:
             # Handle QoS message here
@@ -425,7 +1025,10 @@ class GStreamerApp:
 
 
     def on_eos(self):
-        if self.source_type == "file":
+        if self.options_menu.playlist:
+            # The last file of the playlist has finished
+            self.shutdown()
+        elif self.source_type == "file":
              # Seek to the start (position 0) in nanoseconds
             success = self.pipeline.seek_simple(Gst.Format.TIME, Gst.SeekFlags.FLUSH, 0)
             if success:
@@ -449,6 +1052,119 @@ class GStreamerApp:
         GLib.idle_add(self.loop.quit)
 
 
+    def get_file_decoder(self, video_source):
+        """
+        Returns the select_file_decoder() result for a file source, discovered on the first call and cached,
+        or None for other sources.
+        """
+        if get_source_type(video_source) != 'file':
+            return None
+        if video_source not in self.file_decoders:
+            self.file_decoders[video_source] = select_file_decoder(video_source)
+        return self.file_decoders[video_source]
+
+    def stream_element_name(self, name, stream_id):
+        """
+        Returns the name of a per-stream element: unchanged with a single input, suffixed with _<stream_id>
+        when the app runs several inputs.
+        """
+        return name if len(self.video_sources) == 1 else f"{name}_{stream_id}"
+
+    def is_source_message(self, message):
+        source_elements = get_source_elements(self.pipeline)
+        return any(message.src == element or message.src.has_as_ancestor(element) for element in source_elements)
+
+    def on_source_event(self, pad, info, user_data):
+        # Hold back the EOS of a playlist entry so the downstream elements never see it, and switch to the next file
+        event = info.get_event()
+        if event.type == Gst.EventType.EOS and self.playlist:
+            next_source = self.playlist.pop(0)
+            print(f"Switching source to {next_source}")
+            GLib.idle_add(self.replace_source, next_source)
+            return Gst.PadProbeReturn.DROP
+        return Gst.PadProbeReturn.OK
+
+    def reconnect_source(self):
+        if not os.path.exists(self.video_source):
+            print(f"Waiting for {self.video_source} to reconnect...")
+            return True
+        print(f"Reconnecting {self.video_source}")
+        self.source_reconnect_pending = False
+        self.replace_source(self.video_source)
+        return False
+
+    def replace_source(self, video_source, video_format=None, name=None):
+        """
+        Replaces the source chain (everything upstream of {name}_scale_q) with a new source while the pipeline
+        keeps running. The inference and display stages, including the HEF loaded by hailonet, stay up.
+        The swap waits until the old source is idle, so it is safe to call while it is still streaming.
+        video_format and name default to the source_format and source_name the pipeline was built with.
+        Must be called from the main loop. Returns False so it can be used as a GLib idle callback.
+        """
+        video_format = video_format or self.source_format
+        name = name or self.source_name
+        source_elements = get_source_elements(self.pipeline, name)
+        if not source_elements:
+            print(f"Warning: {name}_scale_q element not found, cannot replace the source.")
+            return False
+        source_pad = self.pipeline.get_by_name(f'{name}_scale_q').get_static_pad('sink').get_peer()
+        # An IDLE probe fires once no buffer is being pushed and keeps the pad blocked until the elements are removed.
+        # The swap itself changes element states, so it has to run on the main loop, not in the streaming thread.
+        source_pad.add_probe(
+            Gst.PadProbeType.IDLE, self.on_source_idle, (source_elements, video_source, video_format, name))
+        return False
+
+    def on_source_idle(self, pad, info, swap_args):
+        GLib.idle_add(self.swap_source, *swap_args)
+        return Gst.PadProbeReturn.OK
+
+    def swap_source(self, source_elements, video_source, video_format, name):
+        scale_q_pad = self.pipeline.get_by_name(f'{name}_scale_q').get_static_pad('sink')
+        try:
+            source_bin = Gst.parse_bin_from_description(
+                SOURCE_ELEMENT(video_source, video_format, name=name, file_decoder=self.get_file_decoder(video_source)), True)
+        except Exception as e:
+            print(f"Error creating source {video_source}: {e}")
+            self.shutdown()
+            return False
+        source_bin.set_name(f'{name}_bin')
+
+        old_pad = scale_q_pad.get_peer()
+        if old_pad is not None:
+            old_pad.unlink(scale_q_pad)
+        for element in source_elements:
+            element.set_state(Gst.State.NULL)
+            self.pipeline.remove(element)
+
+        self.pipeline.add(source_bin)
+        source_pad = source_bin.get_static_pad('src')
+        source_pad.link(scale_q_pad)
+        # The new source starts its timestamps at 0, shift them to the current running time of the pipeline
+        clock = self.pipeline.get_clock()
+        if clock is not None:
+            source_pad.set_offset(clock.get_time() - self.pipeline.get_base_time())
+        source_bin.sync_state_with_parent()
+
+        self.video_source = video_source
+        self.source_type = get_source_type(video_source)
+        return False
+
+    def report_conversions(self):
+        conversions = get_video_conversions(self.pipeline)
+        active = [conversion for conversion in conversions if conversion[1]]
+        print(f"Full-frame conversions: {len(active)} active, {len(conversions) - len(active)} passthrough")
+        for name, _, input_caps, output_caps in active:
+            print(f"  {name}: {input_caps} -> {output_caps}")
+
+    def end_benchmark(self):
+        profiler = self.callback_profiler
+        report = self.benchmark.report(
+            profiler.times.count if profiler is not None else 0,
+            profiler.get_stats() if profiler is not None else None)
+        print(f"Benchmark: {PipelineBenchmark.format_report(report)}")
+        self.shutdown()
+        return False
+
     def get_pipeline_string(self):
         # This is a placeholder function that should be overridden by the child class
         return ""
@@ -464,33 +1180,82 @@ class GStreamerApp:
         bus.add_signal_watch()
         bus.connect("message", self.bus_call, self.loop)
 
-        # Connect pad probe to the identity element
-        identity = self.pipeline.get_by_name("identity_callback")
-        if identity is None:
-            print("Warning: identity_callback element not found, add <identity name=identity_callback> in your pipeline where you want the callback to be called.")
-        else:
-            identity_pad = identity.get_static_pad("src")
-            identity_pad.add_probe(Gst.PadProbeType.BUFFER, self.app_callback, self.user_data)
+        # Connect pad probe to the identity element of each stream
+        callback = self.app_callback
+        if self.options_menu.profile_callback or self.options_menu.benchmark:
+            self.callback_profiler = CallbackProfiler(
+                self.app_callback, fps=self.options_menu.profile_fps, profile_every=self.options_menu.profile_every)
+            if self.options_menu.profile_callback:
+                GLib.timeout_add_seconds(self.options_menu.stats_interval, self.callback_profiler.log_stats)
+            callback = self.callback_profiler
+        for stream_id, stream_data in enumerate(self.stream_user_data):
+            identity_name = self.stream_element_name("identity_callback", stream_id)
+            identity = self.pipeline.get_by_name(identity_name)
+            if identity is None:
+                print(f"Warning: {identity_name} element not found, add <identity name={identity_name}> in your pipeline where you want the callback to be called.")
+            else:
+                identity.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, callback, stream_data)
 
-        hailo_display = self.pipeline.get_by_name("hailo_display")
-        if hailo_display is None:
-            print("Warning: hailo_display element not found, add <fpsdisplaysink name=hailo_display> to your pipeline to support fps display.")
-        else:
-            xvimagesink = hailo_display.get_by_name("xvimagesink0")
-            if xvimagesink is not None:
-                xvimagesink.set_property("qos", False)
+        # Inject synthetic detections in place of the Hailo inference
+        if self.options_menu.null_inference:
+            null_inference = self.pipeline.get_by_name("inference_null")
+            if null_inference is None:
+                print("Warning: inference_null element not found, --null-inference needs a pipeline built with NULL_INFERENCE_PIPELINE.")
+            else:
+                self.null_injector = NullDetectionInjector(
+                    self.options_menu.null_detections, self.options_menu.null_detection_every)
+                null_inference.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self.null_injector)
+
+        # Switch playlist entries at the source instead of letting EOS reach the sinks
+        if self.playlist:
+            scale_q_name = f"{self.source_name}_scale_q"
+            source_scale_q = self.pipeline.get_by_name(scale_q_name)
+            if source_scale_q is None:
+                print(f"Warning: {scale_q_name} element not found, --playlist needs a pipeline built with SOURCE_PIPELINE.")
+            else:
+                source_scale_q.get_static_pad("sink").add_probe(
+                    Gst.PadProbeType.EVENT_DOWNSTREAM, self.on_source_event, None)
+
+        for stream_id in range(len(self.video_sources)):
+            display_name = self.stream_element_name("hailo_display", stream_id)
+            hailo_display = self.pipeline.get_by_name(display_name)
+            if hailo_display is None:
+                print(f"Warning: {display_name} element not found, add <fpsdisplaysink name={display_name}> to your pipeline to support fps display.")
+            else:
+                video_sink = hailo_display.get_property("video-sink")
+                if video_sink is not None:
+                    video_sink.set_property("qos", False)
 
         # Disable QoS to prevent frame drops
         disable_qos(self.pipeline)
 
+        # Trace per-stage latency
+        if self.options_menu.trace_latency:
+            self.latency_tracer = PipelineLatencyTracer(self.pipeline)
+            print(f"Tracing latency at {self.latency_tracer.attach()} stages")
+            GLib.timeout_add_seconds(self.options_menu.stats_interval, self.latency_tracer.log_stats)
+
+        # Monitor queue occupancy
+        if self.options_menu.monitor_queues:
+            self.queue_monitor = QueueMonitor(self.pipeline)
+            print(f"Monitoring {self.queue_monitor.start()} queues")
+            GLib.timeout_add_seconds(self.options_menu.stats_interval, self.queue_monitor.log_stats)
+
         # Start a subprocess to run the display_user_data_frame function
         if self.options_menu.use_frame:
-            display_process = multiprocessing.Process(target=display_user_data_frame, args=(self.user_data,))
+            display_process = multiprocessing.Process(
+                target=display_user_data_frame, args=(self.user_data, self.options_menu.display_fps))
             display_process.start()
 
         # Set pipeline to PLAYING state
         self.pipeline.set_state(Gst.State.PLAYING)
 
+        # Stop after the benchmark period
+        if self.options_menu.benchmark:
+            self.benchmark = PipelineBenchmark()
+            self.benchmark.start()
+            GLib.timeout_add(int(self.options_menu.benchmark * 1000), self.end_benchmark)
+
         # Dump dot file
         if self.options_menu.dump_dot:
             GLib.timeout_add_seconds(3, self.dump_dot_file)
@@ -500,61 +1265,25 @@ class GStreamerApp:
 
         # Clean up
         self.user_data.running = False
+        if self.queue_monitor is not None:
+            self.queue_monitor.stop()
         self.pipeline.set_state(Gst.State.NULL)
+        if self.latency_tracer is not None:
+            self.latency_tracer.log_stats()
+        if self.queue_monitor is not None:
+            print(f"Queue occupancy:\n{self.queue_monitor.format_summary()}")
+        if self.callback_profiler is not None:
+            self.callback_profiler.log_stats()
+            if self.callback_profiler.write_profile(self.options_menu.profile_output):
+                print(f"Callback profile written to {self.options_menu.profile_output}")
         if self.options_menu.use_frame:
-            display_process.terminate()
-            display_process.join()
-
-# ---------------------------------------------------------
-# Functions used to get numpy arrays from GStreamer buffers
-# ---------------------------------------------------------
-
-def handle_rgb(map_info, width, height):
-    # The copy() method is used to create a copy of the numpy array. This is necessary because the original numpy array is created from buffer data, and it does not own the data it represents. Instead, it's just a view of the buffer's data.
-    return np.ndarray(shape=(height, width, 3), dtype=np.uint8, buffer=map_info.data).copy()
-
-def handle_nv12(map_info, width, height):
-    y_plane_size = width * height
-    uv_plane_size = width * height // 2
-    y_plane = np.ndarray(shape=(height, width), dtype=np.uint8, buffer=map_info.data[:y_plane_size]).copy()
-    uv_plane = np.ndarray(shape=(height//2, width//2, 2), dtype=np.uint8, buffer=map_info.data[y_plane_size:]).copy()
-    return y_plane, uv_plane
-
-def handle_yuyv(map_info, width, height):
-    return np.ndarray(shape=(height, width, 2), dtype=np.uint8, buffer=map_info.data).copy()
-
-FORMAT_HANDLERS = {
-    'RGB': handle_rgb,
-    'NV12': handle_nv12,
-    'YUYV': handle_yuyv,
-}
-
-def get_numpy_from_buffer(buffer, format, width, height):
-    """
-    Converts a GstBuffer to a numpy array based on provided format, width, and height.
-
-    Args:
-        buffer (GstBuffer): The GStreamer Buffer to convert.
-        format (str): The video format ('RGB', 'NV12', 'YUYV', etc.).
-        width (int): The width of the video frame.
-        height (int): The height of the video frame.
-
-    Returns:
-        np.ndarray: A numpy array representing the buffer's data, or a tuple of arrays for certain formats.
-    """
-    # Map the buffer to access data
-    success, map_info = buffer.map(Gst.MapFlags.READ)
-    if not success:
-        raise ValueError("Buffer mapping failed")
-
-    try:
-        # Handle different formats based on the provided format parameter
-        handler = FORMAT_HANDLERS.get(format)
-        if handler is None:
-            raise ValueError(f"Unsupported format: {format}")
-        return handler(map_info, width, height)
-    finally:
-        buffer.unmap(map_info)
+            # Let the display process exit on its own so it can report its stats
+            self.user_data.display_stop_event.set()
+            display_process.join(timeout=2)
+            if display_process.is_alive():
+                display_process.terminate()
+                display_process.join()
+            print(f"Frame ring: {self.user_data.frame_ring.stats()}")
 
 # ---------------------------------------------------------
 # Useful functions for working with GStreamer
@@ -585,3 +1314,37 @@ def disable_qos(pipeline):
             # Set the 'qos' property to False
             element.set_property('qos', False)
             print(f"Set qos to False for {element.get_name()}")
+
+# Elements that scale or convert whole frames
+VIDEO_CONVERSION_FACTORIES = ('videoscale', 'videoconvert', 'videoconvertscale')
+
+def describe_caps(caps):
+    if caps is None or caps.get_size() == 0:
+        return '?'
+    structure = caps.get_structure(0)
+    return f"{structure.get_value('format')} {structure.get_value('width')}x{structure.get_value('height')}"
+
+def get_video_conversions(pipeline):
+    """
+    Returns the full-frame scale/convert elements of a negotiated pipeline as a list of
+    (name, active, input caps, output caps). Elements whose input caps already match their output caps run in
+    passthrough and cost nothing, they are reported with active=False.
+    :param pipeline: A GStreamer pipeline object
+    """
+    conversions = []
+    it = pipeline.iterate_recurse()
+    while True:
+        result, element = it.next()
+        if result != Gst.IteratorResult.OK:
+            break
+        factory = element.get_factory()
+        if factory is None or factory.get_name() not in VIDEO_CONVERSION_FACTORIES:
+            continue
+        active = not GstBase.BaseTransform.is_passthrough(element)
+        conversions.append((
+            element.get_name(),
+            active,
+            describe_caps(element.get_static_pad('sink').get_current_caps()),
+            describe_caps(element.get_static_pad('src').get_current_caps()),
+        ))
+    return conversions
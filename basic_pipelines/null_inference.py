@@ -0,0 +1,72 @@
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+import hailo
+
+# -----------------------------------------------------------------------------------------------
+# Null inference, shared by the basic pipelines and the watcher (no app framework dependencies)
+# -----------------------------------------------------------------------------------------------
+def NULL_INFERENCE_PIPELINE(name='inference', max_size_buffers=3):
+    """
+    Creates a GStreamer pipeline string that stands in for INFERENCE_PIPELINE without a Hailo device.
+    The frames pass through unchanged; the app attaches a NullDetectionInjector to the {name}_null
+    element to add synthetic detections (see --null-inference).
+
+    Args:
+        name (str, optional): The prefix name for the pipeline elements. Defaults to 'inference'.
+        max_size_buffers (int, optional): Depth of the queue in front of the null stage, e.g. the depth of the
+            current queue profile. Defaults to 3.
+
+    Returns:
+        str: A string representing the GStreamer pipeline for the null inference.
+    """
+    null_inference_pipeline = (
+        f'queue name={name}_null_q leaky=no max-size-buffers={max_size_buffers} max-size-bytes=0 max-size-time=0 ! '
+        f'identity name={name}_null '
+    )
+
+    return null_inference_pipeline
+
+class NullDetectionInjector:
+    """
+    Pad probe that adds synthetic HailoDetection objects to the buffers, in place of hailonet/hailofilter.
+    The boxes drift across the frame from one frame to the next so that trackers and callbacks see movement.
+    """
+    def __init__(self, num_detections=3, every=1, label='person', confidence=0.9):
+        """
+        Args:
+            num_detections (int, optional): Detections added per frame. Defaults to 3.
+            every (int, optional): Add the detections on every Nth frame only. Defaults to 1.
+            label (str, optional): Label of the detections. Defaults to 'person'.
+            confidence (float, optional): Confidence of the detections. Defaults to 0.9.
+        """
+        self.num_detections = num_detections
+        self.every = max(1, every)
+        self.label = label
+        self.confidence = confidence
+        self.frames = 0
+        self.injected = 0
+
+    def make_boxes(self, frame_index):
+        """
+        Returns the normalized (xmin, ymin, width, height) boxes for a frame.
+        """
+        width, height = 0.2, 0.3
+        boxes = []
+        for i in range(self.num_detections):
+            xmin = (frame_index * 0.005 + i / max(1, self.num_detections)) % (1.0 - width)
+            ymin = (0.1 + i * 0.25) % (1.0 - height)
+            boxes.append((xmin, ymin, width, height))
+        return boxes
+
+    def __call__(self, pad, info, user_data=None):
+        buffer = info.get_buffer()
+        if buffer is None:
+            return Gst.PadProbeReturn.OK
+        if self.frames % self.every == 0:
+            roi = hailo.get_roi_from_buffer(buffer)
+            for box in self.make_boxes(self.frames):
+                roi.add_object(hailo.HailoDetection(hailo.HailoBBox(*box), self.label, self.confidence))
+                self.injected += 1
+        self.frames += 1
+        return Gst.PadProbeReturn.OK
@@ -0,0 +1,460 @@
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+import collections
+import cProfile
+import os
+import pstats
+import threading
+import time
+
+# -----------------------------------------------------------------------------------------------
+# Rolling statistics
+# -----------------------------------------------------------------------------------------------
+class RollingStats:
+    """
+    Keeps the last `window` samples of a measurement and reports percentiles over them.
+    """
+    def __init__(self, window=1000):
+        self.samples = collections.deque(maxlen=window)
+        self.count = 0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+
+    def percentile(self, q):
+        """
+        Returns the q-th percentile (0-100) of the samples in the window, or None if there are none.
+        """
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self):
+        """
+        Returns the sample count and the p50/p95/p99 percentiles as a dictionary.
+        """
+        return {
+            'count': self.count,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+# -----------------------------------------------------------------------------------------------
+# Per-element latency tracing
+# -----------------------------------------------------------------------------------------------
+class PipelineLatencyTracer:
+    """
+    Measures how long buffers take to reach each stage of a pipeline.
+
+    A buffer probe is attached to the src pad of every queue and of every named stage. Buffers are
+    identified by their PTS; the first probe that sees a PTS stamps it, and every later probe records
+    the time elapsed since then. Each stage therefore reports the latency from the most upstream probe
+    to that stage, and the jump between two consecutive stages is the time spent between them.
+
+    Nothing here depends on Hailo elements, so it works the same on a videotestsrc pipeline.
+    """
+    DEFAULT_STAGES = ('source', 'identity_callback', 'hailo_display')
+
+    def __init__(self, pipeline, stage_names=DEFAULT_STAGES, window=1000, max_age_seconds=5.0, max_tracked_buffers=512):
+        """
+        Args:
+            pipeline (Gst.Pipeline): The pipeline to trace.
+            stage_names (iterable, optional): Names of non-queue elements to trace as well. Defaults to DEFAULT_STAGES.
+            window (int, optional): Number of latency samples kept per stage. Defaults to 1000.
+            max_age_seconds (float, optional): A PTS first seen longer ago than this is treated as a new buffer,
+                e.g. after a file source rewinds. Defaults to 5.0.
+            max_tracked_buffers (int, optional): Maximum number of PTS stamps kept. Defaults to 512.
+        """
+        self.pipeline = pipeline
+        self.stage_names = set(stage_names)
+        self.window = window
+        self.max_age_ns = int(max_age_seconds * Gst.SECOND)
+        self.max_tracked_buffers = max_tracked_buffers
+        self.stages = collections.OrderedDict()
+        self._first_seen = collections.OrderedDict()
+        self._probes = []
+        self._lock = threading.Lock()
+
+    def _is_traced(self, element):
+        factory = element.get_factory()
+        if factory is not None and factory.get_name() == 'queue':
+            return True
+        return element.get_name() in self.stage_names
+
+    def attach(self):
+        """
+        Attaches the buffer probes. Returns the number of traced stages.
+        """
+        it = self.pipeline.iterate_recurse()
+        while True:
+            result, element = it.next()
+            if result != Gst.IteratorResult.OK:
+                break
+            if not self._is_traced(element):
+                continue
+            pad = element.get_static_pad('src')
+            if pad is None:
+                pad = element.get_static_pad('sink')
+            if pad is None:
+                continue
+            name = element.get_name()
+            self.stages[name] = RollingStats(self.window)
+            probe_id = pad.add_probe(Gst.PadProbeType.BUFFER, self._on_buffer, name)
+            self._probes.append((pad, probe_id))
+        return len(self.stages)
+
+    def detach(self):
+        for pad, probe_id in self._probes:
+            pad.remove_probe(probe_id)
+        self._probes = []
+
+    def _on_buffer(self, pad, info, name):
+        buffer = info.get_buffer()
+        if buffer is None or buffer.pts == Gst.CLOCK_TIME_NONE:
+            return Gst.PadProbeReturn.OK
+        now = time.monotonic_ns()
+        with self._lock:
+            first_seen = self._first_seen.get(buffer.pts)
+            if first_seen is None or now - first_seen > self.max_age_ns:
+                self._first_seen[buffer.pts] = now
+                self._first_seen.move_to_end(buffer.pts)
+                if len(self._first_seen) > self.max_tracked_buffers:
+                    self._first_seen.popitem(last=False)
+                first_seen = now
+            self.stages[name].add((now - first_seen) / 1e6)
+        return Gst.PadProbeReturn.OK
+
+    def get_stats(self):
+        """
+        Returns the latency summary of every stage that has seen buffers, in milliseconds,
+        ordered from the most upstream stage (lowest median latency) to the most downstream one.
+        """
+        with self._lock:
+            stats = {name: stage.summary() for name, stage in self.stages.items() if stage.count}
+        return collections.OrderedDict(sorted(stats.items(), key=lambda item: item[1]['p50']))
+
+    def format_stats(self):
+        return ', '.join(
+            f"{name} p50={s['p50']:.1f} p95={s['p95']:.1f} p99={s['p99']:.1f}"
+            for name, s in self.get_stats().items()
+        )
+
+    def log_stats(self):
+        """
+        Prints one line with the latency of every stage. Returns True so it can be used as a GLib timeout callback.
+        """
+        print(f"Latency (ms): {self.format_stats()}")
+        return True
+
+# -----------------------------------------------------------------------------------------------
+# Queue occupancy and backpressure monitoring
+# -----------------------------------------------------------------------------------------------
+def _upstream_elements(element):
+    """
+    Yields the elements directly upstream of element, looking through ghost pads of bins.
+    """
+    for pad in element.sinkpads:
+        peer = pad.get_peer()
+        while peer is not None:
+            if isinstance(peer, Gst.GhostPad):
+                peer = peer.get_target()
+                continue
+            parent = peer.get_parent()
+            if isinstance(parent, Gst.ProxyPad):
+                # Internal pad of a sink ghost pad; continue outside the bin
+                peer = parent.get_peer()
+                continue
+            if isinstance(parent, Gst.Element):
+                yield parent
+            break
+
+class QueueMonitor:
+    """
+    Samples the fill level of every queue in a pipeline from a background thread.
+
+    For each queue a rolling history of current-level-buffers and current-level-time is kept.
+    Queues are ordered from upstream to downstream by how many queues precede them. When a stage
+    cannot keep up, the queues in front of it fill up and the ones after it run empty, so the most
+    downstream persistently full queue marks the bottleneck: the element that reads from it.
+    """
+    FULL_FRACTION = 0.8  # A queue is persistently full if it was full in this fraction of samples
+
+    def __init__(self, pipeline, interval=0.1, history=600):
+        """
+        Args:
+            pipeline (Gst.Pipeline): The pipeline to monitor.
+            interval (float, optional): Seconds between samples. Defaults to 0.1.
+            history (int, optional): Number of samples kept per queue. Defaults to 600 (one minute at the default interval).
+        """
+        self.pipeline = pipeline
+        self.interval = interval
+        self.history = history
+        self.queues = collections.OrderedDict()
+        self.samples = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _find_queues(self):
+        queues = []
+        it = self.pipeline.iterate_recurse()
+        while True:
+            result, element = it.next()
+            if result != Gst.IteratorResult.OK:
+                break
+            factory = element.get_factory()
+            if factory is not None and factory.get_name() == 'queue':
+                queues.append(element)
+
+        depths = {}
+        def depth(element, seen=()):
+            if element in depths:
+                return depths[element]
+            upstream = [depth(parent, seen + (element,)) for parent in _upstream_elements(element) if parent not in seen]
+            value = max(upstream, default=0)
+            if element in queues:
+                value += 1
+            depths[element] = value
+            return value
+
+        return sorted(queues, key=depth)
+
+    def start(self):
+        """
+        Starts the sampling thread. Returns the number of monitored queues.
+        """
+        for queue in self._find_queues():
+            self.queues[queue.get_name()] = queue
+            self.samples[queue.get_name()] = collections.deque(maxlen=self.history)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return len(self.queues)
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """
+        Records the current level of every queue.
+        """
+        with self._lock:
+            for name, queue in self.queues.items():
+                level_buffers = queue.get_property('current-level-buffers')
+                level_time = queue.get_property('current-level-time')
+                max_buffers = queue.get_property('max-size-buffers')
+                max_time = queue.get_property('max-size-time')
+                if max_buffers > 0:
+                    full = level_buffers >= max_buffers
+                elif max_time > 0:
+                    full = level_time >= max_time
+                else:
+                    full = False
+                self.samples[name].append((level_buffers, level_time, full))
+
+    def get_stats(self):
+        """
+        Returns the occupancy summary of every queue, ordered from upstream to downstream.
+        """
+        stats = collections.OrderedDict()
+        with self._lock:
+            for name, samples in self.samples.items():
+                if not samples:
+                    continue
+                count = len(samples)
+                stats[name] = {
+                    'mean_buffers': sum(s[0] for s in samples) / count,
+                    'max_buffers': max(s[0] for s in samples),
+                    'max_time_ms': max(s[1] for s in samples) / 1e6,
+                    'full': sum(1 for s in samples if s[2]) / count,
+                    'empty': sum(1 for s in samples if s[0] == 0) / count,
+                }
+        return stats
+
+    def find_bottleneck(self, stats=None):
+        """
+        Returns the name of the most downstream persistently full queue that feeds a queue which is
+        not full, or None if no queue is persistently full.
+        """
+        stats = self.get_stats() if stats is None else stats
+        names = list(stats)
+        for index in range(len(names) - 1, -1, -1):
+            if stats[names[index]]['full'] < self.FULL_FRACTION:
+                continue
+            downstream = names[index + 1:]
+            if not downstream or any(stats[name]['full'] < self.FULL_FRACTION for name in downstream):
+                return names[index]
+        return None
+
+    def format_summary(self):
+        stats = self.get_stats()
+        lines = [
+            f"  {name}: mean {s['mean_buffers']:.1f} max {s['max_buffers']} buffers, "
+            f"max {s['max_time_ms']:.0f} ms, full {s['full']:.0%}, empty {s['empty']:.0%}"
+            for name, s in stats.items()
+        ]
+        bottleneck = self.find_bottleneck(stats)
+        if bottleneck is not None:
+            lines.append(f"  Bottleneck: the stage reading from {bottleneck}")
+        else:
+            lines.append("  No persistently full queue")
+        return '\n'.join(lines)
+
+    def log_stats(self):
+        """
+        Prints the current bottleneck. Returns True so it can be used as a GLib timeout callback.
+        """
+        print(f"Queue bottleneck: {self.find_bottleneck()}")
+        return True
+
+# -----------------------------------------------------------------------------------------------
+# Callback execution-time profiling
+# -----------------------------------------------------------------------------------------------
+class CallbackProfiler:
+    """
+    Wraps a pad probe callback and measures its wall time on every call.
+
+    The probe runs on the streaming thread, so any call that takes longer than one frame interval
+    (the frame budget) directly limits the pipeline throughput; those calls are counted as overruns.
+    Optionally every Nth call runs under cProfile, and the aggregated profile can be written on exit.
+    The wrapper has the same signature as the callback and can be passed to add_probe() in its place.
+    It can be shared by the probes of several streams, which run on different streaming threads.
+    """
+    def __init__(self, callback, fps=30, profile_every=0, window=1000):
+        """
+        Args:
+            callback (callable): The pad probe callback to wrap.
+            fps (float, optional): Expected frame rate; the frame budget is 1/fps. Defaults to 30.
+            profile_every (int, optional): Run every Nth call under cProfile. 0 disables profiling. Defaults to 0.
+            window (int, optional): Number of timing samples kept for the percentiles. Defaults to 1000.
+        """
+        self.callback = callback
+        self.frame_budget_ms = 1000.0 / fps
+        self.profile_every = profile_every
+        self.times = RollingStats(window)
+        self.overruns = 0
+        self.total_ms = 0.0
+        self.profiled_calls = 0
+        self.profiler = cProfile.Profile() if profile_every else None
+        self.lock = threading.Lock()
+        # cProfile must not be enabled from two threads at once
+        self.profiler_lock = threading.Lock()
+
+    def __call__(self, pad, info, user_data):
+        profile = (self.profiler is not None and self.times.count % self.profile_every == 0
+                   and self.profiler_lock.acquire(blocking=False))
+        start = time.perf_counter()
+        if profile:
+            self.profiler.enable()
+            try:
+                result = self.callback(pad, info, user_data)
+            finally:
+                self.profiler.disable()
+                self.profiled_calls += 1
+                self.profiler_lock.release()
+        else:
+            result = self.callback(pad, info, user_data)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.times.add(elapsed_ms)
+            self.total_ms += elapsed_ms
+            if elapsed_ms > self.frame_budget_ms:
+                self.overruns += 1
+        return result
+
+    def get_stats(self):
+        """
+        Returns the call count, mean/p50/p99 time in milliseconds and the number of frame budget overruns.
+        """
+        count = self.times.count
+        return {
+            'count': count,
+            'mean': self.total_ms / count if count else None,
+            'p50': self.times.percentile(50),
+            'p99': self.times.percentile(99),
+            'overruns': self.overruns,
+        }
+
+    def format_stats(self):
+        stats = self.get_stats()
+        if not stats['count']:
+            return "no calls"
+        return (f"{stats['count']} calls, mean {stats['mean']:.2f} ms, p50 {stats['p50']:.2f} ms, "
+                f"p99 {stats['p99']:.2f} ms, {stats['overruns']} over the {self.frame_budget_ms:.1f} ms budget")
+
+    def log_stats(self):
+        """
+        Prints one line with the callback timing. Returns True so it can be used as a GLib timeout callback.
+        """
+        print(f"Callback: {self.format_stats()}")
+        return True
+
+    def write_profile(self, path):
+        """
+        Writes the aggregated cProfile data of the profiled calls to path (readable with pstats or snakeviz).
+        Returns False if nothing was profiled.
+        """
+        if self.profiler is None or not self.profiled_calls:
+            return False
+        self.profiler.dump_stats(path)
+        return True
+
+    def print_profile(self, limit=15):
+        if self.profiler is not None and self.profiled_calls:
+            pstats.Stats(self.profiler).sort_stats('cumulative').print_stats(limit)
+
+# -----------------------------------------------------------------------------------------------
+# Benchmark report
+# -----------------------------------------------------------------------------------------------
+class PipelineBenchmark:
+    """
+    Measures throughput and CPU usage of the app over a fixed run, for comparing changes (e.g. in CI
+    with the null inference pipeline). CPU is the user + system time of this process, where 100% is one core.
+    """
+    def __init__(self):
+        self.start_time = None
+        self.start_cpu = None
+
+    @staticmethod
+    def cpu_seconds():
+        times = os.times()
+        return times.user + times.system
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.start_cpu = self.cpu_seconds()
+
+    def report(self, frames, callback_stats=None):
+        """
+        Returns the frames, elapsed seconds, fps and CPU percentage since start(), plus the callback
+        mean/p99 in milliseconds when the stats of a CallbackProfiler are given.
+        """
+        seconds = time.perf_counter() - self.start_time
+        report = {
+            'frames': frames,
+            'seconds': seconds,
+            'fps': frames / seconds if seconds > 0 else 0.0,
+            'cpu_percent': 100.0 * (self.cpu_seconds() - self.start_cpu) / seconds if seconds > 0 else 0.0,
+        }
+        if callback_stats is not None:
+            report['callback_mean_ms'] = callback_stats['mean']
+            report['callback_p99_ms'] = callback_stats['p99']
+        return report
+
+    @staticmethod
+    def format_report(report):
+        line = (f"{report['frames']} frames in {report['seconds']:.1f} s, {report['fps']:.1f} fps, "
+                f"CPU {report['cpu_percent']:.0f}%")
+        if report.get('callback_mean_ms') is not None:
+            line += f", callback mean {report['callback_mean_ms']:.2f} ms, p99 {report['callback_p99_ms']:.2f} ms"
+        return line
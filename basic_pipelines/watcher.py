@@ -7,7 +7,7 @@ import cv2
 import hailo
 from hailo_rpi_common import (
     get_caps_from_pad,
-    get_numpy_from_buffer,
+    get_converted_frame_from_buffer,
     app_callback_class,
 )
 from detection_pipeline import GStreamerDetectionApp
@@ -92,9 +92,10 @@ def app_callback(pad, info, user_data):
     # Get the caps from the pad
     format, width, height = get_caps_from_pad(pad)
     # If the user_data.use_frame is set to True, we can get the video frame from the buffer
+    # as BGR for cv2.imwrite, converted in one pass from RGB or a native YUV format
     frame = None
     if user_data.use_frame and format is not None and width is not None and height is not None:
-        frame = get_numpy_from_buffer(buffer, format, width, height)
+        frame = get_converted_frame_from_buffer(buffer, format, width, height)
     
     # Get the detections from the buffer
     roi = hailo.get_roi_from_buffer(buffer)
@@ -18,9 +18,17 @@ import time
 from astral import LocationInfo
 from astral.sun import sun
 import threading
-from gi.repository import Gst
+from gi.repository import Gst, GLib
 import os
+import sys
 from logger_config import logger  # Import the logger
+# The benchmark and the null inference come from basic_pipelines modules that do not depend on the Hailo app framework
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'basic_pipelines'))
+from pipeline_profiling import CallbackProfiler, PipelineBenchmark
+from null_inference import NULL_INFERENCE_PIPELINE, NullDetectionInjector
+from inference_roi import parse_inference_roi, ROI_INFERENCE_PIPELINE_WRAPPER, RoiDetectionRemapper
+from motion_gate import MotionGate
+from recording_branch import RECORDING_PIPELINE, RecordingBranch
 
 
 def SOURCE_PIPELINE(video_source, video_width=640, video_height=640, video_format='RGB', name='source', no_webcam_compression=False):
@@ -97,20 +105,29 @@ def get_screen_resolution():
     height = monitor.height
     return width, height
 
-def DISPLAY_PIPELINE(video_sink='xvimagesink', sync='true', show_fps='false', name='hailo_display'):
+def DISPLAY_PIPELINE(video_sink='xvimagesink', sync='true', show_fps='false', name='hailo_display', headless=False):
     """
     Creates a GStreamer pipeline string for displaying the video.
     It includes the hailooverlay plugin to draw bounding boxes and labels on the video.
+    In headless mode the overlay, scaling and conversion are left out, the frames go to a fakesink
+    and no monitor is queried.
 
     Args:
         video_sink (str, optional): The video sink element to use. Defaults to 'xvimagesink'.
         sync (str, optional): The sync property for the video sink. Defaults to 'true'.
         show_fps (str, optional): Whether to show the FPS on the video sink. Should be 'true' or 'false'. Defaults to 'false'.
         name (str, optional): The prefix name for the pipeline elements. Defaults to 'hailo_display'.
+        headless (bool, optional): Discard the frames instead of drawing and displaying them. Defaults to False.
 
     Returns:
         str: A string representing the GStreamer pipeline for displaying the video.
     """
+    if headless:
+        return (
+            f'{QUEUE(name=f"{name}_q")} ! '
+            f'fpsdisplaysink name={name} video-sink=fakesink sync={sync} text-overlay=false signal-fps-measurements=true '
+        )
+
     screen_width, screen_height = min(get_screen_resolution(), (1024, 1024))
 
     # Construct the display pipeline string
@@ -162,7 +179,30 @@ class GStreamerWatcherApp(GStreamerDetectionApp):
             default=None,
             help="Path to custom labels JSON file",
         )
+        parser.add_argument(
+            "--headless", action="store_true",
+            help="Run without a display: skip the overlay drawing, scaling and color conversion and discard the frames",
+        )
+        parser.add_argument(
+            "--null-inference", action="store_true",
+            help="Replace hailonet/hailofilter with a stage that injects synthetic detections, so the app runs without a Hailo device",
+        )
+        parser.add_argument(
+            "--null-detections", type=int, default=1,
+            help="Number of synthetic detections per frame with --null-inference",
+        )
+        parser.add_argument(
+            "--null-detection-every", type=int, default=1,
+            help="Inject the synthetic detections on every Nth frame with --null-inference",
+        )
+        parser.add_argument(
+            "--benchmark", type=float, default=None, metavar="SECONDS",
+            help="Run for SECONDS, log a benchmark report (fps, CPU, callback time) and exit",
+        )
         args = parser.parse_args()
+        self.null_inference = args.null_inference
+        self.headless = args.headless
+        self.benchmark_seconds = args.benchmark
         
         # Call the parent class constructor
         super().__init__(args, user_data)
@@ -173,7 +213,9 @@ class GStreamerWatcherApp(GStreamerDetectionApp):
         self.nms_iou_threshold = 0.45
 
         # Determine the architecture if not specified
-        if args.arch is None:
+        if args.null_inference:
+            self.arch = args.arch
+        elif args.arch is None:
             detected_arch = detect_hailo_arch()
             if detected_arch is None:
                 raise ValueError("Could not auto-detect Hailo architecture. Please specify --arch manually.")
@@ -200,11 +242,36 @@ class GStreamerWatcherApp(GStreamerDetectionApp):
         # Set the post-processing shared object file
         self.post_process_so = os.path.join(self.current_path, '../resources/libyolo_hailortpp_postprocess.so')
         self.post_function_name = "filter_letterbox"
+
+        # Only send the configured region of the frame to inference
+        config = getattr(user_data, 'config', {})
+        self.inference_roi = parse_inference_roi(config.get('INFERENCE_ROI'))
+        if self.inference_roi is not None:
+            logger.info(f"Inference ROI: {self.inference_roi}")
+            # The ROI is letterboxed in the pipeline and mapped back by RoiDetectionRemapper, so the plain filter is used
+            self.post_function_name = "filter"
+
+        # Skip inference while the scene is static
+        self.motion_gate = MotionGate(config, user_data) if config.get('MOTION_GATE', False) else None
+
+        # Record in a branch of the pipeline instead of from frames copied into Python
+        self.record_in_pipeline = config.get('SAVE_DETECTION_VIDEO', True) and config.get('VIDEO_BACKEND') == 'pipeline'
+        self.record_fps = config.get('FRAME_RATE', 30)
+        self.record_speed_preset = config.get('VIDEO_H264_PRESET', 'fast')
+        self.recording_branch = None
         
         # User-defined label JSON file
         self.labels_json = args.labels_json
 
         self.app_callback = app_callback
+        self.null_injector = None
+        if args.null_inference:
+            self.null_injector = NullDetectionInjector(args.null_detections, args.null_detection_every)
+        self.benchmark = None
+        self.callback_profiler = None
+        if args.benchmark:
+            self.callback_profiler = CallbackProfiler(app_callback)
+            self.app_callback = self.callback_profiler
 
         self.thresholds_str = (
             f"nms-score-threshold={self.nms_score_threshold} "
@@ -223,17 +290,31 @@ class GStreamerWatcherApp(GStreamerDetectionApp):
             str: The GStreamer pipeline string.
         """
         source_pipeline = SOURCE_PIPELINE(self.video_source, self.video_width, self.video_height)
-        detection_pipeline = INFERENCE_PIPELINE(
-            hef_path=self.hef_path,
-            post_process_so=self.post_process_so,
-            post_function_name=self.post_function_name,
-            batch_size=self.batch_size,
-            config_json=self.labels_json,
-            additional_params=self.thresholds_str)
-        detection_pipeline_wrapper = INFERENCE_PIPELINE_WRAPPER(detection_pipeline)
+        if self.null_inference:
+            detection_pipeline = NULL_INFERENCE_PIPELINE()
+        else:
+            detection_pipeline = INFERENCE_PIPELINE(
+                hef_path=self.hef_path,
+                post_process_so=self.post_process_so,
+                post_function_name=self.post_function_name,
+                batch_size=self.batch_size,
+                config_json=self.labels_json,
+                additional_params=self.thresholds_str)
+        if self.inference_roi is not None:
+            detection_pipeline_wrapper = ROI_INFERENCE_PIPELINE_WRAPPER(
+                detection_pipeline, self.inference_roi, self.video_width, self.video_height,
+                self.network_width, self.network_height)
+        else:
+            detection_pipeline_wrapper = INFERENCE_PIPELINE_WRAPPER(detection_pipeline)
         tracker_pipeline = TRACKER_PIPELINE(class_id=-1)
         user_callback_pipeline = USER_CALLBACK_PIPELINE()
-        display_pipeline = DISPLAY_PIPELINE(video_sink="xvimagesink", sync=self.sync, show_fps=self.show_fps)
+        display_pipeline = DISPLAY_PIPELINE(video_sink="xvimagesink", sync=self.sync, show_fps=self.show_fps, headless=self.headless)
+
+        if self.record_in_pipeline:
+            source_pipeline = f'{source_pipeline} ! tee name=record_tee'
+            recording_pipeline = f'record_tee. ! {RECORDING_PIPELINE(self.record_fps, self.record_speed_preset)}'
+        else:
+            recording_pipeline = ''
 
         pipeline_string = (
             f'{source_pipeline} ! '
@@ -241,6 +322,7 @@ class GStreamerWatcherApp(GStreamerDetectionApp):
             # f'{tracker_pipeline} ! '
             f'{user_callback_pipeline} ! '
             f'{display_pipeline}'
+            f'{recording_pipeline}'
         )
         logger.info(f"Pipeline: {pipeline_string}")
         return pipeline_string
@@ -272,18 +354,80 @@ class GStreamerWatcherApp(GStreamerDetectionApp):
 
     def on_eos(self):
         """Handle end-of-stream event."""
+        if self.motion_gate is not None:
+            self.motion_gate.log_stats()
         self.user_data.on_eos()
+        if self.recording_branch is not None and not self.recording_branch.wait_closed(10):
+            logger.warning("The last recording was not finished before exit")
         self.pipeline.set_state(Gst.State.NULL)
 
-        import sys
         os._exit(0)
 
+    def on_callback_event(self, pad, info):
+        """The idle recording sink never receives EOS, so the app ends on the EOS of the main branch."""
+        if info.get_event().type == Gst.EventType.EOS:
+            GLib.idle_add(self.on_eos)
+        return Gst.PadProbeReturn.OK
+
+    def end_benchmark(self):
+        """Log the benchmark report and stop the application."""
+        report = self.benchmark.report(self.callback_profiler.times.count, self.callback_profiler.get_stats())
+        logger.info(f"Benchmark: {PipelineBenchmark.format_report(report)}")
+        self.shutdown()
+        return False
 
     def run(self):
         """Run the watcher application."""
         # Proceed with the pipeline execution.
         self.user_data.pipeline = self.pipeline
         
+        # Inject synthetic detections in place of the Hailo inference.
+        if self.null_injector is not None:
+            null_inference = self.pipeline.get_by_name("inference_null")
+            if null_inference is None:
+                logger.warning("inference_null element not found, --null-inference needs a pipeline built with NULL_INFERENCE_PIPELINE")
+            else:
+                null_inference.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self.null_injector)
+
+        # Map the ROI detections back to full-frame coordinates.
+        if self.inference_roi is not None:
+            aggregator = self.pipeline.get_by_name("inference_wrapper_agg")
+            if aggregator is None:
+                logger.warning("inference_wrapper_agg element not found, the ROI detections are not mapped back to the frame")
+            else:
+                aggregator.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, RoiDetectionRemapper(
+                    self.inference_roi, self.video_width, self.video_height, self.network_width, self.network_height))
+
+        # Drop static frames before inference.
+        if self.motion_gate is not None:
+            wrapper_input = self.pipeline.get_by_name("inference_wrapper_input_q")
+            if wrapper_input is None:
+                logger.warning("inference_wrapper_input_q element not found, the motion gate is disabled")
+            else:
+                wrapper_input.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self.motion_gate)
+                GLib.timeout_add_seconds(60, self.motion_gate.log_stats)
+
+        # Report the pre-roll memory use and encode cost.
+        if getattr(self.user_data, 'pre_roll', None) is not None:
+            GLib.timeout_add_seconds(60, self.user_data.pre_roll.log_stats)
+
+        # Report the video conversion backlog.
+        if getattr(self.user_data, 'transcode_queue', None) is not None:
+            GLib.timeout_add_seconds(60, self.user_data.transcode_queue.log_stats)
+
+        # Record through the pipeline branch, controlled by WatcherBase.
+        if self.record_in_pipeline:
+            self.recording_branch = RecordingBranch(self.pipeline)
+            self.user_data.recording_branch = self.recording_branch
+            callback = self.pipeline.get_by_name("identity_callback")
+            callback.get_static_pad("src").add_probe(Gst.PadProbeType.EVENT_DOWNSTREAM, self.on_callback_event)
+
+        # Stop after the benchmark period.
+        if self.callback_profiler is not None:
+            self.benchmark = PipelineBenchmark()
+            self.benchmark.start()
+            GLib.timeout_add(int(self.benchmark_seconds * 1000), self.end_benchmark)
+
         # Start the active period monitor thread.
         monitor_thread = threading.Thread(target=self.monitor_active_period, daemon=True)
         monitor_thread.start()
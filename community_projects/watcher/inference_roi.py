@@ -0,0 +1,156 @@
+import math
+import os
+import hailo
+from gi.repository import Gst
+from hailo_apps_infra.gstreamer_helper_pipelines import QUEUE
+from logger_config import logger
+
+
+def parse_inference_roi(value):
+    """
+    Parse the INFERENCE_ROI config value into a normalized (x, y, width, height) rectangle.
+
+    The value is either one rectangle [x, y, width, height] or a list of rectangles (tiles), with all
+    coordinates as fractions of the frame. Tiles are merged into the rectangle that covers them all,
+    since the crop sent to inference is a single rectangle. Returns None when no ROI is configured
+    or the ROI covers the whole frame.
+    """
+    if not value:
+        return None
+    rectangles = value if isinstance(value[0], (list, tuple)) else [value]
+    for rectangle in rectangles:
+        if len(rectangle) != 4:
+            raise ValueError(f"INFERENCE_ROI rectangles must be [x, y, width, height]: {rectangle}")
+        x, y, width, height = rectangle
+        if width <= 0 or height <= 0 or x < 0 or y < 0 or x + width > 1 or y + height > 1:
+            raise ValueError(f"INFERENCE_ROI rectangles must lie inside the frame (0..1): {rectangle}")
+
+    x_min = min(rectangle[0] for rectangle in rectangles)
+    y_min = min(rectangle[1] for rectangle in rectangles)
+    x_max = max(rectangle[0] + rectangle[2] for rectangle in rectangles)
+    y_max = max(rectangle[1] + rectangle[3] for rectangle in rectangles)
+    if len(rectangles) > 1:
+        logger.info(f"INFERENCE_ROI tiles merged into ({x_min}, {y_min}, {x_max - x_min}, {y_max - y_min})")
+    if (x_min, y_min, x_max, y_max) == (0, 0, 1, 1):
+        return None
+    return (x_min, y_min, x_max - x_min, y_max - y_min)
+
+def get_roi_crop_geometry(roi, frame_width, frame_height, network_width, network_height):
+    """
+    Return the size the frame is resized to before cropping and the videocrop margins (left, right, top, bottom).
+
+    The frame is downscaled with the same factor in both directions, so the ROI keeps its aspect ratio, and only
+    as far as the ROI still fills the network input in its limiting direction. A small ROI keeps its full
+    detail while a large one is not copied at full resolution.
+    """
+    x, y, width, height = roi
+    scale = min(1.0, network_width / (width * frame_width), network_height / (height * frame_height))
+    scaled_width = min(frame_width, math.ceil(frame_width * scale))
+    scaled_height = min(frame_height, math.ceil(frame_height * scale))
+    # Even sizes keep the scaled frame valid for any raw format
+    scaled_width += scaled_width % 2
+    scaled_height += scaled_height % 2
+    left = round(x * scaled_width)
+    top = round(y * scaled_height)
+    right = max(0, scaled_width - left - round(width * scaled_width))
+    bottom = max(0, scaled_height - top - round(height * scaled_height))
+    return (scaled_width, scaled_height), (left, right, top, bottom)
+
+def get_roi_letterbox_geometry(crop_size, network_width, network_height):
+    """
+    Return the size the ROI crop is scaled to, keeping its aspect ratio, and the black borders
+    (left, right, top, bottom) that center it in the network input.
+    """
+    crop_width, crop_height = crop_size
+    scale = min(network_width / crop_width, network_height / crop_height)
+    # Even sizes keep the scaled crop valid for any raw format
+    content_width = min(network_width, 2 * max(1, round(crop_width * scale / 2)))
+    content_height = min(network_height, 2 * max(1, round(crop_height * scale / 2)))
+    left = (network_width - content_width) // 2
+    top = (network_height - content_height) // 2
+    return (content_width, content_height), (left, network_width - content_width - left, top, network_height - content_height - top)
+
+def ROI_INFERENCE_PIPELINE_WRAPPER(inner_pipeline, roi, frame_width, frame_height, network_width=640, network_height=640,
+                                   bypass_max_size_buffers=20, name='inference_wrapper'):
+    """
+    Creates a GStreamer pipeline string like INFERENCE_PIPELINE_WRAPPER that only sends the ROI to inference.
+
+    The hailocropper passes the whole frame (without letterbox) to the inner branch, where it is cropped
+    to the ROI, scaled to fit the network input with its aspect ratio kept and letterboxed with black
+    borders. The detections are relative to the letterboxed input until a RoiDetectionRemapper on the
+    {name}_agg src pad maps them back to full-frame coordinates.
+
+    Args:
+        inner_pipeline (str): The inference pipeline string to be wrapped.
+        roi (tuple): The normalized (x, y, width, height) region sent to inference.
+        frame_width (int): The width of the frames entering the wrapper.
+        frame_height (int): The height of the frames entering the wrapper.
+        network_width (int, optional): The network input width. Defaults to 640.
+        network_height (int, optional): The network input height. Defaults to 640.
+        bypass_max_size_buffers (int, optional): The maximum number of buffers for the bypass queue. Defaults to 20.
+        name (str, optional): The prefix name for the pipeline elements. Defaults to 'inference_wrapper'.
+
+    Returns:
+        str: A string representing the GStreamer pipeline for the ROI inference wrapper.
+    """
+    tappas_post_process_dir = os.environ.get('TAPPAS_POST_PROC_DIR', '')
+    whole_buffer_crop_so = os.path.join(tappas_post_process_dir, 'cropping_algorithms/libwhole_buffer.so')
+    (scaled_width, scaled_height), (left, right, top, bottom) = get_roi_crop_geometry(
+        roi, frame_width, frame_height, network_width, network_height)
+    (content_width, content_height), (pad_left, pad_right, pad_top, pad_bottom) = get_roi_letterbox_geometry(
+        (scaled_width - left - right, scaled_height - top - bottom), network_width, network_height)
+
+    # The ROI keeps its aspect ratio, as the full frame does with use-letterbox=true
+    roi_pipeline = (
+        f'video/x-raw, width={scaled_width}, height={scaled_height} ! '
+        f'videocrop name={name}_roi left={left} right={right} top={top} bottom={bottom} ! '
+        f'{QUEUE(name=f"{name}_roi_scale_q")} ! '
+        f'videoscale name={name}_roi_scale add-borders=false n-threads=2 ! '
+        f'video/x-raw, width={content_width}, height={content_height}, pixel-aspect-ratio=1/1 ! '
+        f'videobox name={name}_roi_letterbox left=-{pad_left} right=-{pad_right} top=-{pad_top} bottom=-{pad_bottom} fill=black '
+    )
+    roi_wrapper_pipeline = (
+        f'{QUEUE(name=f"{name}_input_q")} ! '
+        f'hailocropper name={name}_crop so-path={whole_buffer_crop_so} function-name=create_crops use-letterbox=false resize-method=inter-area internal-offset=true '
+        f'hailoaggregator name={name}_agg '
+        f'{name}_crop. ! {QUEUE(max_size_buffers=bypass_max_size_buffers, name=f"{name}_bypass_q")} ! {name}_agg.sink_0 '
+        f'{name}_crop. ! {roi_pipeline} ! {inner_pipeline} ! {name}_agg.sink_1 '
+        f'{name}_agg. ! {QUEUE(name=f"{name}_output_q")} '
+    )
+
+    return roi_wrapper_pipeline
+
+class RoiDetectionRemapper:
+    """
+    Pad probe that maps the detections of an ROI inference from the letterboxed network input back to the
+    full frame, so the overlay, WatcherBase centroids and saved boxes use frame coordinates. It uses the same
+    geometry as ROI_INFERENCE_PIPELINE_WRAPPER. The boxes are rescaled in place, so the tracker IDs,
+    classifications and landmarks attached to the detections are kept.
+    """
+    def __init__(self, roi, frame_width, frame_height, network_width=640, network_height=640):
+        (scaled_width, scaled_height), (left, right, top, bottom) = get_roi_crop_geometry(
+            roi, frame_width, frame_height, network_width, network_height)
+        crop_width, crop_height = scaled_width - left - right, scaled_height - top - bottom
+        (content_width, content_height), (pad_left, _, pad_top, _) = get_roi_letterbox_geometry(
+            (crop_width, crop_height), network_width, network_height)
+        # The crop in frame fractions and the scaled crop in network input fractions
+        self.crop = (left / scaled_width, top / scaled_height, crop_width / scaled_width, crop_height / scaled_height)
+        self.content = (pad_left / network_width, pad_top / network_height,
+                        content_width / network_width, content_height / network_height)
+
+    def map_bbox(self, xmin, ymin, width, height):
+        crop_x, crop_y, crop_width, crop_height = self.crop
+        content_x, content_y, content_width, content_height = self.content
+        scale_x, scale_y = crop_width / content_width, crop_height / content_height
+        return (crop_x + (xmin - content_x) * scale_x, crop_y + (ymin - content_y) * scale_y,
+                width * scale_x, height * scale_y)
+
+    def __call__(self, pad, info, user_data=None):
+        buffer = info.get_buffer()
+        if buffer is None:
+            return Gst.PadProbeReturn.OK
+        main_roi = hailo.get_roi_from_buffer(buffer)
+        for detection in main_roi.get_objects_typed(hailo.HAILO_DETECTION):
+            bbox = detection.get_bbox()
+            detection.set_bbox(hailo.HailoBBox(*self.map_bbox(bbox.xmin(), bbox.ymin(), bbox.width(), bbox.height())))
+        return Gst.PadProbeReturn.OK
@@ -0,0 +1,93 @@
+import os
+import sys
+import cv2
+import numpy as np
+from gi.repository import Gst
+from hailo_apps_infra.hailo_rpi_common import get_caps_from_pad
+# The frame helpers are shared with basic_pipelines
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'basic_pipelines'))
+from frame_buffers import mapped_frame
+from logger_config import logger
+
+
+class MotionGate:
+    """
+    Pad probe that drops frames of a static scene before they reach inference.
+
+    Each frame is downscaled to a small grayscale image and compared with the previous one. A frame is passed
+    on when enough pixels changed, for MOTION_HOLD_SECONDS after the last motion (so the WatcherBase debouncer
+    sees consecutive frames), while the watcher is actively tracking, or when nothing has been passed for
+    MOTION_KEEPALIVE_SECONDS. Times come from the buffer timestamps, so file inputs behave like live cameras.
+    """
+    def __init__(self, config, user_data=None):
+        self.user_data = user_data
+        self.pixel_threshold = config.get('MOTION_PIXEL_THRESHOLD', 25)
+        self.min_changed_fraction = config.get('MOTION_MIN_CHANGED_FRACTION', 0.002)
+        self.keepalive_ns = int(config.get('MOTION_KEEPALIVE_SECONDS', 5) * Gst.SECOND)
+        self.hold_ns = int(config.get('MOTION_HOLD_SECONDS', 1) * Gst.SECOND)
+        self.downscale_width = config.get('MOTION_DOWNSCALE_WIDTH', 160)
+
+        self.previous = None
+        self.last_motion_ns = None
+        self.last_passed_ns = None
+        self.frames_inferred = 0
+        self.frames_gated = 0
+
+    def get_small_gray(self, buffer, format, width, height):
+        """Return the downscaled, blurred grayscale image used for the frame difference."""
+        scale = self.downscale_width / width
+        size = (self.downscale_width, max(1, round(height * scale)))
+        with mapped_frame(buffer, format, width, height) as frame:
+            if format in ('YUYV', 'YUY2'):
+                # The luma is every other byte, no color conversion needed
+                small = cv2.resize(np.ascontiguousarray(frame[:, :, 0]), size, interpolation=cv2.INTER_AREA)
+            elif format in ('NV12', 'I420'):
+                # The first plane is the luma
+                small = cv2.resize(frame[0], size, interpolation=cv2.INTER_AREA)
+            else:
+                small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                small = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY if format == 'RGB' else cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def has_motion(self, small):
+        if self.previous is None or self.previous.shape != small.shape:
+            self.previous = small
+            return True
+        difference = cv2.absdiff(small, self.previous)
+        self.previous = small
+        changed = np.count_nonzero(difference > self.pixel_threshold)
+        return changed >= self.min_changed_fraction * difference.size
+
+    def should_infer(self, motion, timestamp_ns):
+        if motion:
+            self.last_motion_ns = timestamp_ns
+            return True
+        if self.user_data is not None and getattr(self.user_data, 'is_active_tracking', False):
+            return True
+        if self.last_motion_ns is not None and timestamp_ns - self.last_motion_ns < self.hold_ns:
+            return True
+        return self.last_passed_ns is None or timestamp_ns - self.last_passed_ns >= self.keepalive_ns
+
+    def __call__(self, pad, info, user_data=None):
+        buffer = info.get_buffer()
+        if buffer is None:
+            return Gst.PadProbeReturn.OK
+        format, width, height = get_caps_from_pad(pad)
+        if format is None or width is None or height is None:
+            return Gst.PadProbeReturn.OK
+
+        timestamp_ns = buffer.pts if buffer.pts != Gst.CLOCK_TIME_NONE else Gst.util_get_timestamp()
+        motion = self.has_motion(self.get_small_gray(buffer, format, width, height))
+        if self.should_infer(motion, timestamp_ns):
+            self.last_passed_ns = timestamp_ns
+            self.frames_inferred += 1
+            return Gst.PadProbeReturn.OK
+        self.frames_gated += 1
+        return Gst.PadProbeReturn.DROP
+
+    def log_stats(self):
+        """Log the gated vs. inferred counters. Returns True so it can be used as a GLib timeout callback."""
+        total = self.frames_inferred + self.frames_gated
+        gated_percent = 100.0 * self.frames_gated / total if total else 0.0
+        logger.info(f"Motion gate: {self.frames_inferred} frames inferred, {self.frames_gated} gated ({gated_percent:.1f}%)")
+        return True
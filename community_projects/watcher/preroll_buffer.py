@@ -0,0 +1,101 @@
+import collections
+import time
+import cv2
+import numpy as np
+from logger_config import logger
+
+
+class PreRollBuffer:
+    """
+    Ring buffer of the last PRE_ROLL_SECONDS of frames, kept as JPEG so a few seconds of video fit in a few MB.
+
+    Frames are added while the watcher is not tracking and flushed into the recording when tracking starts,
+    so the clip includes the arrival that happened during the CLASS_DETECTED_COUNT debounce. The oldest frames
+    are evicted when they are older than PRE_ROLL_SECONDS or when the buffer exceeds PRE_ROLL_MAX_BYTES.
+    """
+    def __init__(self, config):
+        self.seconds = config.get('PRE_ROLL_SECONDS', 0)
+        self.max_bytes = int(config.get('PRE_ROLL_MAX_BYTES', 16 * 1024 * 1024))
+        self.jpeg_quality = config.get('PRE_ROLL_JPEG_QUALITY', 80)
+
+        self.frames = collections.deque()  # (timestamp, jpeg bytes)
+        self.frame_size = None
+        self.bytes_used = 0
+        self.peak_bytes = 0
+        self.frames_encoded = 0
+        self.frames_evicted = 0
+        self.encode_seconds = 0.0
+        self.decode_seconds = 0.0
+
+    def add(self, frame, timestamp=None):
+        """
+        JPEG-encode a BGR frame into the buffer, evicting the oldest frames that are too old or over budget.
+        The timestamp is in seconds (the buffer PTS, or the arrival time when None). The buffer is emptied
+        when the timestamps go backwards.
+        """
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        frame_size = (frame.shape[1], frame.shape[0])
+        if frame_size != self.frame_size:
+            # Frames of another size could not be written to the same recording
+            self.clear()
+            self.frame_size = frame_size
+        elif self.frames and timestamp < self.frames[-1][0]:
+            # The timestamps restarted, e.g. a file input looped; the older frames are not followed by this one
+            self.clear()
+
+        start = time.perf_counter()
+        success, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        self.encode_seconds += time.perf_counter() - start
+        if not success:
+            return
+        self.frames_encoded += 1
+
+        jpeg = jpeg.tobytes()
+        self.frames.append((timestamp, jpeg))
+        self.bytes_used += len(jpeg)
+        while self.frames and (self.bytes_used > self.max_bytes or timestamp - self.frames[0][0] > self.seconds):
+            self.bytes_used -= len(self.frames.popleft()[1])
+            self.frames_evicted += 1
+        self.peak_bytes = max(self.peak_bytes, self.bytes_used)
+
+    def drain(self):
+        """
+        Empty the buffer and return an iterator over its frames, oldest first, decoded back to BGR.
+
+        The frames are only decoded as the iterator is consumed, which may happen on another thread.
+        """
+        frames, self.frames = self.frames, collections.deque()
+        self.bytes_used = 0
+        return self.decode_frames(frames)
+
+    def decode_frames(self, frames):
+        for _, jpeg in frames:
+            start = time.perf_counter()
+            frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            self.decode_seconds += time.perf_counter() - start
+            if frame is not None:
+                yield frame
+
+    def clear(self):
+        self.frames.clear()
+        self.bytes_used = 0
+
+    def get_stats(self):
+        return {
+            'frames': len(self.frames),
+            'seconds': self.frames[-1][0] - self.frames[0][0] if self.frames else 0.0,
+            'bytes_used': self.bytes_used,
+            'peak_bytes': self.peak_bytes,
+            'frames_evicted': self.frames_evicted,
+            'encode_mean_ms': 1000.0 * self.encode_seconds / self.frames_encoded if self.frames_encoded else 0.0,
+            'decode_seconds': self.decode_seconds,
+        }
+
+    def log_stats(self):
+        """Log the memory use and encode cost. Returns True so it can be used as a GLib timeout callback."""
+        stats = self.get_stats()
+        logger.info(
+            f"Pre-roll: {stats['frames']} frames ({stats['seconds']:.1f} s), "
+            f"{stats['bytes_used'] / 1e6:.1f} MB (peak {stats['peak_bytes'] / 1e6:.1f} MB, budget {self.max_bytes / 1e6:.1f} MB), "
+            f"{stats['frames_evicted']} evicted, encode mean {stats['encode_mean_ms']:.2f} ms")
+        return True
@@ -0,0 +1,170 @@
+import os
+import threading
+from gi.repository import Gst, GLib
+from hailo_apps_infra.gstreamer_helper_pipelines import QUEUE
+from video_writer import H264_ENCODE_PIPELINE
+from logger_config import logger
+
+
+def RECORDING_PIPELINE(fps=30, speed_preset='fast', max_size_buffers=10, name='record'):
+    """
+    Creates a GStreamer pipeline string for a recording branch fed from a tee: a leaky queue, a valve
+    (closed until a recording starts), an H.264 encode and a splitmuxsink that writes a faststart MP4.
+
+    Args:
+        fps (int, optional): The frame rate, used for the keyframe interval. Defaults to 30.
+        speed_preset (str, optional): The x264 speed preset. Defaults to 'fast'.
+        max_size_buffers (int, optional): Frames queued for the encoder before the oldest is dropped. Defaults to 10.
+        name (str, optional): The prefix name for the pipeline elements. Defaults to 'record'.
+
+    Returns:
+        str: A string representing the GStreamer pipeline for the recording branch.
+    """
+    return (
+        f'{QUEUE(name=f"{name}_q", max_size_buffers=max_size_buffers, leaky="downstream")} ! '
+        f'valve name={name}_valve drop=true ! '
+        f'{H264_ENCODE_PIPELINE(fps, speed_preset, name=name)} ! '
+        f'splitmuxsink name={name}_sink max-size-time=0 max-size-bytes=0'
+    )
+
+class RecordingBranch:
+    """
+    Controls the RECORDING_PIPELINE branch, so WatcherBase records without copying frames into Python.
+
+    start() is called from the streaming thread, so it only marks the recording active and leaves resetting
+    the encoder and sink to a new file and opening the valve to the main loop. stop() closes the valve and
+    ends the file with an EOS through the encoder; the EOS is sent from the branch's streaming thread, so no
+    buffer can reach the encoder after it. Once splitmuxsink reports the file closed, it is renamed to
+    its final name (or deleted). The encoder and sink are kept out of the pipeline state changes and only
+    run while recording.
+    """
+    def __init__(self, pipeline, name='record'):
+        self.valve = pipeline.get_by_name(f'{name}_valve')
+        self.sink = pipeline.get_by_name(f'{name}_sink')
+        self.encode_elements = [pipeline.get_by_name(f'{name}_{element}') for element in ('convert', 'encoder', 'parse')]
+        self.encode_elements.append(self.sink)
+
+        muxer = Gst.ElementFactory.make('mp4mux', f'{name}_mux')
+        muxer.set_property('faststart', True)
+        self.sink.set_property('muxer', muxer)
+        for element in self.encode_elements:
+            element.set_locked_state(True)
+
+        self.lock = threading.Lock()
+        self.active = False  # Between start() and stop()
+        self.opened = False  # The encoder and sink run on the current file
+        self.eos_pending = False
+        self.eos_sent = True
+        self.final_filename = None
+        self.closed_location = None
+        self.closed = threading.Event()
+        self.closed.set()
+
+        self.valve.get_static_pad('sink').add_probe(
+            Gst.PadProbeType.BUFFER | Gst.PadProbeType.EVENT_DOWNSTREAM, self.on_valve_input)
+        bus = pipeline.get_bus()
+        bus.enable_sync_message_emission()
+        bus.connect('sync-message::element', self.on_sync_message)
+
+    @property
+    def is_recording(self):
+        return self.active
+
+    def start(self, filename):
+        """
+        Start recording to filename; the file is opened on the main loop. Returns False, without starting,
+        while the previous recording is still being finished.
+        """
+        with self.lock:
+            if self.active or not self.closed.is_set():
+                logger.warning("Recording branch: the previous recording is still running or being finished, not starting a new one")
+                return False
+            self.closed.clear()
+            self.active = True
+            self.opened = False
+            self.eos_sent = False
+            self.eos_pending = False
+            self.final_filename = None
+        GLib.idle_add(self.open, filename)
+        return True
+
+    def open(self, filename):
+        """Restart the encoder and sink on filename and open the valve. Runs on the main loop."""
+        with self.lock:
+            if not self.active:
+                # stop() came before the file was opened, there is nothing to finish
+                self.eos_pending = False
+                self.eos_sent = True
+                self.closed.set()
+                logger.info(f"Recording stopped before {filename} was opened")
+                return False
+
+        # Restart the encoder and sink from scratch for the new file
+        for element in self.encode_elements:
+            element.set_state(Gst.State.NULL)
+        self.sink.set_property('location', filename)
+        for element in reversed(self.encode_elements):
+            element.sync_state_with_parent()
+
+        # The restarted encoder needs the stream events the valve received before it
+        encode_input = self.encode_elements[0].get_static_pad('sink')
+        valve_input = self.valve.get_static_pad('sink')
+        for event_type in (Gst.EventType.STREAM_START, Gst.EventType.CAPS, Gst.EventType.SEGMENT):
+            event = valve_input.get_sticky_event(event_type, 0)
+            if event is not None:
+                encode_input.send_event(event)
+        self.valve.set_property('drop', False)
+        with self.lock:
+            self.opened = True
+        return False
+
+    def truncate(self):
+        """Stop writing frames to the current recording; the file is still finished by stop()."""
+        self.valve.set_property('drop', True)
+
+    def stop(self, final_filename):
+        """Finish the recording and rename it to final_filename once it is closed, or delete it if None."""
+        with self.lock:
+            if not self.active:
+                return
+            self.active = False
+            self.final_filename = final_filename
+            self.eos_pending = not self.eos_sent
+            self.finish()
+
+    def wait_closed(self, timeout=None):
+        """Wait for the last recording to be closed and renamed. Returns False on timeout."""
+        return self.closed.wait(timeout)
+
+    def on_valve_input(self, pad, info, user_data=None):
+        """Send the EOS that ends a recording, on the first buffer after stop() or at the end of the stream."""
+        end_of_stream = bool(info.type & Gst.PadProbeType.EVENT_DOWNSTREAM) and info.get_event().type == Gst.EventType.EOS
+        with self.lock:
+            if not self.opened or not (self.eos_pending or (end_of_stream and self.active)):
+                return Gst.PadProbeReturn.OK
+            self.eos_pending = False
+            self.eos_sent = True
+        self.valve.set_property('drop', True)
+        self.encode_elements[0].get_static_pad('sink').send_event(Gst.Event.new_eos())
+        return Gst.PadProbeReturn.DROP
+
+    def on_sync_message(self, bus, message):
+        structure = message.get_structure()
+        if message.src != self.sink or structure is None or structure.get_name() != 'splitmuxsink-fragment-closed':
+            return
+        with self.lock:
+            self.closed_location = structure.get_string('location')
+            self.finish()
+
+    def finish(self):
+        """Rename or delete the closed file once both the file is closed and stop() gave its name."""
+        if self.closed_location is None or self.active:
+            return
+        if self.final_filename is None:
+            os.remove(self.closed_location)
+            logger.info(f"Recording deleted: {self.closed_location}")
+        else:
+            os.rename(self.closed_location, self.final_filename)
+            logger.info(f"Video saved as {self.final_filename}")
+        self.closed_location = None
+        self.closed.set()
@@ -0,0 +1,52 @@
+"""
+Motion gate report - Runs the watcher MotionGate over a video file and reports how many frames
+would have been sent to inference. Use it to tune the MOTION_* config values without a camera or a Hailo.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from motion_gate import MotionGate
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Report the frames the watcher motion gate passes to inference.')
+    parser.add_argument('--input', required=True, help='Video file to run the motion gate over')
+    parser.add_argument('--config', default=None, help='Watcher config.json with the MOTION_* values (default: built-in defaults)')
+    parser.add_argument('--width', type=int, default=1280, help='Frame width, as produced by the watcher source pipeline (default: 1280)')
+    parser.add_argument('--height', type=int, default=720, help='Frame height, as produced by the watcher source pipeline (default: 720)')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    config = {}
+    if args.config:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+
+    Gst.init(None)
+    pipeline = Gst.parse_launch(
+        f'filesrc location="{args.input}" ! decodebin ! videoscale ! videoconvert ! '
+        f'video/x-raw, format=RGB, width={args.width}, height={args.height}, pixel-aspect-ratio=1/1 ! '
+        'identity name=gate ! fakesink sync=false')
+    gate = MotionGate(config)
+    pipeline.get_by_name('gate').get_static_pad('sink').add_probe(Gst.PadProbeType.BUFFER, gate)
+
+    pipeline.set_state(Gst.State.PLAYING)
+    message = pipeline.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    if message.type == Gst.MessageType.ERROR:
+        err, debug = message.parse_error()
+        print(f"Error: {err}, {debug}")
+        sys.exit(1)
+    gate.log_stats()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Recording benchmark - Measures the CPU cost of the watcher video backends in CPU-seconds per recorded minute.
+
+The 'opencv' backend records mp4v and then re-encodes the file with ffmpeg, the 'gstreamer' backend encodes
+H.264 in a single pass. Frames are read from --input (looped) or generated, and held in memory so the
+measurement only covers the encoding.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from video_writer import VIDEO_BACKENDS, create_video_writer, ffmpeg_h264_command
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Measure the CPU-seconds per recorded minute of the watcher video backends.')
+    parser.add_argument('--input', default=None, help='Video file to take the frames from (default: generated frames)')
+    parser.add_argument('--seconds', type=float, default=60, help='Length of the recording (default: 60)')
+    parser.add_argument('--fps', type=int, default=30, help='Frame rate of the recording (default: 30)')
+    parser.add_argument('--width', type=int, default=1280, help='Frame width (default: 1280)')
+    parser.add_argument('--height', type=int, default=720, help='Frame height (default: 720)')
+    parser.add_argument('--cached-frames', type=int, default=90, help='Frames held in memory and looped (default: 90)')
+    parser.add_argument('--preset', default='fast', help='x264 speed preset of both backends (default: fast)')
+    parser.add_argument('--backend', choices=VIDEO_BACKENDS, action='append', help='Backend to measure, repeatable (default: all)')
+    return parser.parse_args()
+
+def load_frames(args):
+    """Return the frames to record, read from the input file or generated."""
+    if args.input is None:
+        # A moving gradient, so the encoder has motion to work on
+        gradient = np.tile(np.linspace(0, 255, args.width, dtype=np.uint8), (args.height, 1))
+        return [cv2.cvtColor(np.roll(gradient, 8 * i, axis=1), cv2.COLOR_GRAY2BGR) for i in range(args.cached_frames)]
+    frames = []
+    capture = cv2.VideoCapture(args.input)
+    while len(frames) < args.cached_frames:
+        success, frame = capture.read()
+        if not success:
+            break
+        frames.append(cv2.resize(frame, (args.width, args.height)))
+    capture.release()
+    if not frames:
+        raise ValueError(f"No frames could be read from {args.input}")
+    return frames
+
+def cpu_seconds():
+    """CPU time of this process and of its finished child processes (ffmpeg)."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def record(backend, frames, frame_count, args, directory):
+    """Record frame_count frames with the backend and return (CPU seconds, wall seconds, output size)."""
+    recording = os.path.join(directory, f'{backend}.m4v')
+    start_cpu, start_time = cpu_seconds(), time.perf_counter()
+
+    writer = create_video_writer(backend, recording, args.fps, (args.width, args.height), args.preset)
+    for i in range(frame_count):
+        writer.write(frames[i % len(frames)])
+    writer.release()
+    if backend == 'opencv':
+        output = os.path.join(directory, f'{backend}.mp4')
+        subprocess.run(ffmpeg_h264_command(recording, output, args.preset), check=True, capture_output=True)
+    else:
+        output = recording
+
+    return cpu_seconds() - start_cpu, time.perf_counter() - start_time, os.path.getsize(output)
+
+def main():
+    args = parse_args()
+    Gst.init(None)
+    frames = load_frames(args)
+    frame_count = int(args.seconds * args.fps)
+    minutes = frame_count / args.fps / 60
+
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in args.backend or VIDEO_BACKENDS:
+            cpu, wall, size = record(backend, frames, frame_count, args, directory)
+            print(f"{backend}: {cpu / minutes:.1f} CPU-seconds per recorded minute, "
+                  f"{wall:.1f} s until the H.264 file is ready, {size / 1e6:.1f} MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+from video_writer import ffmpeg_h264_command
+from logger_config import logger
+
+
+class TranscodeQueue:
+    """
+    Converts the mp4v event videos to H.264 with ffmpeg on a fixed number of worker threads at low priority,
+    so a burst of events does not start an encode per event and starve the pipeline.
+
+    Pending videos are kept in a JSON journal next to the recordings. A video leaves the journal only once
+    its conversion finished, so conversions cut short by an exit are resumed the next time the app starts.
+    """
+    def __init__(self, journal_path, max_concurrency=1, nice=10, preset='fast'):
+        self.journal_path = journal_path
+        self.nice = nice
+        self.preset = preset
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.pending = []  # Videos queued or being converted, as in the journal
+
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.transcode_seconds = 0.0
+        self.max_queue_length = 0
+
+        for _ in range(max_concurrency):
+            threading.Thread(target=self.work, daemon=True).start()
+        self.resume()
+
+    def resume(self):
+        """Queue the conversions left in the journal by the previous run."""
+        if not os.path.exists(self.journal_path):
+            return
+        try:
+            with open(self.journal_path, 'r') as journal:
+                pending = json.load(journal)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read the transcode journal {self.journal_path}: {e}")
+            return
+        pending = [video_path for video_path in pending if os.path.exists(video_path)]
+        if pending:
+            logger.info(f"Resuming {len(pending)} pending video conversions")
+        for video_path in pending:
+            self.submit(video_path)
+        if not pending:
+            with self.lock:
+                self.write_journal()
+
+    def submit(self, video_path):
+        """Queue the conversion of an .m4v video to an H.264 .mp4."""
+        with self.lock:
+            if video_path in self.pending:
+                return
+            self.pending.append(video_path)
+            self.max_queue_length = max(self.max_queue_length, len(self.pending))
+            self.write_journal()
+        self.queue.put((video_path, time.perf_counter()))
+
+    def write_journal(self):
+        """Write the pending videos to the journal; called with the lock held."""
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        temp_path = self.journal_path + '.tmp'
+        with open(temp_path, 'w') as journal:
+            json.dump(self.pending, journal)
+        os.replace(temp_path, self.journal_path)
+
+    def work(self):
+        while True:
+            video_path, queued_time = self.queue.get()
+            start = time.perf_counter()
+            try:
+                success = self.transcode(video_path)
+            except Exception as e:
+                # The video must still leave pending, or the worker is lost and drain() waits forever
+                logger.error(f"Failed to convert video {video_path} to H264: {e}")
+                success = False
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.pending.remove(video_path)
+                self.write_journal()
+                if success:
+                    self.jobs_done += 1
+                    self.transcode_seconds += elapsed
+                else:
+                    self.jobs_failed += 1
+                queue_length = len(self.pending)
+                self.idle.notify_all()
+            if success:
+                logger.info(f"Converted {video_path} to H264 in {elapsed:.1f} s after {start - queued_time:.1f} s in the queue, "
+                            f"{queue_length} conversions left")
+
+    def transcode(self, video_path):
+        """Convert video to H264 format using ffmpeg, at low priority. Returns True on success."""
+        temp_path = video_path + ".temp.mp4"
+        final_path = video_path.replace('.m4v', '.mp4')  # Final path with .mp4 extension
+        try:
+            command = ['nice', '-n', str(self.nice)] + ffmpeg_h264_command(video_path, temp_path, self.preset)
+            subprocess.run(command, check=True, capture_output=True)
+
+            # Replace original .m4v file with converted .mp4 file
+            os.replace(temp_path, final_path)
+            # Remove the original .m4v file
+            os.remove(video_path)
+            return True
+        except (subprocess.CalledProcessError, OSError) as e:
+            logger.error(f"Failed to convert video {video_path} to H264: {e}")
+            # Clean up temp file if it exists
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+
+    def drain(self, timeout=None):
+        """Wait for the queued conversions to finish. Returns False if some are still pending after timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            while self.pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.idle.wait(remaining)
+        return True
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'queue_length': len(self.pending),
+                'max_queue_length': self.max_queue_length,
+                'jobs_done': self.jobs_done,
+                'jobs_failed': self.jobs_failed,
+                'transcode_mean_seconds': self.transcode_seconds / self.jobs_done if self.jobs_done else 0.0,
+            }
+
+    def log_stats(self):
+        """Log the queue length and conversion times. Returns True so it can be used as a GLib timeout callback."""
+        stats = self.get_stats()
+        logger.info(
+            f"Transcode queue: {stats['queue_length']} pending (max {stats['max_queue_length']}), "
+            f"{stats['jobs_done']} converted, {stats['jobs_failed']} failed, mean {stats['transcode_mean_seconds']:.1f} s")
+        return True
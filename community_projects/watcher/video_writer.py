@@ -0,0 +1,194 @@
+import queue
+import threading
+import time
+import cv2
+from gi.repository import Gst
+from logger_config import logger
+
+DROP_POLICIES = ('newest', 'oldest', 'block')
+VIDEO_BACKENDS = ('opencv', 'gstreamer')
+
+def ffmpeg_h264_command(input_path, output_path, preset='fast'):
+    """Return the ffmpeg command that re-encodes an mp4v recording to a faststart H.264 MP4."""
+    return [
+        'ffmpeg',
+        '-y',  # Overwrite output file if it exists
+        '-i', input_path,
+        '-codec:v', 'libx264',  # Use H264 codec
+        '-preset', preset,
+        '-movflags', 'faststart',  # Optimize for web playback
+        output_path
+    ]
+
+def H264_ENCODE_PIPELINE(fps=30, speed_preset='fast', name='h264'):
+    """
+    Creates a GStreamer pipeline string that encodes raw video to parsed H.264 for an MP4 muxer.
+
+    x264enc runs in constant quality mode at quantizer 23, which is close to the ffmpeg libx264 default (CRF 23).
+
+    Args:
+        fps (int, optional): The frame rate, used for the keyframe interval. Defaults to 30.
+        speed_preset (str, optional): The x264 speed preset. Defaults to 'fast'.
+        name (str, optional): The prefix name for the pipeline elements. Defaults to 'h264'.
+
+    Returns:
+        str: A string representing the GStreamer pipeline for the H.264 encode.
+    """
+    return (
+        f'videoconvert name={name}_convert n-threads=2 ! video/x-raw,format=I420 ! '
+        f'x264enc name={name}_encoder speed-preset={speed_preset} pass=qual quantizer=23 key-int-max={fps * 2} ! '
+        f'video/x-h264,profile=main ! h264parse name={name}_parse'
+    )
+
+class GstH264VideoWriter:
+    """
+    VideoWriter-like writer that encodes BGR frames to a faststart H.264 MP4 in a single pass,
+    with appsrc ! x264enc ! mp4mux, so the recording does not need the ffmpeg re-encode.
+    """
+    def __init__(self, filename, fps, frame_size, speed_preset='fast'):
+        width, height = frame_size
+        self.frame_duration = Gst.util_uint64_scale_int(Gst.SECOND, 1, fps)
+        self.frame_count = 0
+        self.pipeline = Gst.parse_launch(
+            f'appsrc name=src format=time block=true max-bytes={width * height * 3 * 4} '
+            f'caps=video/x-raw,format=BGR,width={width},height={height},framerate={fps}/1 ! '
+            f'{H264_ENCODE_PIPELINE(fps, speed_preset)} ! '
+            f'mp4mux faststart=true ! filesink location="{filename}"'
+        )
+        self.appsrc = self.pipeline.get_by_name('src')
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def write(self, frame):
+        buffer = Gst.Buffer.new_wrapped(frame.tobytes())
+        buffer.pts = self.frame_count * self.frame_duration
+        buffer.duration = self.frame_duration
+        self.frame_count += 1
+        self.appsrc.emit('push-buffer', buffer)
+
+    def release(self):
+        """Finish the file: send EOS and wait for mp4mux to write the index."""
+        self.appsrc.emit('end-of-stream')
+        message = self.pipeline.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        if message is not None and message.type == Gst.MessageType.ERROR:
+            err, debug = message.parse_error()
+            logger.error(f"H.264 recording failed: {err}, {debug}")
+        self.pipeline.set_state(Gst.State.NULL)
+
+def create_video_writer(backend, filename, fps, frame_size, speed_preset='fast'):
+    """Create the writer for the VIDEO_BACKEND: 'opencv' (mp4v, re-encoded later) or 'gstreamer' (H.264 in one pass)."""
+    if backend == 'gstreamer':
+        return GstH264VideoWriter(filename, fps, frame_size, speed_preset)
+    if backend == 'opencv':
+        return cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'mp4v'), fps, frame_size)
+    raise ValueError(f"Unknown video backend '{backend}', expected one of: {', '.join(VIDEO_BACKENDS)}")
+
+class FrameQueue(queue.Queue):
+    """Bounded queue of frames and frame batches, where the oldest single frame can be evicted."""
+    def evict_oldest_frame(self):
+        """Remove the oldest queued frame, leaving the batches in place. Returns False if there is none."""
+        with self.mutex:
+            for index, item in enumerate(self.queue):
+                if hasattr(item, 'shape'):
+                    del self.queue[index]
+                    self.not_full.notify()
+                    return True
+            return False
+
+class ThreadedVideoWriter:
+    """
+    Runs a video writer (cv2.VideoWriter or GstH264VideoWriter) on its own thread, fed through a bounded queue,
+    so the encode time is not charged to the GStreamer streaming thread that calls write().
+
+    When the queue is full, the drop policy decides what happens: 'newest' drops the frame being written,
+    'oldest' drops the oldest queued frame to make room, and 'block' waits for the writer thread (no frame
+    is lost but the caller stalls, as with a plain VideoWriter). Batches queued with write_batch() are
+    never dropped. release() writes everything still queued before closing the file, so the file is
+    complete once it returns.
+    """
+    def __init__(self, writer, max_queue_size=60, drop_policy='newest'):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{drop_policy}', expected one of: {', '.join(DROP_POLICIES)}")
+        self.drop_policy = drop_policy
+        self.writer = writer
+        self.queue = FrameQueue(maxsize=max_queue_size)
+
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.frames_failed = 0
+        self.max_queue_depth = 0
+        self.encode_seconds = 0.0
+
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def write(self, frame):
+        """Queue a frame. Returns False if it was dropped."""
+        if self.drop_policy == 'block':
+            self.queue.put(frame)
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(frame)
+                    break
+                except queue.Full:
+                    # The 'oldest' policy falls back to dropping the new frame when only batches are queued
+                    if self.drop_policy == 'newest' or not self.queue.evict_oldest_frame():
+                        self.frames_dropped += 1
+                        return False
+                    self.frames_dropped += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return True
+
+    def write_batch(self, frames):
+        """
+        Queue an iterable of frames, written in order as one queue entry so they are consumed on the writer thread.
+        A batch is never dropped: it waits for room in the queue, and the 'oldest' policy only evicts single frames.
+        """
+        self.queue.put(frames)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    def write_loop(self):
+        # A failure must not stop the loop, or the queue stops draining and release() hangs
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                for frame in ([item] if hasattr(item, 'shape') else item):
+                    self.write_frame(frame)
+            except Exception as e:
+                logger.error(f"Video writer: could not read the queued frames: {e}")
+
+    def write_frame(self, frame):
+        start = time.perf_counter()
+        try:
+            self.writer.write(frame)
+        except Exception as e:
+            if not self.frames_failed:
+                logger.error(f"Video writer: writing a frame failed: {e}")
+            self.frames_failed += 1
+            return
+        self.encode_seconds += time.perf_counter() - start
+        self.frames_written += 1
+
+    def release(self):
+        """Write the queued frames, then close the file."""
+        start = time.perf_counter()
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.release()
+        stats = self.get_stats()
+        logger.info(
+            f"Video writer: {stats['frames_written']} frames written, {stats['frames_dropped']} dropped, {stats['frames_failed']} failed, "
+            f"max queue depth {stats['max_queue_depth']}/{self.queue.maxsize}, encode mean {stats['encode_mean_ms']:.2f} ms, "
+            f"drained in {1000.0 * (time.perf_counter() - start):.0f} ms")
+
+    def get_stats(self):
+        return {
+            'frames_written': self.frames_written,
+            'frames_dropped': self.frames_dropped,
+            'frames_failed': self.frames_failed,
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'encode_mean_ms': 1000.0 * self.encode_seconds / self.frames_written if self.frames_written else 0.0,
+        }
@@ -4,16 +4,20 @@ import json
 import cv2
 import numpy as np
 import datetime
-import subprocess
 import threading
 import hailo
 from hailo_apps_infra.hailo_rpi_common import (
     get_caps_from_pad,
-    get_numpy_from_buffer,
     app_callback_class,
 )
 from gi.repository import Gst
 from geometry import Point2D
+# The frame helpers are shared with basic_pipelines
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'basic_pipelines'))
+from frame_buffers import get_converted_frame_from_buffer
+from preroll_buffer import PreRollBuffer
+from video_writer import ThreadedVideoWriter, create_video_writer
+from transcode_queue import TranscodeQueue
 from logger_config import logger  # Import the shared logger
 import gtts
 from playsound import playsound
@@ -50,6 +54,10 @@ class WatcherBase(app_callback_class):
         self.logger.info(f"Using output directory: {self.output_directory}")
         
         self.max_video_seconds = config.get('VIDEO_MAX_SECONDS', 30)
+        self.video_queue_size = config.get('VIDEO_QUEUE_SIZE', 60)
+        self.video_drop_policy = config.get('VIDEO_DROP_POLICY', 'newest')
+        self.video_backend = config.get('VIDEO_BACKEND', 'opencv')
+        self.video_h264_preset = config.get('VIDEO_H264_PRESET', 'fast')
         self.daytime_only = config.get('DAYTIME_ONLY', False)
         
         # Add field for HEF model name
@@ -88,13 +96,34 @@ class WatcherBase(app_callback_class):
         self.video_start_time = None
         self.video_truncated = False  # Flag to log truncation once
         self.tracking_start_time = None  # Track when active tracking starts
+
+        # GStreamer recording branch, set by the app when VIDEO_BACKEND is 'pipeline'
+        self.recording_branch = None
+
+        # Conversions of the mp4v recordings to H264, limited to TRANSCODE_MAX_CONCURRENCY at a time
+        self.transcode_queue = None
+        self.transcode_drain_seconds = config.get('TRANSCODE_DRAIN_SECONDS', 120)
+        if self.save_detection_video and self.video_backend == 'opencv':
+            self.transcode_queue = TranscodeQueue(
+                os.path.join(self.output_directory, 'transcode_journal.json'),
+                max_concurrency=config.get('TRANSCODE_MAX_CONCURRENCY', 1),
+                nice=config.get('TRANSCODE_NICE', 10),
+                preset=self.video_h264_preset)
+
+        # Compressed frames from before the detection, written at the start of the video
+        self.pre_roll = None
+        if self.save_detection_video and self.video_backend != 'pipeline' and config.get('PRE_ROLL_SECONDS', 0) > 0:
+            self.pre_roll = PreRollBuffer(config)
         
         # Application reference
         self.app = None
         
         # For saving frames
         self.save_frame = None
+        self._frame_source = None  # (buffer, format, width, height) of the current probe
         self.current_frame = None
+        self.frames_materialized = 0  # Frames extracted from the buffer because something used them
+        self.frames_skipped = 0  # Frames never accessed, so never extracted
         self.detection_frame = None
         self.active_timestamp = None
         self.initial_max_confidence = 0.0
@@ -102,6 +131,32 @@ class WatcherBase(app_callback_class):
         # Add a field to store all detections for subclasses to use
         self.all_detections = []
 
+    @property
+    def current_frame(self):
+        """The current BGR frame, extracted from the probe's buffer the first time it is accessed."""
+        if self._frame_source is not None:
+            buffer, format, width, height = self._frame_source
+            self._frame_source = None
+            self._current_frame = get_converted_frame_from_buffer(buffer, format, width, height)
+            self.frames_materialized += 1
+        return self._current_frame
+
+    @current_frame.setter
+    def current_frame(self, frame):
+        self._frame_source = None
+        self._current_frame = frame
+
+    def set_frame_source(self, buffer, format, width, height):
+        """Make the buffer of the current probe the source of current_frame without extracting it yet."""
+        self._current_frame = None
+        self._frame_source = (buffer, format, width, height)
+
+    def release_frame_source(self):
+        """Drop the buffer reference at the end of the probe; the buffer is not valid after it."""
+        if self._frame_source is not None:
+            self.frames_skipped += 1
+            self._frame_source = None
+
     def create_speech_files(self):
         tts = gtts.gTTS(f"Its a {self.class_to_track.upper()}")
         tts.save(CLASS_ALERT)
@@ -110,23 +165,44 @@ class WatcherBase(app_callback_class):
         """Handle end of stream."""
         if self.is_active_tracking:
             self.stop_active_tracking()
+        self.logger.info(f"Frames materialized: {self.frames_materialized}, skipped: {self.frames_skipped}")
+        if self.pre_roll is not None:
+            self.pre_roll.log_stats()
+        if self.transcode_queue is not None:
+            # Finish the conversions before the app exits; any left are resumed from the journal on the next start
+            self.transcode_queue.log_stats()
+            if not self.transcode_queue.drain(self.transcode_drain_seconds):
+                self.logger.warning("Video conversions still pending at exit, they will be resumed on the next start")
 
     def start_video_recording(self, width, height, video_filename, format, fps):
         """Start recording video."""
         self.video_filename = video_filename.replace('.mp4', '.m4v')  # Use .m4v extension initially
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Ensure the codec is set for MP4 format
-        self.video_writer = cv2.VideoWriter(self.video_filename, fourcc, fps, (width, height))
         self.video_frame_count = 0  # Reset frame count at start
         self.video_start_time = datetime.datetime.now()  # Record start time
+        if self.recording_branch is not None:
+            # Recorded by the pipeline itself, no frames go through Python; refused while the last file is closing
+            self.recording_branch.start(self.video_filename)
+            return
+        writer = create_video_writer(self.video_backend, self.video_filename, fps, (width, height), self.video_h264_preset)
+        self.video_writer = ThreadedVideoWriter(writer, self.video_queue_size, self.video_drop_policy)
 
     def write_video_frame(self, frame):
         """Write a frame to the video."""
         if self.video_writer is not None and self.current_frame is not None:
             self.video_writer.write(frame)
 
+    def write_pre_roll(self):
+        """Write the buffered pre-roll frames at the start of the video that was just started."""
+        if self.pre_roll is None or self.video_writer is None:
+            return
+        stats = self.pre_roll.get_stats()
+        # Queued as a single entry, so the frames are decoded on the writer thread
+        self.video_writer.write_batch(self.pre_roll.drain())
+        self.logger.info(f"Pre-roll: queued {stats['frames']} frames ({stats['seconds']:.1f} s)")
+
     def draw_detection_boxes(self, detections, width, height):
         """Draw bounding boxes around detections."""
-        if self.current_frame is not None and self.show_detection_boxes:
+        if self.show_detection_boxes and self.current_frame is not None:
             for detection in detections:
                 bbox = detection.get_bbox()
                 cv2.rectangle(self.current_frame, 
@@ -134,41 +210,26 @@ class WatcherBase(app_callback_class):
                               (int(bbox.xmax() * width), int(bbox.ymax() * height)), 
                               (0, 0, 255), 1)
 
-    def stop_video_recording(self, final_filename):
-        """Stop recording video and save it."""
-        if self.video_writer is not None:
+    def stop_video_recording(self, final_filename, delete=False):
+        """Stop recording video and save it. With delete, a recording branch discards the file instead."""
+        if self.recording_branch is not None:
+            # The branch records H.264 already; it renames the file (or deletes it) once the file is closed
+            self.recording_branch.stop(None if delete else final_filename.replace('.m4v', '.mp4'))
+        elif self.video_writer is not None:
+            # Writes out the frames still queued, so the file is complete before the rename
             self.video_writer.release()
             self.video_writer = None
+            if self.video_backend == 'gstreamer':
+                # Already a faststart H.264 MP4, no conversion needed
+                final_filename = final_filename.replace('.m4v', '.mp4')
             os.rename(self.video_filename, final_filename)
             self.logger.info(f"Video saved as {final_filename}")
 
     def convert_video_to_h264(self, video_path):
-        """Convert video to H264 format using ffmpeg."""
-        try:
-            temp_path = video_path + ".temp.mp4"
-            final_path = video_path.replace('.m4v', '.mp4')  # Final path with .mp4 extension
-            
-            subprocess.run([
-                'ffmpeg',
-                '-y',  # Overwrite output file if it exists
-                '-i', video_path,  # Input is .m4v
-                '-codec:v', 'libx264',  # Use H264 codec
-                '-preset', 'fast',  # Use fast preset for speed
-                '-movflags', 'faststart',  # Optimize for web playback
-                temp_path
-            ], check=True, capture_output=True)
-            
-            # Replace original .m4v file with converted .mp4 file
-            os.replace(temp_path, final_path)
-            # Remove the original .m4v file
-            os.remove(video_path)
-            self.logger.info(f"Successfully converted {video_path} to H264 and saved as {final_path}")
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"Failed to convert video {video_path} to H264: {e}")
-            # Clean up temp file if it exists
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-     
+        """Queue the conversion of the video to H264 format; it is renamed to .mp4 when done."""
+        if self.transcode_queue is not None and os.path.exists(video_path):
+            self.transcode_queue.submit(video_path)
+
     def get_average_detection_instance_count(self):
         """Calculate the average detection instance count."""
         if not self.detection_counts:
@@ -195,7 +256,7 @@ class WatcherBase(app_callback_class):
         self.active_timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
 
         # Draw detection boxes on the frame if SHOW_DETECTION_BOXES is True
-        if self.current_frame is not None and self.show_detection_boxes:
+        if self.show_detection_boxes and self.current_frame is not None:
             self.draw_detection_boxes(class_detections, self.width, self.height)
 
         # Ensure output directory exists
@@ -207,9 +268,15 @@ class WatcherBase(app_callback_class):
         self.video_truncated = False
 
         # Start recording video if SAVE_DETECTION_VIDEO and self.video_writer is None and frame is not None:
-        if self.save_detection_video and self.video_writer is None and self.current_frame is not None:
+        # (the recording branch needs no frame)
+        if self.recording_branch is not None:
+            can_record = not self.recording_branch.is_recording
+        else:
+            can_record = self.video_writer is None and self.current_frame is not None
+        if self.save_detection_video and can_record:
             video_filename = f"{output_dir}/{self.active_timestamp}_{self.class_to_track}.mp4"
             self.start_video_recording(self.width, self.height, video_filename, self.format, self.frame_rate)
+            self.write_pre_roll()
 
         self.logger.info(f"{self.class_to_track.upper()} DETECTED {self.start_centroid} at: {datetime.datetime.now()}")
 
@@ -235,7 +302,7 @@ class WatcherBase(app_callback_class):
                 self.save_frame = self.current_frame
 
         # If a frame is available, write the frame to the video
-        if self.current_frame is not None and self.video_writer is not None and self.video_start_time:
+        if self.video_writer is not None and self.video_start_time and self.current_frame is not None:
             elapsed = (datetime.datetime.now() - self.video_start_time).total_seconds()
             if elapsed < self.max_video_seconds:
                 self.write_video_frame(self.current_frame)
@@ -243,6 +310,12 @@ class WatcherBase(app_callback_class):
                 if not self.video_truncated:
                     self.logger.info(f"Video truncated after {self.max_video_seconds} seconds.")
                     self.video_truncated = True
+        elif self.recording_branch is not None and self.recording_branch.is_recording and self.video_start_time:
+            elapsed = (datetime.datetime.now() - self.video_start_time).total_seconds()
+            if elapsed >= self.max_video_seconds and not self.video_truncated:
+                self.recording_branch.truncate()
+                self.logger.info(f"Video truncated after {self.max_video_seconds} seconds.")
+                self.video_truncated = True
 
         # Update moving average of velocity
         if self.object_centroid is not None and self.previous_centroid is not None:
@@ -296,7 +369,7 @@ class WatcherBase(app_callback_class):
 
         # Stop any video recording
         final_video_filename = f"{output_dir}/{root_filename}.m4v"  # Use .m4v extension
-        self.stop_video_recording(final_video_filename)
+        self.stop_video_recording(final_video_filename, delete=abort)
 
         # If aborting, delete the video file and skip the rest of the process
         if abort:
@@ -317,12 +390,9 @@ class WatcherBase(app_callback_class):
                 os.remove(self.image_filename)
                 self.logger.info(f"Deleted image file: {self.image_filename}")
         else:
-            # Convert video to H264 in background thread - will rename to .mp4
-            threading.Thread(
-                target=self.convert_video_to_h264,
-                args=(final_video_filename,),
-                daemon=True
-            ).start()
+            # The opencv backend records mp4v: queue the conversion to H264 - will rename to .mp4
+            if self.video_backend == 'opencv':
+                self.convert_video_to_h264(final_video_filename)
 
             # Save the frame with the most instances if SAVE_DETECTION_IMAGES is True
             if self.save_frame is not None and self.save_detection_images:
@@ -393,10 +463,10 @@ def watcher_base_callback(pad, info, user_data):
     # Get the caps from the pad
     user_data.format, user_data.width, user_data.height = get_caps_from_pad(pad)
     
-    # If the user_data.use_frame is set to True, we can get the video frame from the buffer
+    # If the user_data.use_frame is set to True, the video frame is extracted from the buffer
+    # only if something accesses user_data.current_frame during this probe
     if user_data.use_frame and user_data.format is not None and user_data.width is not None and user_data.height is not None:
-        user_data.current_frame = get_numpy_from_buffer(buffer, user_data.format, user_data.width, user_data.height)
-        user_data.current_frame = cv2.cvtColor(user_data.current_frame, cv2.COLOR_RGB2BGR)
+        user_data.set_frame_source(buffer, user_data.format, user_data.width, user_data.height)
     
     # Get the detections from the buffer
     roi = hailo.get_roi_from_buffer(buffer)
@@ -439,5 +509,10 @@ def watcher_base_callback(pad, info, user_data):
     # Active tracking
     if user_data.is_active_tracking:
         user_data.active_tracking(class_detections)
+    elif user_data.pre_roll is not None and user_data.current_frame is not None:
+        # Keep the recent frames for the start of the next video
+        timestamp = buffer.pts / Gst.SECOND if buffer.pts != Gst.CLOCK_TIME_NONE else None
+        user_data.pre_roll.add(user_data.current_frame, timestamp)
 
+    user_data.release_frame_source()
     return Gst.PadProbeReturn.OK
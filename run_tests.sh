@@ -23,6 +23,8 @@ pytest --log-cli-level=INFO \
        "$TESTS_DIR/test_hailo_rpi5_examples.py" \
        "$TESTS_DIR/test_edge_cases.py" \
        "$TESTS_DIR/test_advanced.py" \
-       "$TESTS_DIR/test_infra.py"
+       "$TESTS_DIR/test_infra.py" \
+       "$TESTS_DIR/test_performance.py" \
+       "$TESTS_DIR/test_watcher.py"
 
 echo "All tests completed."
@@ -0,0 +1,607 @@
+# tests/test_performance.py
+import os
+import sys
+import time
+import pickle
+import multiprocessing
+import pytest
+import numpy as np
+import cv2
+
+# The basic_pipelines modules import each other by module name, so add the directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'basic_pipelines'))
+from hailo_rpi_common import (
+    DISPLAY_PIPELINE,
+    FILE_DECODER,
+    FrameBufferPool,
+    INFERENCE_PIPELINE,
+    NULL_INFERENCE_PIPELINE,
+    NullDetectionInjector,
+    QUEUE,
+    ROUND_ROBIN_PIPELINE,
+    SCALE_CONVERT,
+    SOURCE_ELEMENT,
+    SOURCE_PIPELINE,
+    STREAM_ROUTER_PIPELINE,
+    SharedFrameRing,
+    USER_CALLBACK_PIPELINE,
+    app_callback_class,
+    create_stream_user_data,
+    get_converted_frame_from_buffer,
+    get_default_parser,
+    get_numpy_from_buffer,
+    get_source_elements,
+    get_video_conversions,
+    mapped_frame,
+    select_file_decoder,
+    set_queue_profile,
+)
+from pipeline_profiling import (
+    CallbackProfiler,
+    PipelineBenchmark,
+    PipelineLatencyTracer,
+    QueueMonitor,
+    RollingStats,
+)
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+Gst.init(None)
+
+BENCHMARK_RESOLUTIONS = [(640, 640), (1536, 864)]
+BENCHMARK_ITERATIONS = 200
+
+class MockMapInfo:
+    def __init__(self, data):
+        self.data = data
+
+class MockBuffer:
+    """Stands in for a GstBuffer; map() returns the raw frame bytes."""
+    def __init__(self, data):
+        self.data = data
+        self.mapped = 0
+
+    def map(self, flags):
+        self.mapped += 1
+        return True, MockMapInfo(self.data)
+
+    def unmap(self, map_info):
+        self.mapped -= 1
+
+def make_rgb_buffer(width, height):
+    frame = np.random.randint(0, 255, size=(height, width, 3), dtype=np.uint8)
+    return frame, MockBuffer(frame.tobytes())
+
+def time_per_frame(func, iterations=BENCHMARK_ITERATIONS):
+    """Return the mean wall time of func() in milliseconds."""
+    func()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) * 1000 / iterations
+
+def test_mapped_frame_view():
+    """Test that mapped_frame yields a read-only view and unmaps on exit."""
+    frame, buffer = make_rgb_buffer(4, 2)
+    with mapped_frame(buffer, 'RGB', 4, 2) as view:
+        assert buffer.mapped == 1
+        assert not view.flags.writeable
+        assert not view.flags.owndata
+        np.testing.assert_array_equal(view, frame)
+    assert buffer.mapped == 0
+
+    with mapped_frame(buffer, 'RGB', 4, 2, copy=True) as owned:
+        assert owned.flags.writeable
+    np.testing.assert_array_equal(owned, frame)
+
+    with pytest.raises(ValueError, match="Unsupported format"):
+        with mapped_frame(buffer, 'UNSUPPORTED', 4, 2):
+            pass
+    assert buffer.mapped == 0
+
+@pytest.mark.performance
+@pytest.mark.parametrize("width,height", BENCHMARK_RESOLUTIONS)
+def test_benchmark_copy_vs_view(width, height):
+    """Compare the per-frame cost of get_numpy_from_buffer (copy) against mapped_frame (view)."""
+    _, buffer = make_rgb_buffer(width, height)
+
+    def copy_frame():
+        frame = get_numpy_from_buffer(buffer, 'RGB', width, height)
+        return frame[0, 0]
+
+    def view_frame():
+        with mapped_frame(buffer, 'RGB', width, height) as frame:
+            return frame[0, 0]
+
+    copy_ms = time_per_frame(copy_frame)
+    view_ms = time_per_frame(view_frame)
+    print(f"{width}x{height} RGB: copy {copy_ms:.3f} ms/frame, view {view_ms:.3f} ms/frame")
+
+    # The view reads the mapped memory in place, the copy does not
+    mapped_data = np.frombuffer(buffer.data, dtype=np.uint8)
+    with mapped_frame(buffer, 'RGB', width, height) as view:
+        assert np.shares_memory(view, mapped_data)
+    assert not np.shares_memory(get_numpy_from_buffer(buffer, 'RGB', width, height), mapped_data)
+
+def test_frame_buffer_pool_release():
+    """Test that released frames are recycled and the counters are updated."""
+    pool = FrameBufferPool(max_free=1)
+    frame, buffer = make_rgb_buffer(4, 2)
+
+    first = get_numpy_from_buffer(buffer, 'RGB', 4, 2, pool=pool)
+    np.testing.assert_array_equal(first, frame)
+    pool.release(first)
+    second = get_numpy_from_buffer(buffer, 'RGB', 4, 2, pool=pool)
+    assert second is first
+    third = pool.acquire('RGB', 4, 2)
+    assert third is not second
+    assert pool.stats() == {'hits': 1, 'misses': 2, 'size': 2, 'peak_size': 2}
+
+    # Only max_free frames are kept for reuse
+    pool.release(second)
+    pool.release(third)
+    assert pool.stats()['size'] == 1
+
+    nv12 = pool.acquire('NV12', 4, 2)
+    assert nv12[0].shape == (2, 4) and nv12[1].shape == (1, 2, 2)
+    with pytest.raises(ValueError):
+        pool.release(np.empty((2, 4, 3), dtype=np.uint8))
+
+def test_frame_buffer_pool_ring():
+    """Test that ring mode cycles through a fixed set of frames."""
+    pool = FrameBufferPool(ring_size=2)
+    frames = [pool.acquire('RGB', 4, 2) for _ in range(4)]
+    assert frames[0] is frames[2] and frames[1] is frames[3]
+    assert frames[0] is not frames[1]
+    assert pool.stats() == {'hits': 2, 'misses': 2, 'size': 2, 'peak_size': 2}
+
+@pytest.mark.performance
+@pytest.mark.parametrize("width,height", BENCHMARK_RESOLUTIONS)
+def test_benchmark_pooled_copy(width, height):
+    """Compare copying into a new array per frame against copying into a pooled array."""
+    _, buffer = make_rgb_buffer(width, height)
+    pool = FrameBufferPool(ring_size=2)
+
+    alloc_ms = time_per_frame(lambda: get_numpy_from_buffer(buffer, 'RGB', width, height))
+    pooled_ms = time_per_frame(lambda: get_numpy_from_buffer(buffer, 'RGB', width, height, pool=pool))
+    print(f"{width}x{height} RGB: new array {alloc_ms:.3f} ms/frame, pooled {pooled_ms:.3f} ms/frame, pool {pool.stats()}")
+    assert pool.stats()['peak_size'] == 2
+
+def test_get_converted_frame_from_buffer():
+    """Test the single-pass RGB to BGR conversion."""
+    frame, buffer = make_rgb_buffer(4, 2)
+    bgr = get_converted_frame_from_buffer(buffer, 'RGB', 4, 2)
+    np.testing.assert_array_equal(bgr, frame[:, :, ::-1])
+    assert buffer.mapped == 0
+
+    pool = FrameBufferPool(ring_size=1)
+    pooled = get_converted_frame_from_buffer(buffer, 'RGB', 4, 2, pool=pool)
+    assert pooled is pool.acquire('BGR', 4, 2)
+    np.testing.assert_array_equal(pooled, frame[:, :, ::-1])
+
+    with pytest.raises(ValueError, match="Unsupported conversion"):
+        get_converted_frame_from_buffer(buffer, 'RGB', 4, 2, output_format='GRAY8')
+
+@pytest.mark.parametrize("format,code", [
+    ('NV12', cv2.COLOR_BGR2YUV_YV12),
+    ('I420', cv2.COLOR_BGR2YUV_I420),
+])
+def test_planar_yuv_to_bgr(format, code):
+    """Test the direct conversion of planar YUV buffers against the original BGR frame."""
+    width, height = 8, 4
+    # One color per 2x2 block, so the 4:2:0 chroma subsampling loses nothing and a swapped U/V shows
+    blocks = np.random.randint(0, 255, size=(height // 2, width // 2, 3), dtype=np.uint8)
+    bgr = blocks.repeat(2, axis=0).repeat(2, axis=1)
+    yuv = cv2.cvtColor(bgr, code)
+    if format == 'NV12':
+        # Interleave the YV12 chroma planes (V then U) into the NV12 UV plane
+        y, v, u = yuv[:height], yuv[height:height * 5 // 4].reshape(-1), yuv[height * 5 // 4:].reshape(-1)
+        yuv = np.concatenate([y.reshape(-1), np.stack([u, v], axis=1).reshape(-1)])
+    buffer = MockBuffer(yuv.tobytes())
+
+    result = get_converted_frame_from_buffer(buffer, format, width, height)
+    assert result.shape == bgr.shape
+    # Only the YUV rounding is lost
+    assert np.abs(result.astype(int) - bgr).max() <= 8
+    planes = get_numpy_from_buffer(buffer, format, width, height)
+    assert planes[0].shape == (height, width)
+    assert buffer.mapped == 0
+
+def test_yuy2_to_bgr():
+    """Test the direct conversion of packed YUY2 buffers."""
+    width, height = 8, 4
+    yuy2 = np.random.randint(0, 255, size=(height, width, 2), dtype=np.uint8)
+    buffer = MockBuffer(yuy2.tobytes())
+    expected = cv2.cvtColor(yuy2, cv2.COLOR_YUV2BGR_YUYV)
+    np.testing.assert_array_equal(get_converted_frame_from_buffer(buffer, 'YUY2', width, height), expected)
+
+@pytest.mark.performance
+@pytest.mark.parametrize("width,height", BENCHMARK_RESOLUTIONS)
+def test_benchmark_rgb_to_bgr(width, height):
+    """Compare copy-then-convert against the fused conversion from the mapped buffer."""
+    frame, buffer = make_rgb_buffer(width, height)
+    pool = FrameBufferPool(ring_size=2)
+
+    def copy_then_convert():
+        return cv2.cvtColor(get_numpy_from_buffer(buffer, 'RGB', width, height), cv2.COLOR_RGB2BGR)
+
+    two_pass_ms = time_per_frame(copy_then_convert)
+    fused_ms = time_per_frame(lambda: get_converted_frame_from_buffer(buffer, 'RGB', width, height))
+    pooled_ms = time_per_frame(lambda: get_converted_frame_from_buffer(buffer, 'RGB', width, height, pool=pool))
+    print(f"{width}x{height} RGB->BGR: copy+convert {two_pass_ms:.3f} ms/frame, "
+          f"fused {fused_ms:.3f} ms/frame, fused into pool {pooled_ms:.3f} ms/frame")
+    expected = copy_then_convert()
+    assert np.array_equal(expected, frame[:, :, ::-1])
+    assert np.array_equal(get_converted_frame_from_buffer(buffer, 'RGB', width, height), expected)
+    assert np.array_equal(get_converted_frame_from_buffer(buffer, 'RGB', width, height, pool=pool), expected)
+
+def test_shared_frame_ring():
+    """Test that frames pass through the ring in order and overflow drops the new frame."""
+    ring = SharedFrameRing(num_slots=2, slot_bytes=4 * 2 * 3)
+    frames = [np.full((2, 4, 3), i, dtype=np.uint8) for i in range(3)]
+    assert ring.get() is None
+    assert ring.put(frames[0])
+    assert ring.put(frames[1])
+    assert not ring.put(frames[2])
+    np.testing.assert_array_equal(ring.get(), frames[0])
+    np.testing.assert_array_equal(ring.get(), frames[1])
+    assert ring.get() is None
+    assert ring.stats() == {'written': 2, 'read': 2, 'pending': 0, 'dropped': 1, 'coalesced': 0}
+
+    # Frames of different shapes share the slots
+    gray = np.arange(8, dtype=np.uint8).reshape(2, 4)
+    ring.put(gray)
+    np.testing.assert_array_equal(ring.get(), gray)
+
+    with pytest.raises(ValueError):
+        ring.put(np.zeros((4, 4, 3), dtype=np.uint8))
+
+def test_shared_frame_ring_latest_only():
+    """Test that latest-frame-wins mode overwrites the oldest pending frame."""
+    ring = SharedFrameRing(num_slots=2, slot_bytes=4 * 2 * 3, latest_only=True)
+    frames = [np.full((2, 4, 3), i, dtype=np.uint8) for i in range(3)]
+    for frame in frames:
+        assert ring.put(frame)
+    np.testing.assert_array_equal(ring.get(), frames[1])
+    np.testing.assert_array_equal(ring.get(), frames[2])
+    assert ring.dropped == 1
+
+def test_shared_frame_ring_blocking_get():
+    """Test that get() waits for a frame from another process and coalesces to the newest one."""
+    ring = SharedFrameRing(num_slots=3, slot_bytes=4 * 2 * 3)
+    frames = [np.full((2, 4, 3), i, dtype=np.uint8) for i in range(3)]
+
+    start = time.monotonic()
+    assert ring.get(timeout=0.05) is None
+    assert time.monotonic() - start >= 0.04
+
+    producer = multiprocessing.Process(target=ring.put, args=(frames[0],))
+    producer.start()
+    np.testing.assert_array_equal(ring.get(timeout=5), frames[0])
+    producer.join()
+
+    for frame in frames:
+        ring.put(frame)
+    np.testing.assert_array_equal(ring.get(latest=True), frames[2])
+    assert ring.get() is None
+    assert ring.stats()['coalesced'] == 2
+
+@pytest.mark.performance
+@pytest.mark.parametrize("width,height", BENCHMARK_RESOLUTIONS)
+def test_benchmark_frame_transport(width, height):
+    """Compare the producer-side cost of pickling a frame (multiprocessing.Queue) against a ring put."""
+    frame, _ = make_rgb_buffer(width, height)
+    ring = SharedFrameRing(num_slots=3, latest_only=True)
+
+    pickle_ms = time_per_frame(lambda: pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL))
+    ring_ms = time_per_frame(lambda: ring.put(frame))
+    print(f"{width}x{height} RGB: pickle {pickle_ms:.3f} ms/frame, shared ring put {ring_ms:.3f} ms/frame")
+
+def run_test_pipeline(pipeline_string, attach=None):
+    """Run a pipeline to end-of-stream; attach(pipeline) is called before it starts."""
+    pipeline = Gst.parse_launch(pipeline_string)
+    if attach is not None:
+        attach(pipeline)
+    pipeline.set_state(Gst.State.PLAYING)
+    message = pipeline.get_bus().timed_pop_filtered(30 * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    assert message is not None and message.type == Gst.MessageType.EOS, "Test pipeline did not reach end-of-stream"
+    return pipeline
+
+def test_rolling_stats():
+    """Test the rolling percentiles."""
+    stats = RollingStats(window=100)
+    assert stats.percentile(50) is None
+    for value in range(1, 201):
+        stats.add(value)
+    summary = stats.summary()
+    assert summary['count'] == 200
+    assert summary['p50'] == 150 or summary['p50'] == 151
+    assert summary['p99'] == 199 or summary['p99'] == 200
+
+def test_latency_tracer_pipeline():
+    """Trace a videotestsrc pipeline with stand-in stages."""
+    tracers = []
+
+    def attach(pipeline):
+        tracer = PipelineLatencyTracer(pipeline)
+        assert tracer.attach() == 4
+        tracers.append(tracer)
+
+    run_test_pipeline(
+        'videotestsrc name=source num-buffers=60 ! video/x-raw, width=320, height=240 ! '
+        'queue name=source_scale_q ! videoconvert ! queue name=inference_hailonet_q ! '
+        'identity name=identity_callback sleep-time=2000 ! fakesink sync=false',
+        attach)
+    stats = tracers[0].get_stats()
+    assert set(stats) == {'source', 'source_scale_q', 'inference_hailonet_q', 'identity_callback'}
+    assert list(stats)[-1] == 'identity_callback'
+    assert stats['identity_callback']['count'] == 60
+    assert stats['identity_callback']['p50'] >= stats['inference_hailonet_q']['p50']
+    print(tracers[0].format_stats())
+
+def test_queue_monitor_bottleneck():
+    """Test the bottleneck detection on synthetic occupancy stats."""
+    full = {'full': 1.0, 'empty': 0.0}
+    empty = {'full': 0.0, 'empty': 1.0}
+    monitor = QueueMonitor(pipeline=None)
+    stats = {'source_scale_q': full, 'inference_hailonet_q': full, 'hailo_display_q': empty}
+    assert monitor.find_bottleneck(stats) == 'inference_hailonet_q'
+    assert monitor.find_bottleneck({'a': empty, 'b': empty}) is None
+    assert monitor.find_bottleneck({'a': empty, 'b': full}) == 'b'
+
+def test_queue_monitor_pipeline():
+    """Monitor a videotestsrc pipeline whose last stage is slow."""
+    monitors = []
+
+    def attach(pipeline):
+        monitor = QueueMonitor(pipeline, interval=0.02)
+        assert monitor.start() == 2
+        monitors.append(monitor)
+
+    run_test_pipeline(
+        'videotestsrc num-buffers=100 ! video/x-raw, width=320, height=240 ! '
+        'queue name=source_scale_q max-size-buffers=3 ! videoconvert ! queue name=inference_hailonet_q max-size-buffers=3 ! '
+        'identity sleep-time=20000 ! fakesink sync=false',
+        attach)
+    monitor = monitors[0]
+    monitor.stop()
+    assert list(monitor.get_stats()) == ['source_scale_q', 'inference_hailonet_q']
+    assert monitor.find_bottleneck() == 'inference_hailonet_q'
+    print(monitor.format_summary())
+
+def test_callback_profiler(tmp_path):
+    """Test that the profiler times every call, counts overruns and profiles every Nth call."""
+    def callback(pad, info, user_data):
+        user_data.append(info)
+        if info % 2:
+            time.sleep(0.03)
+        return 'ok'
+
+    calls = []
+    profiler = CallbackProfiler(callback, fps=50, profile_every=2)
+    for i in range(6):
+        assert profiler(None, i, calls) == 'ok'
+    assert calls == list(range(6))
+
+    stats = profiler.get_stats()
+    assert stats['count'] == 6
+    assert stats['overruns'] == 3
+    assert stats['p99'] >= 30
+    assert profiler.profiled_calls == 3
+    assert profiler.write_profile(str(tmp_path / "callback.prof"))
+    assert (tmp_path / "callback.prof").exists()
+
+def test_source_element():
+    """Test that the swappable source chain is the head of SOURCE_PIPELINE."""
+    for video_source in ('/tmp/video.mp4', '/dev/video0', 'rpi'):
+        source_element = SOURCE_ELEMENT(video_source)
+        assert SOURCE_PIPELINE(video_source).startswith(source_element)
+        assert 'name=source ' in source_element
+        assert not source_element.strip().endswith('!')
+
+def test_get_source_elements_pipeline():
+    """Test that the source chain is found by walking upstream from the scale queue."""
+    pipeline = Gst.parse_launch(
+        'videotestsrc name=source num-buffers=1 ! video/x-raw, width=64, height=48 ! '
+        'queue name=source_scale_q ! fakesink')
+    names = [element.get_name() for element in get_source_elements(pipeline)]
+    assert len(names) == 2
+    assert names[-1] == 'source'
+    assert get_source_elements(Gst.parse_launch('videotestsrc ! fakesink')) == []
+
+def test_null_detection_boxes():
+    """Test that the synthetic detections stay inside the frame and move between frames."""
+    injector = NullDetectionInjector(num_detections=4)
+    for frame_index in (0, 1, 100, 10000):
+        boxes = injector.make_boxes(frame_index)
+        assert len(boxes) == 4
+        for xmin, ymin, width, height in boxes:
+            assert 0 <= xmin and xmin + width <= 1
+            assert 0 <= ymin and ymin + height <= 1
+    assert injector.make_boxes(0) != injector.make_boxes(1)
+
+def test_null_inference_pipeline():
+    """Test that the null inference stage passes the frames through."""
+    pipeline_string = (
+        'videotestsrc num-buffers=30 ! video/x-raw, format=RGB, width=320, height=240 ! '
+        f'{NULL_INFERENCE_PIPELINE()} ! fakesink'
+    )
+    frames = []
+    def count_frame(pad, info):
+        frames.append(info.get_buffer().pts)
+        return Gst.PadProbeReturn.OK
+    def attach(pipeline):
+        pipeline.get_by_name('inference_null').get_static_pad('src').add_probe(Gst.PadProbeType.BUFFER, count_frame)
+    run_test_pipeline(pipeline_string, attach)
+    assert len(frames) == 30
+
+def test_pipeline_benchmark_report():
+    """Test the benchmark report fields."""
+    benchmark = PipelineBenchmark()
+    benchmark.start()
+    time.sleep(0.05)
+    report = benchmark.report(10, {'mean': 1.0, 'p99': 2.0})
+    assert report['frames'] == 10
+    assert 0 < report['fps'] <= 200
+    assert report['cpu_percent'] >= 0
+    assert 'callback mean 1.00 ms' in PipelineBenchmark.format_report(report)
+
+def test_queue_profiles():
+    """Test that the selected queue profile is applied by QUEUE() and the builders."""
+    try:
+        set_queue_profile('live-low-latency')
+        assert 'max-size-buffers=1 ' in QUEUE('q')
+        assert 'max-size-buffers=5 ' in QUEUE('q', max_size_buffers=5)
+        source_pipeline = SOURCE_PIPELINE('/tmp/video.mp4')
+        assert 'name=source_scale_q leaky=downstream' in source_pipeline
+        # The compressed stream must never leak
+        assert 'name=source_queue_dec leaky=no' in source_pipeline
+        set_queue_profile('throughput')
+        assert 'max-size-buffers=10 ' in QUEUE('q')
+        with pytest.raises(ValueError):
+            set_queue_profile('unknown')
+    finally:
+        set_queue_profile('default')
+    assert 'leaky=no max-size-buffers=3 ' in QUEUE('q')
+
+def test_headless_display():
+    """Test that the headless display keeps the fps sink and drops the overlay and conversion."""
+    display_pipeline = DISPLAY_PIPELINE(sync='false', headless=True)
+    assert 'fpsdisplaysink name=hailo_display video-sink=fakesink' in display_pipeline
+    assert 'signal-fps-measurements=true' in display_pipeline
+    assert 'hailooverlay' not in display_pipeline
+    assert 'videoconvert' not in display_pipeline
+
+@pytest.mark.performance
+def test_benchmark_headless_display_pipeline():
+    """Compare the CPU time of the display branch with and without --headless."""
+    if Gst.ElementFactory.find('hailooverlay') is None:
+        pytest.skip("hailooverlay is not installed")
+    source = 'videotestsrc num-buffers=300 ! video/x-raw, format=RGB, width=1280, height=720 ! '
+    cpu_seconds = {}
+    for headless in (False, True):
+        start = PipelineBenchmark.cpu_seconds()
+        run_test_pipeline(source + DISPLAY_PIPELINE(video_sink='fakesink', sync='false', headless=headless))
+        cpu_seconds[headless] = PipelineBenchmark.cpu_seconds() - start
+    print(f"Display branch CPU for 300 720p frames: {cpu_seconds[False]:.2f} s, headless {cpu_seconds[True]:.2f} s")
+
+def test_inference_fps_pipeline():
+    """Test that frames above the inference rate are dropped in the source pipeline."""
+    source_pipeline = SOURCE_PIPELINE('/tmp/video.mp4', inference_fps=10)
+    rate_pipeline = source_pipeline[source_pipeline.index('videorate'):]
+    pipeline_string = (
+        'videotestsrc num-buffers=60 ! video/x-raw, format=RGB, width=320, height=240, framerate=30/1 ! '
+        f'{QUEUE(name="source_scale_q")} ! {rate_pipeline} fakesink name=sink'
+    )
+    frames = []
+    def count_frame(pad, info):
+        frames.append(info.get_buffer().pts)
+        return Gst.PadProbeReturn.OK
+    def attach(pipeline):
+        pipeline.get_by_name('sink').get_static_pad('sink').add_probe(Gst.PadProbeType.BUFFER, count_frame)
+    run_test_pipeline(pipeline_string, attach)
+    # 2 seconds of 30 fps video at 10 fps
+    assert 19 <= len(frames) <= 21
+
+def make_test_video(path, num_buffers=120, width=1280, height=720):
+    """Encode a short H.264 MP4 test video, or skip the test if no encoder is installed."""
+    if Gst.ElementFactory.find('x264enc') is None or Gst.ElementFactory.find('mp4mux') is None:
+        pytest.skip("x264enc/mp4mux are not installed")
+    run_test_pipeline(
+        f'videotestsrc num-buffers={num_buffers} pattern=ball ! video/x-raw, width={width}, height={height}, framerate=30/1 ! '
+        f'x264enc speed-preset=ultrafast ! h264parse ! mp4mux ! filesink location={path}')
+    return str(path)
+
+def test_file_decoder_pipeline(tmp_path):
+    """Test that the decoder chain matches the file and falls back to decodebin."""
+    video = make_test_video(tmp_path / "test.mp4", num_buffers=10, width=320, height=240)
+    decoder = FILE_DECODER(select_file_decoder(video))
+    assert decoder.startswith('qtdemux name=source_demux ! h264parse ! ')
+    run_test_pipeline(f'filesrc location={video} ! {decoder} ! fakesink')
+    assert select_file_decoder(str(tmp_path / "missing.mp4")) is None
+    assert FILE_DECODER(None).startswith('decodebin')
+
+@pytest.mark.performance
+def test_benchmark_file_replay_pipeline(tmp_path):
+    """Compare the replay time of the old fixed H.264 chain with the selected decoder."""
+    video = make_test_video(tmp_path / "replay.mp4")
+    decoders = {
+        'avdec_h264 max-threads=2': 'qtdemux ! h264parse ! avdec_h264 max-threads=2 ',
+        'selected': FILE_DECODER(select_file_decoder(video)),
+    }
+    for label, decoder in decoders.items():
+        start = time.perf_counter()
+        run_test_pipeline(f'filesrc location={video} ! {decoder} ! fakesink sync=false')
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"720p H.264 replay, {label} ({decoder.strip()}): {elapsed_ms / 120:.3f} ms/frame")
+
+def test_single_conversion_pass():
+    """Test that a scaled source needs no scale/convert stage in the inference pipeline."""
+    source_pipeline = SOURCE_PIPELINE('/dev/video0', video_width=640, video_height=640, scale=True)
+    assert 'format=RGB, width=640, height=640, pixel-aspect-ratio=1/1' in source_pipeline
+    inference_pipeline = INFERENCE_PIPELINE('model.hef', 'post.so', convert=False)
+    assert inference_pipeline.startswith(QUEUE(name='inference_hailonet_q'))
+    assert 'videoconvert' not in inference_pipeline and 'videoscale' not in inference_pipeline
+
+def test_video_conversions_pipeline():
+    """Test that the conversion report tells active conversions from passthrough ones."""
+    conversions = []
+    def attach(pipeline):
+        # Read the conversions once the first buffer shows that the caps are negotiated
+        def on_first_buffer(pad, info):
+            conversions.extend(get_video_conversions(pipeline))
+            return Gst.PadProbeReturn.REMOVE
+        pipeline.get_by_name('sink').get_static_pad('sink').add_probe(Gst.PadProbeType.BUFFER, on_first_buffer)
+    run_test_pipeline(
+        'videotestsrc num-buffers=5 ! video/x-raw, format=I420, width=320, height=240 ! '
+        f'{SCALE_CONVERT("active")} ! video/x-raw, format=RGB, width=160, height=120 ! '
+        f'{SCALE_CONVERT("passthrough")} ! fakesink name=sink', attach)
+    active = {name: is_active for name, is_active, _, _ in conversions}
+    assert any(is_active for name, is_active in active.items() if name.startswith('active'))
+    assert not any(is_active for name, is_active in active.items() if name.startswith('passthrough'))
+
+def test_repeated_input_option():
+    """Test that --input can be repeated and args.input keeps the first source."""
+    parser = get_default_parser()
+    args = parser.parse_args(['--input', '/dev/video0', '-i', '/dev/video2'])
+    assert args.input == '/dev/video0'
+    assert args.inputs == ['/dev/video0', '/dev/video2']
+    args = parser.parse_args([])
+    assert args.inputs is None
+    assert args.input.endswith('detection0.mp4')
+
+def test_multi_stream_builders():
+    """Test that each input is merged into the round robin and routed back to its own branch."""
+    sources = [SOURCE_PIPELINE(f'/dev/video{index}', name=f'source_{index}') for index in range(2)]
+    merged = ROUND_ROBIN_PIPELINE(sources)
+    assert 'robin.sink_0' in merged and 'robin.sink_1' in merged
+    assert merged.endswith('hailoroundrobin name=robin mode=0 ')
+    router = STREAM_ROUTER_PIPELINE([USER_CALLBACK_PIPELINE(name=f'identity_callback_{index}') for index in range(2)])
+    assert 'src_1::input-streams="<sink_1>"' in router
+    assert 'router.src_1 ! queue name=identity_callback_1_q' in router
+
+def test_stream_user_data():
+    """Test that extra inputs get their own callback state, also when the class takes constructor arguments."""
+    class LabelledCallback(app_callback_class):
+        def __init__(self, label):
+            super().__init__()
+            self.label = label
+
+    user_data = LabelledCallback('car')
+    user_data.use_frame = True
+    user_data.inference_fps = 10
+    user_data.increment()
+    stream_data = create_stream_user_data(user_data, 1)
+    assert isinstance(stream_data, LabelledCallback) and stream_data is not user_data
+    assert stream_data.label == 'car'
+    assert (stream_data.stream_id, stream_data.frame_count, stream_data.use_frame) == (1, 0, False)
+    assert stream_data.inference_fps == 10
+    assert user_data.stream_id == 0 and user_data.frame_count == 1
+
+    stream_data = create_stream_user_data(user_data, 2, lambda: LabelledCallback('bus'))
+    assert (stream_data.label, stream_data.stream_id) == ('bus', 2)
+
+if __name__ == "__main__":
+    pytest.main(["-v", "-s", __file__])
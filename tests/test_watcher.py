@@ -0,0 +1,451 @@
+# tests/test_watcher.py
+import json
+import os
+import sys
+import threading
+import time
+import types
+import pytest
+import numpy as np
+
+# The watcher modules import each other by module name, so add the directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'community_projects', 'watcher'))
+from inference_roi import (
+    ROI_INFERENCE_PIPELINE_WRAPPER,
+    RoiDetectionRemapper,
+    get_roi_crop_geometry,
+    get_roi_letterbox_geometry,
+    parse_inference_roi,
+)
+from motion_gate import MotionGate
+from preroll_buffer import PreRollBuffer
+import recording_branch
+from recording_branch import RecordingBranch
+import transcode_queue
+from transcode_queue import TranscodeQueue
+from video_writer import H264_ENCODE_PIPELINE, ThreadedVideoWriter, create_video_writer, ffmpeg_h264_command
+
+SECOND_NS = 1000000000
+
+def test_parse_inference_roi():
+    """Test that the ROI config is validated and tiles are merged into one rectangle."""
+    assert parse_inference_roi(None) is None
+    assert parse_inference_roi([0, 0, 1, 1]) is None
+    assert parse_inference_roi([0, 0.4, 1, 0.6]) == (0, 0.4, 1, 0.6)
+    assert parse_inference_roi([[0.1, 0.5, 0.2, 0.2], [0.6, 0.4, 0.3, 0.5]]) == pytest.approx((0.1, 0.4, 0.8, 0.5))
+    with pytest.raises(ValueError):
+        parse_inference_roi([0, 0, 1])
+    with pytest.raises(ValueError):
+        parse_inference_roi([0.5, 0, 0.6, 1])
+
+def test_roi_letterbox_geometry():
+    """Test that the ROI keeps its aspect ratio and is centered in the network input."""
+    # The lower 60% of a 720p frame is scaled by half to a 640x216 crop, letterboxed with 212 rows above and below
+    (scaled_width, scaled_height), (left, right, top, bottom) = get_roi_crop_geometry((0, 0.4, 1, 0.6), 1280, 720, 640, 640)
+    assert (scaled_width, scaled_height) == (640, 360)
+    crop_size = (scaled_width - left - right, scaled_height - top - bottom)
+    assert crop_size == (640, 216)
+    assert get_roi_letterbox_geometry(crop_size, 640, 640) == ((640, 216), (0, 0, 212, 212))
+    # A tall crop gets borders on the sides instead
+    assert get_roi_letterbox_geometry((300, 600), 640, 640) == ((320, 640), (160, 160, 0, 0))
+
+    pipeline = ROI_INFERENCE_PIPELINE_WRAPPER('identity', (0, 0.4, 1, 0.6), 1280, 720)
+    assert 'video/x-raw, width=640, height=216, pixel-aspect-ratio=1/1' in pipeline
+    assert 'videobox name=inference_wrapper_roi_letterbox left=-0 right=-0 top=-212 bottom=-212' in pipeline
+
+def test_roi_detection_remap():
+    """Test that a box in the letterboxed network input maps back to its place in the frame."""
+    remapper = RoiDetectionRemapper((0, 0.4, 1, 0.6), 1280, 720, 640, 640)
+    # The top-left corner of the ROI content, below the 212 border rows
+    xmin, ymin, width, height = remapper.map_bbox(0, 212 / 640, 0.5, 108 / 640)
+    assert (xmin, ymin) == pytest.approx((0, 0.4))
+    assert (width, height) == pytest.approx((0.5, 0.3))
+    # Boxes keep their aspect ratio in pixels: a 64x64 network box is a square in the frame
+    _, _, width, height = remapper.map_bbox(0.5, 0.5, 0.1, 0.1)
+    assert width * 1280 == pytest.approx(height * 720)
+
+    # A small ROI is cropped at full resolution and letterboxed on the sides
+    remapper = RoiDetectionRemapper((0.25, 0.25, 0.25, 0.5), 1280, 720, 640, 640)
+    xmin, ymin, width, height = remapper.map_bbox(*remapper.content)
+    assert (xmin, ymin, width, height) == pytest.approx((0.25, 0.25, 0.25, 0.5), abs=1e-3)
+
+def test_motion_gate_difference():
+    """Test that only a change over enough pixels counts as motion."""
+    gate = MotionGate({'MOTION_PIXEL_THRESHOLD': 25, 'MOTION_MIN_CHANGED_FRACTION': 0.01})
+    still = np.full((90, 160), 100, dtype=np.uint8)
+    assert gate.has_motion(still)  # The first frame has nothing to compare with
+    assert not gate.has_motion(still.copy())
+    noise = still.copy()
+    noise[0, :10] = 110  # Below the pixel threshold
+    assert not gate.has_motion(noise)
+    moved = still.copy()
+    moved[40:60, 70:100] = 200
+    assert gate.has_motion(moved)
+
+def test_motion_gate_hold_and_keepalive():
+    """Test that static frames pass during the hold period and once per keepalive period."""
+    gate = MotionGate({'MOTION_HOLD_SECONDS': 1, 'MOTION_KEEPALIVE_SECONDS': 5})
+
+    def infer(motion, seconds):
+        passed = gate.should_infer(motion, int(seconds * SECOND_NS))
+        if passed:
+            gate.last_passed_ns = int(seconds * SECOND_NS)
+        return passed
+
+    assert infer(True, 0)
+    assert infer(False, 0.5)  # Held after the motion
+    assert not infer(False, 1.5)
+    assert not infer(False, 5.4)
+    assert infer(False, 5.6)  # Keepalive, 5 s after the last passed frame
+    assert not infer(False, 6)
+
+def test_motion_gate_tracking_override():
+    """Test that every frame is inferred while the watcher is tracking."""
+    user_data = types.SimpleNamespace(is_active_tracking=True)
+    gate = MotionGate({'MOTION_HOLD_SECONDS': 1, 'MOTION_KEEPALIVE_SECONDS': 5}, user_data)
+    gate.last_passed_ns = 10 * SECOND_NS
+    assert gate.should_infer(False, 11 * SECOND_NS)
+    user_data.is_active_tracking = False
+    assert not gate.should_infer(False, 11 * SECOND_NS)
+
+def make_frames(count, width=64, height=48):
+    """Frames of distinct random noise, so each one is told apart after the JPEG round trip."""
+    rng = np.random.default_rng(0)
+    return [np.repeat(rng.integers(0, 256, size=(height, width, 1), dtype=np.uint8), 3, axis=2) for _ in range(count)]
+
+def test_preroll_age_eviction():
+    """Test that frames older than PRE_ROLL_SECONDS are evicted and the rest drain oldest first."""
+    pre_roll = PreRollBuffer({'PRE_ROLL_SECONDS': 1.0, 'PRE_ROLL_JPEG_QUALITY': 95})
+    frames = make_frames(30)
+    for index, frame in enumerate(frames):
+        pre_roll.add(frame, index * 0.25)
+    stats = pre_roll.get_stats()
+    assert stats['frames'] == 5 and stats['seconds'] == 1.0
+    drained = list(pre_roll.drain())
+    assert len(drained) == 5
+    # The drained frames are the last ones added, in order
+    for frame, expected in zip(drained, frames[-5:]):
+        assert np.abs(frame.astype(int) - expected).mean() < 20
+    assert pre_roll.get_stats()['frames'] == 0
+
+def test_preroll_byte_budget():
+    """Test that the oldest frames are evicted to stay within PRE_ROLL_MAX_BYTES."""
+    pre_roll = PreRollBuffer({'PRE_ROLL_SECONDS': 100, 'PRE_ROLL_MAX_BYTES': 20000})
+    for index, frame in enumerate(make_frames(20)):
+        pre_roll.add(frame, index * 0.1)
+    stats = pre_roll.get_stats()
+    assert 0 < stats['bytes_used'] <= 20000
+    assert stats['frames'] < 20 and stats['frames_evicted'] == 20 - stats['frames']
+
+def test_preroll_timestamp_wrap():
+    """Test that frames from before a looped file input are not flushed into the next recording."""
+    pre_roll = PreRollBuffer({'PRE_ROLL_SECONDS': 1.0})
+    frames = make_frames(8)
+    for index, frame in enumerate(frames[:5]):
+        pre_roll.add(frame, 100.0 + index * 0.1)
+    # The file restarts with timestamps from 0
+    for index, frame in enumerate(frames[5:]):
+        pre_roll.add(frame, index * 0.1)
+    assert pre_roll.get_stats()['frames'] == 3
+    # Age eviction works again after the wrap
+    pre_roll.add(frames[0], 5.0)
+    assert pre_roll.get_stats()['frames'] == 1
+
+def test_h264_encode_commands():
+    """Test the ffmpeg re-encode command and the single-pass x264enc pipeline string."""
+    command = ffmpeg_h264_command('in.mp4', 'out.mp4', preset='veryfast')
+    assert command[0] == 'ffmpeg' and command[-1] == 'out.mp4'
+    assert command[command.index('-i') + 1] == 'in.mp4'
+    assert command[command.index('-preset') + 1] == 'veryfast'
+    assert command[command.index('-movflags') + 1] == 'faststart'
+    pipeline = H264_ENCODE_PIPELINE(fps=15, speed_preset='ultrafast', name='rec')
+    assert 'x264enc name=rec_encoder speed-preset=ultrafast' in pipeline
+    assert 'key-int-max=30' in pipeline
+    assert pipeline.endswith('h264parse name=rec_parse')
+
+def test_create_video_writer(tmp_path):
+    """Test the writer backend selection."""
+    writer = create_video_writer('opencv', str(tmp_path / 'video.mp4'), 30, (64, 48))
+    assert hasattr(writer, 'write') and hasattr(writer, 'release')
+    writer.release()
+    with pytest.raises(ValueError):
+        create_video_writer('ffmpeg', str(tmp_path / 'video.mp4'), 30, (64, 48))
+
+class BlockingWriter:
+    """A video writer that records the frames it is given and waits on an event before each write."""
+    def __init__(self, fail=False):
+        self.proceed = threading.Event()
+        self.fail = fail
+        self.frames = []
+        self.released = False
+
+    def write(self, frame):
+        self.proceed.wait()
+        if self.fail:
+            raise RuntimeError("encoder error")
+        self.frames.append(int(frame[0, 0, 0]))
+
+    def release(self):
+        self.released = True
+
+def fill_writer(threaded_writer, writer):
+    """Queue frame 0, wait until the writer thread holds it, then queue a batch 10..14 and frames 1..5."""
+    frame = lambda value: np.full((2, 2, 3), value, dtype=np.uint8)
+    threaded_writer.write(frame(0))
+    while threaded_writer.queue.qsize():
+        time.sleep(0.001)
+    threaded_writer.write_batch(frame(value) for value in range(10, 15))
+    results = [threaded_writer.write(frame(value)) for value in range(1, 6)]
+    writer.proceed.set()
+    threaded_writer.release()
+    return results
+
+@pytest.mark.parametrize('drop_policy, expected_frames, expected_results', [
+    # The queue holds 3 entries: the batch and two frames; the batch is never dropped
+    ('newest', [0, 10, 11, 12, 13, 14, 1, 2], [True, True, False, False, False]),
+    ('oldest', [0, 10, 11, 12, 13, 14, 4, 5], [True, True, True, True, True]),
+])
+def test_threaded_writer_drop_policies(drop_policy, expected_frames, expected_results):
+    """Test that a full queue drops single frames by the policy, and counts each dropped frame."""
+    writer = BlockingWriter()
+    threaded_writer = ThreadedVideoWriter(writer, max_queue_size=3, drop_policy=drop_policy)
+    assert fill_writer(threaded_writer, writer) == expected_results
+    assert writer.frames == expected_frames and writer.released
+    stats = threaded_writer.get_stats()
+    assert stats['frames_written'] == len(expected_frames)
+    assert stats['frames_dropped'] == 3
+
+def test_threaded_writer_block_policy():
+    """Test that the 'block' policy waits for the writer thread and loses nothing."""
+    writer = BlockingWriter()
+    threaded_writer = ThreadedVideoWriter(writer, max_queue_size=3, drop_policy='block')
+    threading.Timer(0.05, writer.proceed.set).start()
+    for value in range(8):
+        assert threaded_writer.write(np.full((2, 2, 3), value, dtype=np.uint8))
+    threaded_writer.release()
+    assert writer.frames == list(range(8))
+    assert threaded_writer.get_stats()['frames_dropped'] == 0
+    with pytest.raises(ValueError):
+        ThreadedVideoWriter(writer, drop_policy='random')
+
+def test_threaded_writer_failure():
+    """Test that a failing writer does not stop the queue from draining, so release() returns."""
+    writer = BlockingWriter(fail=True)
+    writer.proceed.set()
+    threaded_writer = ThreadedVideoWriter(writer, max_queue_size=2, drop_policy='block')
+    for value in range(6):
+        threaded_writer.write(np.full((2, 2, 3), value, dtype=np.uint8))
+    threaded_writer.write_batch(iter([np.zeros((2, 2, 3), dtype=np.uint8)]))
+    release = threading.Thread(target=threaded_writer.release)
+    release.start()
+    release.join(5)
+    assert not release.is_alive()
+    assert threaded_writer.get_stats()['frames_failed'] == 7 and writer.released
+
+class FakePad:
+    def __init__(self):
+        self.probe = None
+        self.events = []
+
+    def add_probe(self, mask, callback):
+        self.probe = callback
+
+    def get_sticky_event(self, event_type, index):
+        return None
+
+    def send_event(self, event):
+        self.events.append(event)
+
+class FakeElement:
+    def __init__(self, name):
+        self.name = name
+        self.properties = {}
+        self.pads = {}
+
+    def set_property(self, name, value):
+        self.properties[name] = value
+
+    def set_locked_state(self, locked):
+        pass
+
+    def set_state(self, state):
+        pass
+
+    def sync_state_with_parent(self):
+        pass
+
+    def get_static_pad(self, name):
+        return self.pads.setdefault(name, FakePad())
+
+class FakePipeline:
+    def __init__(self):
+        self.elements = {}
+        self.bus = types.SimpleNamespace(enable_sync_message_emission=lambda: None, connect=lambda signal, callback: None)
+
+    def get_by_name(self, name):
+        return self.elements.setdefault(name, FakeElement(name))
+
+    def get_bus(self):
+        return self.bus
+
+FAKE_GST = types.SimpleNamespace(
+    ElementFactory=types.SimpleNamespace(make=lambda factory, name: FakeElement(name)),
+    PadProbeType=types.SimpleNamespace(BUFFER=1, EVENT_DOWNSTREAM=2),
+    PadProbeReturn=types.SimpleNamespace(OK='ok', DROP='drop'),
+    State=types.SimpleNamespace(NULL='null'),
+    EventType=types.SimpleNamespace(STREAM_START=1, CAPS=2, SEGMENT=3, EOS=4),
+    Event=types.SimpleNamespace(new_eos=lambda: 'eos'),
+)
+
+@pytest.fixture
+def recording(monkeypatch):
+    """A RecordingBranch on fake elements, with the main loop callbacks collected in recording.idle."""
+    idle = []
+    monkeypatch.setattr(recording_branch, 'Gst', FAKE_GST)
+    monkeypatch.setattr(recording_branch, 'GLib', types.SimpleNamespace(idle_add=lambda callback, *args: idle.append((callback, args))))
+    pipeline = FakePipeline()
+    branch = RecordingBranch(pipeline)
+    branch.idle = idle
+    branch.encoder_pad = pipeline.get_by_name('record_convert').get_static_pad('sink')
+    return branch
+
+def run_idle(branch):
+    while branch.idle:
+        callback, args = branch.idle.pop(0)
+        callback(*args)
+
+def close_fragment(branch, location):
+    """Post the splitmuxsink message for a closed file."""
+    structure = types.SimpleNamespace(get_name=lambda: 'splitmuxsink-fragment-closed', get_string=lambda field: location)
+    branch.on_sync_message(None, types.SimpleNamespace(src=branch.sink, get_structure=lambda: structure))
+
+def test_recording_branch_record_and_rename(recording, tmp_path):
+    """Test that a recording is opened on the main loop, ended with an EOS and renamed once closed."""
+    temporary, final = tmp_path / 'recording.tmp.mp4', tmp_path / 'recording.mp4'
+    buffer_info = types.SimpleNamespace(type=FAKE_GST.PadProbeType.BUFFER)
+
+    assert recording.start(str(temporary))
+    assert not recording.start(str(temporary))
+    assert 'drop' not in recording.valve.properties and len(recording.idle) == 1
+    run_idle(recording)
+    assert recording.sink.properties['location'] == str(temporary)
+    assert recording.valve.properties['drop'] is False and recording.opened
+    assert recording.on_valve_input(None, buffer_info) == 'ok'
+
+    recording.stop(str(final))
+    assert not recording.start(str(temporary))  # The file is still being finished
+    assert recording.on_valve_input(None, buffer_info) == 'drop'
+    assert recording.encoder_pad.events == ['eos'] and recording.valve.properties['drop'] is True
+    assert not recording.wait_closed(0)
+
+    temporary.write_bytes(b'mp4')
+    close_fragment(recording, str(temporary))
+    assert recording.wait_closed(0)
+    assert final.read_bytes() == b'mp4' and not temporary.exists()
+
+def test_recording_branch_delete(recording, tmp_path):
+    """Test that a recording stopped without a final name is deleted once closed."""
+    temporary = tmp_path / 'recording.tmp.mp4'
+    recording.start(str(temporary))
+    run_idle(recording)
+    temporary.write_bytes(b'mp4')
+    close_fragment(recording, str(temporary))  # The file can close before stop() gives its name
+    assert temporary.exists() and not recording.wait_closed(0)
+    recording.stop(None)
+    assert not temporary.exists() and recording.wait_closed(0)
+
+def test_recording_branch_stop_before_open(recording, tmp_path):
+    """Test that stop() before the main loop opened the file cancels it, so the next recording can start."""
+    assert recording.start(str(tmp_path / 'first.mp4'))
+    recording.stop(str(tmp_path / 'first_final.mp4'))
+    run_idle(recording)
+    assert 'location' not in recording.sink.properties
+    assert recording.wait_closed(0) and not recording.is_recording
+    assert recording.start(str(tmp_path / 'second.mp4'))
+
+class FakeFfmpeg:
+    """Stands in for subprocess.run: writes the output file, optionally after an event or by raising."""
+    def __init__(self, error=None):
+        self.proceed = threading.Event()
+        self.proceed.set()
+        self.error = error
+        self.commands = []
+
+    def __call__(self, command, check=False, capture_output=False):
+        self.commands.append(command)
+        self.proceed.wait()
+        if self.error is not None:
+            raise self.error
+        with open(command[-1], 'wb') as output:
+            output.write(b'h264')
+
+@pytest.fixture
+def ffmpeg(monkeypatch):
+    fake_ffmpeg = FakeFfmpeg()
+    monkeypatch.setattr(transcode_queue.subprocess, 'run', fake_ffmpeg)
+    return fake_ffmpeg
+
+def make_video(tmp_path, name):
+    video_path = tmp_path / name
+    video_path.write_bytes(b'mp4v')
+    return str(video_path)
+
+def test_transcode_queue_convert(ffmpeg, tmp_path):
+    """Test that a submitted video is converted at low priority and leaves the journal."""
+    journal_path = str(tmp_path / 'journal' / 'transcode.json')
+    transcoder = TranscodeQueue(journal_path, nice=15)
+    video_path = make_video(tmp_path, 'event.m4v')
+    transcoder.submit(video_path)
+    assert transcoder.drain(5)
+    assert ffmpeg.commands[0][:3] == ['nice', '-n', '15'] and ffmpeg.commands[0][3] == 'ffmpeg'
+    assert (tmp_path / 'event.mp4').read_bytes() == b'h264' and not os.path.exists(video_path)
+    with open(journal_path) as journal:
+        assert json.load(journal) == []
+    stats = transcoder.get_stats()
+    assert stats['jobs_done'] == 1 and stats['jobs_failed'] == 0 and stats['queue_length'] == 0
+
+def test_transcode_queue_resume(ffmpeg, tmp_path):
+    """Test that the videos left in the journal are converted on start, skipping the ones that no longer exist."""
+    journal_path = str(tmp_path / 'transcode.json')
+    video_path = make_video(tmp_path, 'left.m4v')
+    with open(journal_path, 'w') as journal:
+        json.dump([video_path, str(tmp_path / 'missing.m4v')], journal)
+    transcoder = TranscodeQueue(journal_path)
+    assert transcoder.drain(5)
+    assert len(ffmpeg.commands) == 1 and (tmp_path / 'left.mp4').exists()
+    assert transcoder.get_stats()['max_queue_length'] == 1
+
+def test_transcode_queue_drain_timeout(ffmpeg, tmp_path):
+    """Test that drain() gives up after its timeout while a conversion is still running, leaving it in the journal."""
+    ffmpeg.proceed.clear()
+    journal_path = str(tmp_path / 'transcode.json')
+    transcoder = TranscodeQueue(journal_path)
+    video_path = make_video(tmp_path, 'slow.m4v')
+    transcoder.submit(video_path)
+    transcoder.submit(video_path)  # Already pending
+    assert not transcoder.drain(0.05)
+    with open(journal_path) as journal:
+        assert json.load(journal) == [video_path]
+    ffmpeg.proceed.set()
+    assert transcoder.drain(5)
+    assert len(ffmpeg.commands) == 1
+
+@pytest.mark.parametrize('error', [
+    transcode_queue.subprocess.CalledProcessError(1, 'ffmpeg'),
+    ValueError("unexpected"),
+])
+def test_transcode_queue_failure(ffmpeg, tmp_path, error):
+    """Test that a failed conversion is counted and the worker keeps converting, so drain() returns."""
+    transcoder = TranscodeQueue(str(tmp_path / 'transcode.json'))
+    ffmpeg.error = error
+    transcoder.submit(make_video(tmp_path, 'broken.m4v'))
+    assert transcoder.drain(5)
+    ffmpeg.error = None
+    transcoder.submit(make_video(tmp_path, 'next.m4v'))
+    assert transcoder.drain(5)
+    assert (tmp_path / 'next.mp4').exists() and (tmp_path / 'broken.m4v').exists()
+    stats = transcoder.get_stats()
+    assert stats['jobs_done'] == 1 and stats['jobs_failed'] == 1
+
+if __name__ == "__main__":
+    pytest.main(["-v", "-s", __file__])